@@ -5,7 +5,10 @@ Copyright (C) Microsoft Corporation
 SPDX-License-Identifier: MIT
 """
 from collections import defaultdict
-from typing import List, Dict
+from itertools import zip_longest
+from typing import List, Dict, Set, Tuple, Iterator
+
+import numpy as np
 
 from .interfaces import HTrace, CTrace, Input, EquivalenceClass, Analyser, Measurement
 from .config import CONF
@@ -39,11 +42,13 @@ class EquivalenceAnalyser(Analyser):
                           htraces: List[HTrace],
                           stats=False) -> List[EquivalenceClass]:
 
-        equivalence_classes: List[EquivalenceClass] = self._build_equivalence_classes(
-            inputs, ctraces, htraces, stats)
-
-        if self.coverage:
+        if self.coverage and CONF.coverage_type != "none":
+            # the coverage is collected over all effective classes, hence we have to build them
+            equivalence_classes: List[EquivalenceClass] = self._build_equivalence_classes(
+                inputs, ctraces, htraces, stats)
             self.coverage.analyser_hook(equivalence_classes)
+        else:
+            equivalence_classes = self._build_candidate_classes(inputs, ctraces, htraces, stats)
 
         violations: List[EquivalenceClass] = []
         for eq_cls in equivalence_classes:
@@ -61,6 +66,75 @@ class EquivalenceAnalyser(Analyser):
 
         return violations
 
+    def filter_violations_from_files(self,
+                                     ctrace_file: str,
+                                     htrace_file: str,
+                                     stats=False) -> List[EquivalenceClass]:
+        """
+        Streaming version of filter_violations. The files are read twice, in chunks:
+        the first pass finds the ctraces with more than one distinct htrace (the candidates),
+        and the second pass collects the measurements of the candidate classes.
+        Hence, the memory consumption is proportional to the number of distinct ctraces
+        and not to the size of the files
+        """
+        # first pass: for each class, remember only the first htrace
+        first_htraces: Dict[CTrace, HTrace] = {}
+        effective: Set[CTrace] = set()
+        candidates: Set[CTrace] = set()
+        for ctrace, htrace in self._read_trace_pairs(ctrace_file, htrace_file):
+            first_htrace = first_htraces.get(ctrace)
+            if first_htrace is None:
+                first_htraces[ctrace] = htrace
+                continue
+            effective.add(ctrace)
+            if first_htrace != htrace:
+                candidates.add(ctrace)
+
+        if stats:
+            STAT.eff_classes += len(effective)
+            STAT.single_entry_classes += len(first_htraces) - len(effective)
+            STAT.analysed_test_cases += 1
+        del first_htraces, effective
+
+        # second pass: build the candidate classes
+        eq_class_map: Dict[CTrace, EquivalenceClass] = defaultdict(lambda: EquivalenceClass())
+        if candidates:
+            pairs = self._read_trace_pairs(ctrace_file, htrace_file)
+            for i, (ctrace, htrace) in enumerate(pairs):
+                if ctrace in candidates:
+                    eq_cls = eq_class_map[ctrace]
+                    eq_cls.ctrace = ctrace
+                    eq_cls.measurements.append(Measurement(i, None, ctrace, htrace))
+
+        candidate_classes = sorted(eq_class_map.values(), key=lambda x: x.ctrace)
+        violations: List[EquivalenceClass] = []
+        for eq_cls in candidate_classes:
+            eq_cls.build_htrace_map()
+            if CONF.analyser_permit_subsets and \
+               self.check_if_all_subsets(list(eq_cls.htrace_map.keys())):
+                continue
+            violations.append(eq_cls)
+        return violations
+
+    TRACE_FILE_CHUNK_SIZE = 1024 * 1024  # bytes
+
+    def _read_trace_pairs(self, ctrace_file: str,
+                          htrace_file: str) -> Iterator[Tuple[CTrace, HTrace]]:
+        ctraces = self._read_traces(ctrace_file)
+        htraces = self._read_traces(htrace_file)
+        for ctrace, htrace in zip_longest(ctraces, htraces):
+            assert ctrace is not None and htrace is not None, \
+                "The number of hardware traces does not match the number of contract traces"
+            yield ctrace, htrace
+
+    def _read_traces(self, path: str) -> Iterator[int]:
+        with open(path, 'r') as f:
+            while True:
+                lines = f.readlines(self.TRACE_FILE_CHUNK_SIZE)
+                if not lines:
+                    return
+                yield from map(int, lines)
+
     @staticmethod
     def check_if_all_subsets(htraces: List[HTrace]) -> bool:
         max_htrace = max(htraces, key=bit_count)
@@ -106,3 +180,72 @@ class EquivalenceAnalyser(Analyser):
             eq_cls.build_htrace_map()
 
         return effective_classes
+
+    def _build_candidate_classes(self,
+                                 inputs: List[Input],
+                                 ctraces: List[CTrace],
+                                 htraces: List[HTrace],
+                                 stats=False) -> List[EquivalenceClass]:
+        """
+        A faster version of _build_equivalence_classes that builds only the classes
+        with more than one distinct htrace (i.e., the violation candidates).
+        The traces are grouped with NumPy, and the remaining classes are only counted
+        """
+        if not ctraces:
+            if stats:
+                STAT.analysed_test_cases += 1
+            return []
+
+        # class ID of each input
+        _, class_ids, class_sizes = np.unique(
+            self._get_trace_ids(ctraces), return_inverse=True, return_counts=True)
+        class_ids = class_ids.reshape(-1)
+        htrace_ids = self._get_trace_ids(htraces)
+
+        if stats:
+            num_effective = int(np.count_nonzero(class_sizes > 1))
+            STAT.eff_classes += num_effective
+            STAT.single_entry_classes += len(class_sizes) - num_effective
+            STAT.analysed_test_cases += 1
+
+        # count distinct htraces per class: sort by (class, htrace) and find the boundaries
+        order = np.lexsort((htrace_ids, class_ids))
+        sorted_classes = class_ids[order]
+        sorted_htraces = htrace_ids[order]
+        first_in_group = np.ones(len(order), dtype=bool)
+        first_in_group[1:] = (sorted_classes[1:] != sorted_classes[:-1]) | \
+            (sorted_htraces[1:] != sorted_htraces[:-1])
+        num_htraces = np.bincount(sorted_classes[first_in_group], minlength=len(class_sizes))
+        candidates = np.nonzero(num_htraces > 1)[0]
+        if len(candidates) == 0:
+            return []
+
+        # materialize the candidate classes; measurements are ordered by input ID
+        inputs_by_class = np.argsort(class_ids, kind="stable")
+        class_ends = np.cumsum(class_sizes)
+        candidate_classes: List[EquivalenceClass] = []
+        for class_id in candidates:
+            eq_cls = EquivalenceClass()
+            class_end = class_ends[class_id]
+            for i in inputs_by_class[class_end - class_sizes[class_id]:class_end].tolist():
+                eq_cls.measurements.append(Measurement(i, inputs[i], ctraces[i], htraces[i]))
+            eq_cls.ctrace = eq_cls.measurements[0].ctrace
+            eq_cls.build_htrace_map()
+            candidate_classes.append(eq_cls)
+        candidate_classes.sort(key=lambda x: x.ctrace)
+        return candidate_classes
+
+    @staticmethod
+    def _get_trace_ids(traces: List[int]) -> np.ndarray:
+        """
+        Convert traces into an integer array in which equal traces have equal values.
+        Traces are arbitrary Python integers, so the fixed-width conversion may overflow;
+        in this case, each distinct trace is assigned a sequential ID
+        """
+        for dtype in (np.int64, np.uint64):
+            try:
+                return np.array(traces, dtype=dtype)
+            except OverflowError:
+                pass
+        ids: Dict[int, int] = {}
+        return np.array([ids.setdefault(t, len(ids)) for t in traces], dtype=np.int64)
@@ -0,0 +1,292 @@
+"""
+File: Multi-process fuzzing campaigns
+
+Copyright (C) Microsoft Corporation
+SPDX-License-Identifier: MIT
+"""
+import os
+import sys
+import queue
+import random
+import shutil
+import tempfile
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Set, Tuple, Optional, NamedTuple, Any
+
+from . import factory
+from .interfaces import Executor, TestCase, Input, Coverage, CombinedHTrace
+from .config import CONF
+from .util import Logger, STAT
+
+
+class WorkerConfig(NamedTuple):
+    worker_id: int
+    num_test_cases: int
+    program_generator_seed: int
+    input_gen_seed: int
+    executor_taskset: int
+
+
+# ==================================================================================================
+# Worker side
+# ==================================================================================================
+class SharedExecutor(Executor):
+    """
+    A wrapper that serializes the accesses of several worker processes to a single executor
+    (e.g., the x86 kernel module has only one test case buffer and one input buffer).
+    Since another worker may replace the loaded test case between a load and a trace,
+    the wrapper re-loads the test case before tracing whenever it detects a change of owner
+    """
+    executor: Executor
+    test_case: Optional[TestCase] = None
+
+    def __init__(self, executor: Executor, lock: Any, owner: Any, worker_id: int):
+        super().__init__()
+        self.executor = executor
+        self.lock = lock
+        self.owner = owner
+        self.worker_id = worker_id
+
+    def load_test_case(self, test_case: TestCase):
+        with self.lock:
+            # the executor of this process does not know what the other workers have loaded
+            if self.owner.value != self.worker_id:
+                self.executor.invalidate_loaded_state()
+            self.executor.load_test_case(test_case)
+            self.owner.value = self.worker_id
+        self.test_case = test_case
+
+    def trace_test_case(self, inputs: List[Input], repetitions: int = 0) -> List[CombinedHTrace]:
+        with self.lock:
+            if self.owner.value != self.worker_id and self.test_case is not None:
+                self.executor.invalidate_loaded_state()
+                self.executor.load_test_case(self.test_case)
+                self.owner.value = self.worker_id
+            return self.executor.trace_test_case(inputs, repetitions)
+
+    def read_base_addresses(self) -> Tuple[int, int]:
+        with self.lock:
+            return self.executor.read_base_addresses()
+
+    def set_coverage(self, coverage: Coverage):
+        self.executor.set_coverage(coverage)
+
+    def get_last_feedback(self) -> List:
+        return self.executor.get_last_feedback()
+
+
+class CampaignWorker:
+    """
+    The worker-side part of a campaign. It is attached to the fuzzer running in a worker process
+    (see Fuzzer.campaign), and it reports the worker's progress to the orchestrator
+    """
+
+    def __init__(self, config: WorkerConfig, messages: Any, stop_event: Any, executor_lock: Any,
+                 executor_owner: Any):
+        self.config = config
+        self.messages = messages
+        self.stop_event = stop_event
+        self.executor_lock = executor_lock
+        self.executor_owner = executor_owner
+
+    def should_stop(self) -> bool:
+        return self.stop_event.is_set()
+
+    def wrap_executor(self, executor: Executor) -> Executor:
+        return SharedExecutor(executor, self.executor_lock, self.executor_owner,
+                              self.config.worker_id)
+
+    def report_progress(self) -> None:
+        self.messages.put(("progress", self.config.worker_id, STAT.get_counters()))
+
+    def report_violation(self, test_case: TestCase, report: str) -> None:
+        with open(test_case.asm_path, "r") as f:
+            asm = f.read()
+        self.messages.put(("violation", self.config.worker_id, (asm, report)))
+
+    def report_finish(self, coverage: Coverage) -> None:
+        self.messages.put(("finish", self.config.worker_id,
+                           (STAT.get_counters(), coverage.get_covered_points())))
+
+
+def _run_worker(worker: CampaignWorker, instruction_set_spec: str, existing_test_case: str,
+                num_inputs: int, timeout: int, nonstop: bool, log_path: str) -> None:
+    """ Entry point of a worker process """
+    # redirect the output of the worker (including the output of subprocesses) into a log file
+    log = open(log_path, "w", buffering=1)
+    os.dup2(log.fileno(), sys.stdout.fileno())
+    os.dup2(log.fileno(), sys.stderr.fileno())
+
+    # each worker generates its own files (e.g., generated.asm), so it needs its own directory
+    tmp_dir = tempfile.mkdtemp(prefix=f"revizor-worker{worker.config.worker_id}-")
+    os.chdir(tmp_dir)
+    if existing_test_case:
+        # the binary is assembled next to the source file; use a private copy to avoid races
+        existing_test_case = shutil.copy(existing_test_case, tmp_dir)
+
+    CONF.program_generator_seed = worker.config.program_generator_seed
+    CONF.input_gen_seed = worker.config.input_gen_seed
+    CONF.executor_taskset = worker.config.executor_taskset
+
+    try:
+        fuzzer = factory.get_fuzzer(instruction_set_spec, "", existing_test_case, "")
+        fuzzer.campaign = worker
+        fuzzer.start(worker.config.num_test_cases, num_inputs, timeout, nonstop)
+        worker.report_finish(fuzzer.coverage)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# ==================================================================================================
+# Orchestrator
+# ==================================================================================================
+class FuzzingCampaign:
+    """
+    Runs several fuzzer processes in parallel, each with a disjoint range of program and input
+    generator seeds. The orchestrator aggregates the statistics and the coverage of the workers,
+    stores (deduplicated) violations into the working directory, and stops all workers
+    on the first violation, unless requested otherwise.
+
+    The model-only phases of fuzzing run in parallel on all available cores; the executor
+    is shared among the workers, and each worker runs its measurements on a separate core
+    (executor_taskset + worker_id)
+    """
+    POLL_INTERVAL = 1  # seconds
+
+    def __init__(self, instruction_set_spec: str, work_dir: str, existing_test_case: str,
+                 num_workers: int):
+        # the workers run in separate directories, hence all paths must be absolute
+        self.instruction_set_spec = os.path.abspath(instruction_set_spec)
+        self.work_dir = os.path.abspath(work_dir) if work_dir else ""
+        self.existing_test_case = os.path.abspath(existing_test_case) \
+            if existing_test_case else ""
+        if CONF.config_path:
+            CONF.config_path = os.path.abspath(CONF.config_path)
+
+        self.num_workers = num_workers
+        self.LOG = Logger()
+
+    def get_worker_configs(self, num_test_cases: int, num_inputs: int) -> List[WorkerConfig]:
+        """
+        Split the test cases among the workers. Each test case consumes one program generator
+        seed and `num_inputs` input generator seeds, so the ranges of the workers do not overlap
+        """
+        if CONF.program_generator_seed == 0:
+            CONF.program_generator_seed = random.randint(1, 1000000)
+        if CONF.input_gen_seed == 0:
+            CONF.input_gen_seed = random.randint(1, pow(2, 32) - 1)
+
+        configs = []
+        first_test_case = 0
+        for worker_id in range(self.num_workers):
+            worker_test_cases = num_test_cases // self.num_workers
+            if worker_id < num_test_cases % self.num_workers:
+                worker_test_cases += 1
+            configs.append(
+                WorkerConfig(
+                    worker_id=worker_id,
+                    num_test_cases=worker_test_cases,
+                    program_generator_seed=CONF.program_generator_seed + first_test_case,
+                    input_gen_seed=CONF.input_gen_seed + first_test_case * num_inputs,
+                    executor_taskset=(CONF.executor_taskset + worker_id) % (os.cpu_count() or 1),
+                ))
+            first_test_case += worker_test_cases
+        return configs
+
+    def run(self, num_test_cases: int, num_inputs: int, timeout: int, nonstop: bool) -> bool:
+        start_time = datetime.today()
+        self.LOG.fuzzer_start(num_test_cases, start_time)
+        self.LOG.inform("campaign", f"Starting {self.num_workers} workers")
+
+        log_dir = self.work_dir if self.work_dir else tempfile.mkdtemp(prefix="revizor-logs-")
+        Path(log_dir).mkdir(exist_ok=True)
+
+        # start the workers
+        context = multiprocessing.get_context("fork")
+        messages = context.Queue()
+        stop_event = context.Event()
+        executor_lock = context.Lock()
+        executor_owner = context.Value('i', -1)
+        processes: Dict[int, Any] = {}
+        for config in self.get_worker_configs(num_test_cases, num_inputs):
+            worker = CampaignWorker(config, messages, stop_event, executor_lock, executor_owner)
+            log_path = f"{log_dir}/worker{config.worker_id}.log"
+            process = context.Process(
+                target=_run_worker,
+                args=(worker, self.instruction_set_spec, self.existing_test_case, num_inputs,
+                      timeout, nonstop, log_path))
+            process.start()
+            processes[config.worker_id] = process
+
+        # collect the results
+        counters: Dict[int, Dict[str, int]] = {i: {} for i in processes}
+        coverage: Set = set()
+        violations: Set[int] = set()
+        finished: Set[int] = set()
+        while len(finished) < len(processes):
+            try:
+                kind, worker_id, payload = messages.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                for worker_id, process in processes.items():
+                    if worker_id not in finished and process.exitcode is not None:
+                        self.LOG.warning(
+                            "campaign", f"Worker {worker_id} terminated unexpectedly "
+                            f"(exit code {process.exitcode}). See {log_dir}/worker{worker_id}.log")
+                        finished.add(worker_id)
+                continue
+
+            if kind == "progress":
+                counters[worker_id] = payload
+            elif kind == "violation":
+                asm, report = payload
+                key = hash(asm)
+                if key not in violations:
+                    violations.add(key)
+                    self.LOG.campaign_report_violation(worker_id, report)
+                    self.store_violation(worker_id, asm, report)
+                if not nonstop:
+                    stop_event.set()
+            elif kind == "finish":
+                counters[worker_id], worker_coverage = payload
+                coverage.update(worker_coverage)
+                finished.add(worker_id)
+
+            self._aggregate_stats(counters, len(violations))
+            STAT.coverage = max(len(coverage), STAT.coverage)
+            self.LOG.campaign_progress(len(processes) - len(finished))
+
+        for process in processes.values():
+            process.join()
+
+        if coverage:
+            STAT.coverage = len(coverage)
+        self.LOG.fuzzer_finish()
+        return STAT.violations > 0
+
+    @staticmethod
+    def _aggregate_stats(counters: Dict[int, Dict[str, int]], num_violations: int) -> None:
+        """ Sum up the statistics reported by the workers into the global STAT object """
+        totals: Dict[str, int] = {}
+        for worker_counters in counters.values():
+            for name, value in worker_counters.items():
+                totals[name] = totals.get(name, 0) + value
+        # coverage points may overlap across workers; use the highest one as an estimate
+        totals["coverage"] = max([c.get("coverage", 0) for c in counters.values()], default=0)
+        totals["violations"] = num_violations
+        for name, value in totals.items():
+            setattr(STAT, name, value)
+
+    def store_violation(self, worker_id: int, asm: str, report: str) -> None:
+        if not self.work_dir:
+            return
+
+        timestamp = datetime.today().strftime('%y%m%d-%H%M%S')
+        name = f"{timestamp}-w{worker_id}"
+        with open(f"{self.work_dir}/violation-{name}.asm", "w") as f:
+            f.write(asm)
+        if CONF.config_path:
+            shutil.copy2(CONF.config_path, f"{self.work_dir}/config-{name}.yaml")
+        with open(f"{self.work_dir}/report-{name}.txt", "w") as f:
+            f.write(report)
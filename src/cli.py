@@ -12,6 +12,7 @@ from typing import Dict
 from argparse import ArgumentParser
 from .factory import get_minimizer, get_fuzzer, get_downloader
 from .fuzzer import Fuzzer
+from .campaign import FuzzingCampaign
 from .config import CONF
 
 
@@ -67,6 +68,12 @@ def main() -> int:
         action='store_true',
         help="Don't stop after detecting an unexpected result"
     )
+    parser_fuzz.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Number of fuzzing processes running in parallel."
+    )
 
     # ==============================================================================================
     # Standalone interface to trace analysis
@@ -232,6 +239,12 @@ def main() -> int:
         if args.working_directory and not os.path.isdir(args.working_directory):
             SystemExit("The working directory does not exist")
 
+        # Parallel fuzzing mode
+        if args.workers > 1:
+            campaign = FuzzingCampaign(args.instruction_set, args.working_directory,
+                                       args.testcase, args.workers)
+            return campaign.run(args.num_test_cases, args.num_inputs, args.timeout, args.nonstop)
+
         # Normal fuzzing mode
         fuzzer = get_fuzzer(args.instruction_set, args.working_directory, args.testcase, "")
         exit_code = fuzzer.start(
@@ -20,12 +20,27 @@ class ConfCls:
     """ fuzzer: type of the fuzzing algorithm """
     ignore_flaky_violations: bool = True
     """ ignore_flaky_violations: if True, don't report non-reproducible violations """
+    reproduction_window: int = 0
+    """ reproduction_window: if positive, the reproducibility of a violation is first checked
+    by re-measuring only the violating inputs, each preceded by this many inputs;
+    if 0, all inputs are re-measured """
     enable_priming: bool = True
     """ enable_priming: whether to check violations with priming """
+    priming_batch_size: int = 0
+    """ priming_batch_size: if positive, the primers are concatenated and traced in batches
+    of up to this many inputs (which changes the context of the primed inputs);
+    if 0, every primer is traced in a separate executor call """
     enable_speculation_filter: bool = False
     """ enable_speculation_filter: if True, discard test cases that don't trigger speculation"""
     enable_observation_filter: bool = False
     """ enable_observation_filter: if True,discard test cases that don't leave speculative traces"""
+    enable_model_filter: bool = False
+    """ enable_model_filter: if True, discard test cases that don't have speculative memory
+    accesses on the model, before measuring them on the executor """
+    fuzzer_pipeline_depth: int = 0
+    """ fuzzer_pipeline_depth: number of test cases prepared in advance by a background thread
+    while the executor measures the current test case; 0 disables pipelining.
+    The results match the sequential mode only if no violations are detected """
 
     # ==============================================================================================
     # Execution Environment
@@ -85,6 +100,9 @@ class ConfCls:
     """ [DEPRECATED] memory_access_zeroed_bits: """
     inputs_per_class: int = 2
     """ inputs_per_class: number of inputs per input class """
+    input_gen_mutation_policy: str = 'smart'
+    """ input_gen_mutation_policy: mutation applied to the untainted values of the inputs
+    when extending input classes """
     input_main_region_size: int = 4096
     """ input_main_region_size: """
     input_faulty_region_size: int = 4096
@@ -104,6 +122,20 @@ class ConfCls:
     """ model_max_nesting: """
     model_max_spec_window: int = 250
     """ model_max_spec_window: """
+    model_workers: int = 1
+    """ model_workers: number of processes used to trace inputs on the model in parallel;
+    1 means that the inputs are traced in the main process """
+    model_lazy_fault_context: bool = True
+    """ model_lazy_fault_context: if True, the model saves the CPU context (needed to recover
+    from faults) only before the instructions that may fault; otherwise, before every
+    instruction """
+    model_cache_size: int = 0
+    """ model_cache_size: maximum number of model results (contract traces and taints) kept
+    in memory for reuse when the same input is traced again on the same test case;
+    0 disables the cache """
+    model_cache_path: str = ""
+    """ model_cache_path: if set, the cached model results are also stored in this file
+    and reused across fuzzing campaigns """
 
     # ==============================================================================================
     # Executor
@@ -118,6 +150,14 @@ class ConfCls:
     """ executor_repetitions: number of repetitions while collecting hardware traces """
     executor_max_outliers: int = 1
     """ executor_max_outliers: """
+    executor_adaptive_repetitions: bool = False
+    """ executor_adaptive_repetitions: if enabled, the executor collects hardware traces in chunks
+    of repetitions and stops as soon as the traces converge; in this mode,
+    executor_repetitions is the maximum number of repetitions """
+    executor_adaptive_confidence: int = 5
+    """ executor_adaptive_confidence: (adaptive repetitions) size of a chunk of repetitions;
+    the traces are considered converged if a chunk did not change the merged hardware trace
+    of any input """
     executor_taskset: int = 0
     """ executor_taskset: id of the CPU core on which the executor is running test cases """
     enable_pre_run_flush: bool = True
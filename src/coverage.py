@@ -9,7 +9,7 @@ from typing import Dict, Set, List, Optional
 
 from .isa_loader import InstructionSet
 from .interfaces import Coverage, EquivalenceClass, TestCase, Executor, Model, Analyser, \
-    ExecutionTrace, TracedInstruction, Instruction, RegisterOperand, OT
+    ExecutionTrace, TracedInstruction, Instruction, InstructionInfo, OT
 from .x86.x86_generator import X86TargetDesc
 from .util import STAT
 
@@ -75,10 +75,10 @@ class DependentPairCoverage(Coverage):
 
         # get rid of instrumentation in the traces
         # - collect the addresses of instrumentation instructions
-        instrumentation_addresses = []
+        instrumentation_addresses = set()
         for addr, instr in self.test_case.address_map.items():
             if instr.is_instrumentation:
-                instrumentation_addresses.append(addr)
+                instrumentation_addresses.add(addr)
         # - remove those addresses from traces
         filtered_traces = []
         for trace in effective_traces:
@@ -89,13 +89,17 @@ class DependentPairCoverage(Coverage):
         # process all pairs of the executed instructions
         addr1: TracedInstruction
         addr2: TracedInstruction
+        address_map = self.test_case.address_map
+        instruction_info = self._get_instruction_info()
         for trace in effective_traces:
             for addr1, addr2 in zip(trace, trace[1:]):
-                instr1 = self.test_case.address_map[addr1.i_address]
-                instr2 = self.test_case.address_map[addr2.i_address]
+                instr1 = address_map[addr1.i_address]
+                instr2 = address_map[addr2.i_address]
+                info1 = instruction_info[addr1.i_address]
+                info2 = instruction_info[addr2.i_address]
 
                 type_: Optional[DT]
-                key = hash(self._get_instruction_key(instr1) + self._get_instruction_key(instr2))
+                key = hash(info1.coverage_key + info2.coverage_key)
 
                 # control flow dependency
                 if instr1.control_flow:
@@ -110,11 +114,20 @@ class DependentPairCoverage(Coverage):
                         self.coverage[type_].add(key)
 
                 # potential reg dependency
-                if self._search_reg_dependency(instr1, instr2):
+                if self._search_reg_dependency(info1, info2):
                     self.coverage[DT.REG_GPR].add(key)
                 if self._search_flag_dependency(instr1, instr2):
                     self.coverage[DT.REG_FLAGS].add(key)
 
+    def _get_instruction_info(self) -> Dict[int, InstructionInfo]:
+        """ Precomputed instruction properties; test cases created without a generator lack them """
+        if len(self.test_case.instruction_info) != len(self.test_case.address_map):
+            self.test_case.instruction_info = {
+                address: X86TargetDesc().get_instruction_info(inst)
+                for address, inst in self.test_case.address_map.items()
+            }
+        return self.test_case.instruction_info
+
     def _calculate_max_coverage(self):
         all_, reg_src, reg_dest, flags_src, flags_dest, mem_src, mem_dest, control_cond = (0,) * 8
         control_direct = 1
@@ -164,6 +177,9 @@ class DependentPairCoverage(Coverage):
     def get(self) -> int:
         return sum([len(c) for c in self.coverage.values()])
 
+    def get_covered_points(self) -> Set:
+        return {(type_, key) for type_, keys in self.coverage.items() for key in keys}
+
     def get_brief(self):
         flags = (len(self.coverage[DT.REG_FLAGS]) / self.max_coverage[DT.REG_FLAGS]) * 100
         grp = (len(self.coverage[DT.REG_GPR]) / self.max_coverage[DT.REG_GPR]) * 100
@@ -200,12 +216,6 @@ class DependentPairCoverage(Coverage):
     def executor_hook(self, _):
         pass
 
-    def _get_instruction_key(self, instruction: Instruction) -> str:
-        key = instruction.name
-        for op in instruction.get_all_operands():
-            key += "-" + str(op.width) + str(op.type)
-        return key
-
     def _search_memory_dependency(self, traced_instr1: TracedInstruction,
                                   traced_instr2: TracedInstruction) -> List[DT]:
         read_addresses1 = []
@@ -239,22 +249,16 @@ class DependentPairCoverage(Coverage):
 
         return types
 
-    def _search_reg_dependency(self, inst1: Instruction, inst2: Instruction) -> Optional[DT]:
+    def _search_reg_dependency(self, info1: InstructionInfo,
+                               info2: InstructionInfo) -> Optional[DT]:
         # normal register dependencies
-        dest_regs = [
-            r.value for r in inst1.get_dest_operands(True) if isinstance(r, RegisterOperand)
-        ]
-        src_regs = [r.value for r in inst2.get_src_operands(True) if isinstance(r, RegisterOperand)]
-        dest_regs = [X86TargetDesc.gpr_normalized[r] for r in dest_regs]
-        src_regs = [X86TargetDesc.gpr_normalized[r] for r in src_regs]
-        for r in dest_regs:
-            if r in src_regs:
+        for r in info1.dest_regs:
+            if r in info2.src_regs:
                 return DT.REG_GPR
 
         # address dependency
-        mem_operands = [m.value for m in inst2.get_mem_operands()]
-        for r in dest_regs:
-            for mem in mem_operands:
+        for r in info1.dest_regs:
+            for mem in info2.mem_operands:
                 if r in mem:
                     return DT.REG_GPR
 
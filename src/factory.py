@@ -8,7 +8,8 @@ SPDX-License-Identifier: MIT
 from typing import Tuple, Dict, Type, List, Callable
 
 from . import input_generator, analyser, coverage, postprocessor, interfaces, model
-from .x86 import x86_model, x86_executor, x86_fuzzer, x86_generator, get_spec
+from .x86 import x86_model, x86_executor, x86_simulated_executor, x86_fuzzer, x86_generator, \
+    get_spec
 from .config import CONF, ConfigException
 
 GENERATORS: Dict[str, Type[interfaces.Generator]] = {
@@ -50,7 +51,8 @@ X86_SIMPLE_EXECUTION_CLAUSES: Dict[str, Type[x86_model.X86UnicornModel]] = {
 }
 
 EXECUTORS = {
-    'x86-64': x86_executor.X86IntelExecutor,
+    'x86-64-default': x86_executor.X86IntelExecutor,
+    'x86-64-simulated': x86_simulated_executor.X86SimulatedExecutor,
 }
 
 ANALYSERS: Dict[str, Type[interfaces.Analyser]] = {
@@ -117,7 +119,7 @@ def get_model(bases: Tuple[int, int]) -> interfaces.Model:
             raise ConfigException(
                 "ERROR: unknown value of `contract_execution_clause` configuration option")
 
-        model_instance.taint_tracker_cls = x86_model.X86TaintTracker
+        model_instance.taint_tracker_cls = x86_model.X86BitsetTaintTracker
 
     else:
         raise ConfigException("ERROR: unknown value of `model` configuration option")
@@ -126,13 +128,19 @@ def get_model(bases: Tuple[int, int]) -> interfaces.Model:
     model_instance.tracer = _get_from_config(TRACERS, CONF.contract_observation_clause,
                                              "contract_observation_clause")
 
+    if CONF.model_cache_size > 0:
+        model_instance.trace_cache = model.ModelTraceCache(CONF.model_cache_size,
+                                                           CONF.model_cache_path)
+
+    # the workers are forked right away, while the process is still single-threaded
+    if CONF.model_workers > 1:
+        model_instance.worker_pool = model.ModelWorkerPool(model_instance, CONF.model_workers)
+
     return model_instance
 
 
 def get_executor() -> interfaces.Executor:
-    if CONF.executor != 'default':
-        raise ConfigException("ERROR: unknown value of `executor` configuration option")
-    return _get_from_config(EXECUTORS, CONF.instruction_set, "instruction_set")
+    return _get_from_config(EXECUTORS, CONF.instruction_set + "-" + CONF.executor, "executor")
 
 
 def get_analyser() -> interfaces.Analyser:
@@ -5,18 +5,39 @@ Copyright (C) Microsoft Corporation
 SPDX-License-Identifier: MIT
 """
 import shutil
+import random
+import queue
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List
+from contextlib import contextmanager
+from typing import Optional, List, Tuple, NamedTuple, Any, Iterator, Union
 import copy
 
 from . import factory
+from .campaign import CampaignWorker
 from .interfaces import CTrace, HTrace, Input, InputTaint, EquivalenceClass, TestCase, Generator, \
     InputGenerator, Model, Executor, Analyser, Coverage, InputID, Measurement
 from .isa_loader import InstructionSet
 from .config import CONF
 from .util import Logger, STAT, TWOS_COMPLEMENT_MASK_64, bit_count, pretty_trace
 
+MODEL_FILTER_SAMPLE_SIZE = 10  # number of inputs traced on the model by the model filter
+
+
+class PreparedTestCase(NamedTuple):
+    """ A test case prepared for a fuzzing round in the background (see TestCasePipeline) """
+    test_case: TestCase
+    inputs: List[Input]
+    boosted_inputs: List[Input]
+    ctraces: List[CTrace]
+    nesting_limited: Optional[List[bool]]
+    """ see Model.get_nesting_limited """
+    random_state: Any
+    """ state of the global RNG at the end of the preparation """
+    input_gen_state: int
+    """ state of the input generator at the end of the preparation """
+
 
 class Fuzzer:
     instruction_set: InstructionSet
@@ -30,6 +51,19 @@ class Fuzzer:
     analyser: Analyser
     coverage: Coverage
 
+    campaign: Optional[CampaignWorker] = None
+    """ set when the fuzzer runs as a worker of a multi-process campaign """
+
+    pipeline: Optional["TestCasePipeline"] = None
+    """ set when the test cases are prepared in the background (see CONF.fuzzer_pipeline_depth) """
+    supports_pipelining: bool = True
+
+    model_filter_enabled: bool = False
+    """ set if CONF.enable_model_filter is on and the model can judge the test cases """
+    supports_model_filter: bool = True
+    filtered_test_case: Optional[TestCase] = None
+    """ the test case that the model filter has left loaded in the model """
+
     LOG: Logger  # name capitalized to make logging easily distinguishable from the main logic
 
     def __init__(self,
@@ -58,6 +92,8 @@ class Fuzzer:
                                                        CONF.program_generator_seed)
         self.input_gen = factory.get_input_generator(CONF.input_gen_seed)
         self.executor = factory.get_executor()
+        if self.campaign:
+            self.executor = self.campaign.wrap_executor(self.executor)
         self.model = factory.get_model(self.executor.read_base_addresses())
         self.analyser = factory.get_analyser()
         self.coverage = factory.get_coverage(self.instruction_set, self.executor, self.model,
@@ -74,10 +110,43 @@ class Fuzzer:
         # create all main modules
         self.initialize_modules()
 
+        if CONF.fuzzer_pipeline_depth > 0:
+            if not self.supports_pipelining or self.existing_test_case \
+               or CONF.coverage_type != "none":
+                self.LOG.warning(
+                    "fuzzer", "Pipelining is not supported in this mode (architectural fuzzing,"
+                    " fuzzing an existing test case, or coverage tracking). Falling back to"
+                    " the sequential mode")
+            else:
+                self.pipeline = TestCasePipeline(self, num_test_cases, num_inputs)
+
+        if CONF.enable_model_filter:
+            if not self.supports_model_filter or 'seq' in CONF.contract_execution_clause:
+                self.LOG.warning(
+                    "fuzzer", "The model filter requires a speculative contract, and it is"
+                    " not supported in architectural fuzzing. Disabling the filter")
+            else:
+                self.model_filter_enabled = True
+
+        try:
+            return self._fuzzing_loop(start_time, num_test_cases, num_inputs, timeout, nonstop)
+        finally:
+            if self.pipeline:
+                self.pipeline.stop()
+                self.pipeline = None
+
+    def _fuzzing_loop(self, start_time: datetime, num_test_cases: int, num_inputs: int,
+                      timeout: int, nonstop: bool) -> bool:
         for i in range(num_test_cases):
             self.LOG.fuzzer_start_round(i)
             self.LOG.dbg_report_coverage(i, self.coverage.get_brief())
 
+            # synchronize with other workers of the campaign, if any
+            if self.campaign:
+                if self.campaign.should_stop():
+                    break
+                self.campaign.report_progress()
+
             # terminate the fuzzer if the timeout has expired
             if timeout:
                 now = datetime.today()
@@ -85,64 +154,127 @@ class Fuzzer:
                     self.LOG.fuzzer_timeout()
                     break
 
-            # Generate a test case
+            # Generate a test case, its execution environment, and inputs
+            # (or take them from the pipeline, if they were prepared in the background)
             test_case: TestCase
-            if self.existing_test_case:
-                test_case = self.generator.load(self.existing_test_case)
-            else:
-                test_case = self.generator.create_test_case('generated.asm')
-            STAT.test_cases += 1
-
-            # Generate the execution environment
-            self.generator.create_pte(test_case)
-
-            # Prepare inputs
             inputs: List[Input]
-            if self.input_paths:
-                inputs = self.input_gen.load(self.input_paths)
+            prepared: Optional[PreparedTestCase] = None
+            if self.pipeline:
+                prepared = self.pipeline.get()
+                test_case, inputs = prepared.test_case, prepared.inputs
             else:
-                inputs = self.input_gen.generate(num_inputs)
+                test_case, inputs = self.generate_test_case('generated.asm', num_inputs)
+            STAT.test_cases += 1
             STAT.num_inputs += len(inputs) * CONF.inputs_per_class
 
             # Check if the test case is useful
+            if self.model_filter_enabled and self.model_filter(test_case, inputs, prepared):
+                continue
             if self.filter(test_case, inputs):
                 continue
 
             # Fuzz the test case
-            violation = self.fuzzing_round(test_case, inputs)
+            violation: Optional[EquivalenceClass]
+            if prepared:
+                violation = self.test_for_violations(test_case, inputs, prepared.boosted_inputs,
+                                                     prepared.ctraces, prepared.nesting_limited,
+                                                     prepared)
+            else:
+                violation = self.fuzzing_round(test_case, inputs)
 
             if violation:
-                self.LOG.fuzzer_report_violations(violation, self.model)
+                with self.model_access(prepared):
+                    self.LOG.fuzzer_report_violations(violation, self.model)
                 self.store_test_case(test_case, violation)
                 STAT.violations += 1
+                if self.campaign:
+                    self.campaign.report_violation(test_case, self.get_violation_report(violation))
                 if not nonstop:
                     break
 
         self.LOG.fuzzer_finish()
         return STAT.violations > 0
 
+    def generate_test_case(self, asm_path: str, num_inputs: int) -> Tuple[TestCase, List[Input]]:
+        """ Generate (or load) a test case, its execution environment, and its inputs """
+        test_case: TestCase
+        if self.existing_test_case:
+            test_case = self.generator.load(self.existing_test_case)
+        else:
+            test_case = self.generator.create_test_case(asm_path)
+
+        # Generate the execution environment
+        self.generator.create_pte(test_case)
+
+        # Prepare inputs
+        inputs: List[Input]
+        if self.input_paths:
+            inputs = self.input_gen.load(self.input_paths)
+        else:
+            inputs = self.input_gen.generate(num_inputs)
+        return test_case, inputs
+
     def filter(self, test_case, inputs):
         return False  # implemented by architecture-specific subclasses
 
-    def fuzzing_round(self, test_case: TestCase, inputs: List[Input]) -> Optional[EquivalenceClass]:
-        self.model.load_test_case(test_case)
-        self.executor.load_test_case(test_case)
-        self.coverage.load_test_case(test_case)
+    def model_filter(self, test_case: TestCase, inputs: List[Input],
+                     prepared: Optional[PreparedTestCase] = None) -> bool:
+        """
+        Check on the model if the test case is worth measuring on the executor:
+        a sample of the inputs is traced with the max. nesting, and the test case is
+        discarded if the model has not executed any memory accesses during speculation
+        (including the case when it has not speculated at all).
+        Returns True if the test case should be discarded
+        """
+        sample = inputs[:MODEL_FILTER_SAMPLE_SIZE]
+        with self.model_access(prepared):
+            if not prepared:  # otherwise, model_access has already loaded the test case
+                self.model.load_test_case(test_case)
+                self.filtered_test_case = test_case
+            stats = self.model.get_speculation_stats(sample, CONF.model_max_nesting)
+        if stats is None or stats.speculative_mem_accesses > 0:
+            STAT.model_filter += 1
+            return False
+        return True
 
-        # 1. Test for contract violations with nesting=1
-        ctraces: List[CTrace]
-        htraces: List[HTrace]
+    def fuzzing_round(self, test_case: TestCase, inputs: List[Input]) -> Optional[EquivalenceClass]:
+        # the model filter may have loaded the test case already
+        if self.filtered_test_case is not test_case:
+            self.model.load_test_case(test_case)
+        self.filtered_test_case = None
 
         # at this point we need to increase the effectiveness of inputs
         # so that we can detect contract violations (note that it wasn't necessary
         # up to this point because we weren't testing against a contract)
         boosted_inputs: List[Input] = self.boost_inputs(inputs, 1)
+        ctraces: List[CTrace] = self.model.trace_test_case(boosted_inputs, 1)
+        nesting_limited = self.model.get_nesting_limited()
 
-        # check for violations
-        ctraces = self.model.trace_test_case(boosted_inputs, 1)
+        return self.test_for_violations(test_case, inputs, boosted_inputs, ctraces,
+                                        nesting_limited)
+
+    def test_for_violations(self, test_case: TestCase, inputs: List[Input],
+                            boosted_inputs: List[Input], ctraces: List[CTrace],
+                            nesting_limited: Optional[List[bool]],
+                            prepared: Optional[PreparedTestCase] = None) \
+            -> Optional[EquivalenceClass]:
+        """
+        Measure the (boosted) inputs on the executor and check them for contract violations.
+        The contract traces must be already collected with nesting=1
+        (and `nesting_limited` is the result of Model.get_nesting_limited after that).
+        If the test case was prepared in the background, `prepared` is used to restore
+        the state of the model and the generators before they are used again
+        """
+        self.executor.load_test_case(test_case)
+        self.coverage.load_test_case(test_case)
+
+        # 1. Test for contract violations with nesting=1
+        htraces: List[HTrace]
         htraces = self.executor.trace_test_case(boosted_inputs, CONF.executor_repetitions)
-        self.LOG.trc_fuzzer_dump_traces(self.model, boosted_inputs, htraces, ctraces,
-                                        self.executor.get_last_feedback())
+        if self.LOG.dbg_traces:
+            with self.model_access(prepared):
+                self.LOG.trc_fuzzer_dump_traces(self.model, boosted_inputs, htraces, ctraces,
+                                                self.executor.get_last_feedback())
         violations = self.analyser.filter_violations(boosted_inputs, ctraces, htraces, True)
         if not violations:  # nothing detected? -> we are done here, move to next test case
             return None
@@ -150,8 +282,9 @@ class Fuzzer:
         # 2. Repeat with with max nesting
         if 'seq' not in CONF.contract_execution_clause:
             self.LOG.fuzzer_nesting_increased()
-            boosted_inputs = self.boost_inputs(inputs, CONF.model_max_nesting)
-            ctraces = self.model.trace_test_case(boosted_inputs, CONF.model_max_nesting)
+            with self.model_access(prepared):
+                boosted_inputs, ctraces = self.increase_nesting(inputs, boosted_inputs, ctraces,
+                                                                nesting_limited)
             htraces = self.executor.trace_test_case(boosted_inputs, CONF.executor_repetitions)
             violations = self.analyser.filter_violations(boosted_inputs, ctraces, htraces, True)
             if not violations:
@@ -181,6 +314,71 @@ class Fuzzer:
         # Violation survived priming. Report it
         return violation
 
+    @contextmanager
+    def model_access(self, prepared: Optional[PreparedTestCase]) -> Iterator[None]:
+        """
+        Get exclusive access to the model and the generators while the test cases are
+        prepared in the background. If `prepared` is given, the model is re-loaded with
+        the prepared test case, and the generators continue from the state in which
+        the preparation has left them, as if the test case was prepared and tested sequentially
+        """
+        if not self.pipeline:
+            yield
+            return
+
+        with self.pipeline.lock:
+            if not prepared:
+                yield
+                return
+
+            background_random_state = random.getstate()
+            background_input_gen_state = self.input_gen.get_seed()
+            random.setstate(prepared.random_state)
+            self.input_gen.set_seed(prepared.input_gen_state)
+            self.model.load_test_case(prepared.test_case)
+            try:
+                yield
+            finally:
+                random.setstate(background_random_state)
+                self.input_gen.set_seed(background_input_gen_state)
+
+    def increase_nesting(self, inputs: List[Input], boosted_inputs: List[Input],
+                         ctraces: List[CTrace], nesting_limited: Optional[List[bool]]) \
+            -> Tuple[List[Input], List[CTrace]]:
+        """
+        Boost and trace the inputs with the max. nesting, given their nesting=1 results.
+        If the nesting limit did not prevent the model from speculating on an input,
+        its taints and contract trace are the same with the max. nesting. Hence, only the
+        classes of the limited inputs are re-boosted, and only the limited and
+        the re-boosted inputs are re-traced
+        """
+        nesting = CONF.model_max_nesting
+        if nesting_limited is None or len(nesting_limited) != len(boosted_inputs):
+            boosted_inputs = self.boost_inputs(inputs, nesting)
+            return boosted_inputs, self.model.trace_test_case(boosted_inputs, nesting)
+
+        boosted_inputs = list(boosted_inputs)
+        ctraces = list(ctraces)
+        stale = list(nesting_limited)
+
+        # the boosted inputs are ordered by classes: [base inputs] + [one input per class] * N
+        limited_ids = [i for i in range(len(inputs)) if nesting_limited[i]]
+        if limited_ids:
+            reboosted = self.boost_inputs([inputs[i] for i in limited_ids], nesting)
+            for round_ in range(1, len(reboosted) // len(limited_ids)):
+                for j, input_id in enumerate(limited_ids):
+                    position = round_ * len(inputs) + input_id
+                    boosted_inputs[position] = reboosted[round_ * len(limited_ids) + j]
+                    stale[position] = True
+
+        stale_ids = [i for i, is_stale in enumerate(stale) if is_stale]
+        if stale_ids:
+            new_ctraces = self.model.trace_test_case([boosted_inputs[i] for i in stale_ids],
+                                                     nesting)
+            for i, ctrace in zip(stale_ids, new_ctraces):
+                ctraces[i] = ctrace
+        return boosted_inputs, ctraces
+
     def boost_inputs(self, inputs: List[Input], nesting: int) -> List[Input]:
         if CONF.inputs_per_class == 1:
             return inputs
@@ -208,13 +406,18 @@ class Fuzzer:
 
         # store the violation report
         with open(f"{self.work_dir}/report-{timestamp}.txt", "w") as f:
-            f.write("# Violation Report\n\n")
-            f.write(f"Detected: {datetime.today().strftime('%d.%m.%y at %H:%M:%S')}\n\n")
-            f.write("## Counterexample Inputs\n")
-            for m in violation.measurements:
-                f.write(f"\nInput #{m.input_id}\n")
-                f.write(f"* Contract trace hash: {m.ctrace}\n")
-                f.write(f"* Hardware trace: {pretty_trace(m.htrace)}\n")
+            f.write(self.get_violation_report(violation))
+
+    @staticmethod
+    def get_violation_report(violation: EquivalenceClass) -> str:
+        report = "# Violation Report\n\n"
+        report += f"Detected: {datetime.today().strftime('%d.%m.%y at %H:%M:%S')}\n\n"
+        report += "## Counterexample Inputs\n"
+        for m in violation.measurements:
+            report += f"\nInput #{m.input_id}\n"
+            report += f"* Contract trace hash: {m.ctrace}\n"
+            report += f"* Hardware trace: {pretty_trace(m.htrace)}\n"
+        return report
 
     # ==============================================================================================
     # Single-stage interfaces
@@ -253,25 +456,9 @@ class Fuzzer:
         logger.fuzzer_start(0, datetime.today())
         STAT.test_cases = 1
 
-        # read traces
-        ctraces: List[CTrace] = []
-        htraces: List[HTrace] = []
-
-        with open(ctrace_file, 'r') as f:
-            for line in f:
-                ctraces.append(int(line))
-        with open(htrace_file, 'r') as f:
-            for line in f:
-                htraces.append(int(line))
-
-        assert len(ctraces) == len(htraces), \
-            "The number of hardware traces does not match the number of contract traces"
-
-        dummy_inputs = factory.get_input_generator(0).generate(len(ctraces))
-
         # check for violations
         analyser = factory.get_analyser()
-        violations = analyser.filter_violations(dummy_inputs, ctraces, htraces, True)
+        violations = analyser.filter_violations_from_files(ctrace_file, htrace_file, True)
 
         # print results
         if violations:
@@ -283,15 +470,36 @@ class Fuzzer:
     # Priming and reproducibility
     def check_if_reproducible(self, violations: List[EquivalenceClass], inputs: List[Input],
                               org_htraces: List[HTrace]) -> bool:
-        # re-collect htraces
-        htraces: List[HTrace] = self.executor.trace_test_case(inputs, CONF.executor_repetitions)
+        """
+        Re-measure the violating inputs and check if their htraces are the same.
+        If CONF.reproduction_window is set, only the violating inputs and their preceding
+        inputs are re-measured first; all inputs are re-measured only if this targeted
+        measurement does not match
 
-        # check if all htraces that had a violation match
+        return: True if the violation is NOT reproducible
+        """
         violating_input_ids = []
         for violation in violations:
             for measurement in violation.measurements:
                 violating_input_ids.append(measurement.input_id)
 
+        # targeted re-measurement
+        if CONF.reproduction_window > 0:
+            selected_ids = sorted({
+                j for i in violating_input_ids
+                for j in range(max(i - CONF.reproduction_window, 0), i + 1)
+            })
+            htraces = self.executor.trace_test_case([inputs[j] for j in selected_ids],
+                                                    CONF.executor_repetitions)
+            htrace_by_id = dict(zip(selected_ids, htraces))
+            if all(htrace_by_id[i] == org_htraces[i] for i in violating_input_ids):
+                return False
+            STAT.ambiguous_reproductions += 1
+
+        # re-collect all htraces
+        htraces = self.executor.trace_test_case(inputs, CONF.executor_repetitions)
+
+        # check if all htraces that had a violation match
         for i in violating_input_ids:
             if htraces[i] != org_htraces[i]:
                 return True
@@ -299,7 +507,14 @@ class Fuzzer:
 
     def priming(self, org_violation: EquivalenceClass, all_inputs: List[Input]) -> bool:
         """
-        Try priming the inputs that caused the violations
+        Try priming the inputs that caused the violations.
+
+        By default, every primer is traced in a separate executor call: the primer is the original
+        input sequence with the tested input placed into the position of the primed one.
+        If CONF.priming_batch_size is set, the primers are instead truncated after the primed
+        position, concatenated, and traced in batches. Note that this changes the context
+        of the primed measurements (a primer is preceded by the other primers of the batch),
+        and thus the priming results may differ from the unbatched ones
 
         return: True if the violation survived priming
         """
@@ -307,34 +522,67 @@ class Fuzzer:
         ordered_htraces = sorted(
             violation.htrace_map.keys(), key=lambda x: bit_count(x), reverse=False)
 
+        # list of the primed experiments: (expected htrace, primed input, tested input)
+        candidates: List[Tuple[HTrace, InputID, InputID]] = []
         for current_htrace in ordered_htraces:
             current_input_id = violation.htrace_map[current_htrace][-1].input_id
 
-            # list of inputs that produced a different HTrace
-            input_ids_to_test: List[InputID] = [
-                m.input_id for m in violation.measurements if m.htrace != current_htrace
-            ]
-
-            # insert the tested inputs into their places
-            for input_id in input_ids_to_test:
-                primer = list(all_inputs)
-                primer[current_input_id] = all_inputs[input_id]
+            # inputs that produced a different HTrace
+            for measurement in violation.measurements:
+                if measurement.htrace != current_htrace:
+                    candidates.append((current_htrace, current_input_id, measurement.input_id))
 
-                # try priming
-                htraces: List[HTrace] = self.executor.trace_test_case(primer,
-                                                                      CONF.executor_repetitions)
-                primed_htrace = htraces[current_input_id]
-                if primed_htrace == current_htrace:
-                    continue
+        if CONF.priming_batch_size > 0:
+            return self._batched_priming(candidates, all_inputs)
 
-                # if the primed measurement triggered more speculation, it's ok
-                if (primed_htrace ^ TWOS_COMPLEMENT_MASK_64) & current_htrace == 0:
-                    continue
+        for current_htrace, current_input_id, input_id in candidates:
+            # insert the tested input into the place of the primed one
+            primer = list(all_inputs)
+            primer[current_input_id] = all_inputs[input_id]
 
+            # try priming
+            htraces: List[HTrace] = self.executor.trace_test_case(primer,
+                                                                  CONF.executor_repetitions)
+            if not self._is_primed(htraces[current_input_id], current_htrace):
                 return True
 
         return False
 
+    def _batched_priming(self, candidates: List[Tuple[HTrace, InputID, InputID]],
+                         all_inputs: List[Input]) -> bool:
+        next_candidate = 0
+        while next_candidate < len(candidates):
+            # build a batch of primers
+            batch: List[Input] = []
+            checked_positions: List[Tuple[HTrace, int]] = []
+            while next_candidate < len(candidates):
+                current_htrace, current_input_id, input_id = candidates[next_candidate]
+                if batch and len(batch) + current_input_id + 1 > CONF.priming_batch_size:
+                    break
+                # insert the tested input into the place of the primed one;
+                # the inputs after it are dropped
+                batch.extend(all_inputs[:current_input_id])
+                batch.append(all_inputs[input_id])
+                checked_positions.append((current_htrace, len(batch) - 1))
+                next_candidate += 1
+
+            # try priming
+            htraces: List[HTrace] = self.executor.trace_test_case(batch,
+                                                                  CONF.executor_repetitions)
+            for current_htrace, position in checked_positions:
+                if not self._is_primed(htraces[position], current_htrace):
+                    return True
+
+        return False
+
+    @staticmethod
+    def _is_primed(primed_htrace: HTrace, current_htrace: HTrace) -> bool:
+        if primed_htrace == current_htrace:
+            return True
+
+        # if the primed measurement triggered more speculation, it's ok
+        return (primed_htrace ^ TWOS_COMPLEMENT_MASK_64) & current_htrace == 0
+
 
 class ArchitecturalFuzzer(Fuzzer):
     """
@@ -342,6 +590,9 @@ class ArchitecturalFuzzer(Fuzzer):
     of the model execution vs execution on the CPU
     """
 
+    supports_pipelining = False
+    supports_model_filter = False
+
     def __init__(self,
                  instruction_set_spec: str,
                  work_dir: str,
@@ -353,6 +604,11 @@ class ArchitecturalFuzzer(Fuzzer):
         self.LOG.warning("fuzzer", "Running in architectural mode. "
                          "Contract violations can't be detected!")
 
+    def initialize_modules(self):
+        super().initialize_modules()
+        # the full model traces are compared with the architectural state of the CPU
+        self.model.tracer.keep_full_trace = True
+
     def fuzzing_round(self, test_case: TestCase, inputs: List[Input]) -> Optional[EquivalenceClass]:
         self.model.load_test_case(test_case)
         self.executor.load_test_case(test_case)
@@ -384,3 +640,81 @@ class ArchitecturalFuzzer(Fuzzer):
                 return eq_cls
 
         return None
+
+
+class TestCasePipeline:
+    """
+    Prepares test cases in a background thread while the fuzzer measures the previous ones
+    on the executor: the thread generates the programs and the inputs, boosts the inputs,
+    and collects their contract traces (nesting=1).
+
+    The test cases are prepared in the same order and from the same seeds as in the sequential
+    mode, and the state of the random generators at the end of the preparation is stored
+    together with the test case (see Fuzzer.model_access). Hence, the results of fuzzing
+    do not depend on the timing of the threads. They are, however, the same as in the sequential
+    mode only until the first violation: the random values consumed while analysing
+    a violation are not visible to the background thread.
+
+    The model and the generators are shared with the main thread, and all their uses
+    on the main thread must be guarded with Fuzzer.model_access
+    """
+
+    def __init__(self, fuzzer: Fuzzer, num_test_cases: int, num_inputs: int):
+        self.fuzzer = fuzzer
+        self.depth = CONF.fuzzer_pipeline_depth
+        self.lock = threading.Lock()
+        self.queue: queue.Queue = queue.Queue(maxsize=self.depth)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(num_test_cases, num_inputs), daemon=True)
+        self.thread.start()
+
+    def get(self) -> PreparedTestCase:
+        item: Union[PreparedTestCase, BaseException] = self.queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        while self.thread.is_alive():
+            # unblock the thread if it is waiting for a free slot in the queue
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.thread.join()
+
+    def _run(self, num_test_cases: int, num_inputs: int) -> None:
+        try:
+            for i in range(num_test_cases):
+                if self.stop_event.is_set():
+                    return
+                with self.lock:
+                    prepared = self._prepare(i, num_inputs)
+                self._put(prepared)
+        except BaseException as e:  # including SystemExit raised by Logger.error
+            self._put(e)
+
+    def _put(self, item: Union[PreparedTestCase, BaseException]) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _prepare(self, position: int, num_inputs: int) -> PreparedTestCase:
+        fuzzer = self.fuzzer
+
+        # the files of a test case must persist until it is tested; at most depth + 2
+        # test cases exist at the same time (one tested, `depth` queued, one in preparation)
+        asm_path = f"generated{position % (self.depth + 2)}.asm"
+        test_case, inputs = fuzzer.generate_test_case(asm_path, num_inputs)
+
+        fuzzer.model.load_test_case(test_case)
+        boosted_inputs = fuzzer.boost_inputs(inputs, 1)
+        ctraces = fuzzer.model.trace_test_case(boosted_inputs, 1)
+        return PreparedTestCase(test_case, inputs, boosted_inputs, ctraces,
+                                fuzzer.model.get_nesting_limited(), random.getstate(),
+                                fuzzer.input_gen.get_seed())
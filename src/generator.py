@@ -9,7 +9,8 @@ from __future__ import annotations
 import random
 import abc
 import re
-from typing import List, Dict
+import struct
+from typing import List, Dict, Optional
 from subprocess import CalledProcessError, run
 from collections import OrderedDict
 
@@ -38,6 +39,55 @@ def parser_assert(condition: bool, line_number: int, explanation: str):
         raise AsmParserException(line_number, explanation)
 
 
+def get_text_section(elf: bytes) -> bytes:
+    """
+    Extract the content of the .text section from a 64-bit little-endian ELF object
+    (i.e., an in-process equivalent of `objcopy -O binary -j .text`)
+    """
+    if elf[:4] != b"\x7fELF" or elf[4] != 2 or elf[5] != 1:
+        raise GeneratorException("Unsupported object file format: expected ELF64-LE")
+
+    section_table, = struct.unpack_from("<Q", elf, 0x28)
+    entry_size, num_sections, names_index = struct.unpack_from("<HHH", elf, 0x3A)
+
+    def section_header(index: int):
+        # (name, type, flags, address, offset, size)
+        return struct.unpack_from("<IIQQQQ", elf, section_table + index * entry_size)
+
+    names_offset = section_header(names_index)[4]
+    for i in range(num_sections):
+        name, _, _, _, offset, size = section_header(i)
+        name_end = elf.index(b"\0", names_offset + name)
+        if elf[names_offset + name:name_end] == b".text":
+            return elf[offset:offset + size]
+    raise GeneratorException("The object file does not have a .text section")
+
+
+DATA_DIRECTIVES = (".byte", ".bcd", ".value", ".short", ".2byte", ".long", ".4byte", ".quad",
+                   ".8byte")
+
+
+def get_instruction_offsets(listing: str) -> Optional[List[int]]:
+    """
+    Parse an assembler listing (as produced by `as -aln`) and return the offsets of
+    all lines that emitted code. The listing format is:
+        <line> <offset> <bytes>  <tab> <source line>
+        <line>          <more bytes, if the instruction is long>
+
+    Returns None if the listing contains data directives (e.g., `.byte`): a directive may encode
+    several instructions, and their offsets can be found only by disassembling the binary
+    """
+    offsets = []
+    for line in listing.split("\n"):
+        fields = line.split("\t", 1)
+        if len(fields) == 2 and fields[1].strip().lower().startswith(DATA_DIRECTIVES):
+            return None
+        fields = fields[0].split()
+        if len(fields) == 3:
+            offsets.append(int(fields[1], 16))
+    return offsets
+
+
 # ==================================================================================================
 # Generator Interface
 # ==================================================================================================
@@ -132,16 +182,23 @@ class ConfigurableGenerator(Generator, abc.ABC):
             return self.test_case
 
         bin_file = asm_file[:-4] + ".o"
-        self.assemble(asm_file, bin_file)
+        address_list = self.assemble(asm_file, bin_file)
         self.test_case.bin_path = bin_file
 
-        self.map_addresses(self.test_case, bin_file)
+        self.map_addresses(self.test_case, address_list)
+        self.analyse_instructions(self.test_case)
 
         return self.test_case
 
     @staticmethod
-    def assemble(asm_file: str, bin_file: str) -> None:
-        """Assemble the test case into a stripped binary"""
+    def assemble(asm_file: str, bin_file: str) -> Optional[List[int]]:
+        """
+        Assemble the test case into a stripped binary and return the offsets of its instructions.
+        The assembler is the only external process: the binary is extracted from the object
+        file in-process, and the offsets are taken from the assembler listing.
+        Returns None if the offsets could not be derived from the listing
+        (see get_instruction_offsets)
+        """
 
         def pretty_error_msg(error_msg):
             with open(asm_file, "r") as f:
@@ -159,7 +216,7 @@ class ConfigurableGenerator(Generator, abc.ABC):
             return msg
 
         try:
-            out = run(f"as {asm_file} -o {bin_file}", shell=True, check=True, capture_output=True)
+            out = run(["as", "-aln", asm_file, "-o", bin_file], check=True, capture_output=True)
         except CalledProcessError as e:
             error_msg = e.stderr.decode()
             if "Assembler messages:" in error_msg:
@@ -172,8 +229,12 @@ class ConfigurableGenerator(Generator, abc.ABC):
         if "Assembler messages:" in output:
             print("WARNING: [generator]" + pretty_error_msg(output))
 
-        run(f"strip --remove-section=.note.gnu.property {bin_file}", shell=True, check=True)
-        run(f"objcopy {bin_file} -O binary {bin_file}", shell=True, check=True)
+        with open(bin_file, "rb") as f:
+            code = get_text_section(f.read())
+        with open(bin_file, "wb") as out_file:
+            out_file.write(code)
+
+        return get_instruction_offsets(out.stdout.decode())
 
     def load(self, asm_file: str) -> TestCase:
         test_case = TestCase(0)
@@ -310,10 +371,11 @@ class ConfigurableGenerator(Generator, abc.ABC):
                             bb.successors.append(successor)
 
         bin_file = asm_file[:-4] + ".o"
-        self.assemble(asm_file, bin_file)
+        address_list = self.assemble(asm_file, bin_file)
         test_case.bin_path = bin_file
 
-        self.map_addresses(test_case, bin_file)
+        self.map_addresses(test_case, address_list)
+        self.analyse_instructions(test_case)
 
         return test_case
 
@@ -323,9 +385,20 @@ class ConfigurableGenerator(Generator, abc.ABC):
         pass
 
     @abc.abstractmethod
-    def map_addresses(self, test_case: TestCase, bin_file: str) -> None:
+    def map_addresses(self, test_case: TestCase, address_list: Optional[List[int]]) -> None:
+        """
+        Map the instruction offsets returned by `assemble` to the test case instructions.
+        If the offsets are not known (None), they are taken from the disassembled binary
+        """
         pass
 
+    def analyse_instructions(self, test_case: TestCase) -> None:
+        """ Precompute the static properties of all instructions in the address map """
+        test_case.instruction_info = {
+            address: self.target_desc.get_instruction_info(inst)
+            for address, inst in test_case.address_map.items()
+        }
+
     @abc.abstractmethod
     def generate_function(self, name: str) -> Function:
         pass
@@ -8,9 +8,9 @@ import os
 import random
 import numpy as np
 from abc import abstractmethod
-from typing import List
+from typing import List, Dict, Callable
 from .interfaces import Input, InputTaint, InputGenerator
-from .config import CONF
+from .config import CONF, ConfigException
 from .util import Logger
 
 POW32 = pow(2, 32) 
@@ -25,6 +25,10 @@ class InputGeneratorCommon(InputGenerator):
     def __init__(self, seed: int):
         super().__init__(seed)
         self.LOG = Logger()
+        policy = CONF.input_gen_mutation_policy
+        if policy != "none" and policy not in self._mutation_policies:
+            raise ConfigException(f"ERROR: unknown value {policy} of "
+                                  "`input_gen_mutation_policy` configuration option")
 
     def _generate_one(self) -> Input:
         raise NotImplementedError("Genetic input generation is not implemented yet.")
@@ -36,6 +40,10 @@ class InputGeneratorCommon(InputGenerator):
             self._state = random.randint(0, pow(2, 32) - 1)
             self.LOG.inform("input_gen", f"Setting input seed to: {self._state}")
 
+        return self._generate_batch(count)
+
+    def _generate_batch(self, count: int) -> List[Input]:
+        """ Generate a sequence of inputs; subclasses may override it with a faster method """
         generated_inputs = []
         for _ in range(count):
             input_ = self._generate_one()
@@ -46,46 +54,86 @@ class InputGeneratorCommon(InputGenerator):
                                    taints: List[InputTaint]) -> List[Input]:
         """
         Produce a new sequence of random inputs, but copy the tainted values from
-        the base sequence, randomly mutate the input if it is not tainted from tainted
+        the base sequence. Untainted values are occasionally replaced by a mutation of
+        a tainted value of the same base input (see CONF.input_gen_mutation_policy).
+
+        The whole sequence is processed at once, as a (num_inputs, data_size) matrix
         """
         if len(inputs) != len(taints):
             raise Exception("Error: Cannot extend inputs. "
                             "The number of taints does not match the number of inputs.")
+        if not inputs:
+            return []
+
         # this function is technically not a generation function,
         # hence it should not update the global generation seed
         initial_state = self._state
+        new_inputs = self._generate_batch(len(inputs))
+        self._state = initial_state
 
-        # create inputs
-        new_inputs = []
-        for i, input_ in enumerate(inputs):
-            taint = taints[i]
-            new_input = self._generate_one() 
-            t_inputs = self.get_idxs_with_taint(inputs, taints, i)
-            for j in range(input_.data_size):
-                if taint[j]:
-                    new_input[j] = input_[j]
-                else:
-                    #only do these mutations occasionally to cut on cost and have diversity of input
-                    #perhaps this could be more sophisticated, but for now this is fine
-                    #if random.randint(0, 1) == 0:
-                    #t_inputs = self.get_idxs_with_taint(inputs, taints, i)
-                    if (len(t_inputs) >= 1) and random.randint(0, 3) == 0: 
-                        #mutated_input = self.mutate_taint_smart(inputs, taints, i, t_inputs, j)
-                        mutated_input = self.mutate_taint_smart(inputs, taints, i, t_inputs)
-                    #mutated_input = self.mutate(inputs, taints, i, t_inputs)
-                        new_input[j] = mutated_input
-                #elif random.randint(0, 3) == 0:
-                #    mutated_input = self.mutate_dumb(inputs, i)
-                #    new_input[j] = mutated_input
-                #if random.randint(0, 1) == 0:
-                #    mutated_input = self.mutate_dumb(inputs, i)
-                #    new_input[j] = mutated_input
-
-            new_inputs.append(new_input)
+        data_size = inputs[0].data_size
+        base = np.array(inputs, dtype=np.uint64)[:, :data_size]
+        taint = np.array(taints, dtype=bool)[:, :data_size]
+        fresh = np.array(new_inputs, dtype=np.uint64)[:, :data_size]
+        data = np.where(taint, base, fresh)
 
-        self._state = initial_state
+        if CONF.input_gen_mutation_policy != "none":
+            # use the global RNG as the source of entropy, so that the mutations are
+            # reproducible for a given test case, but differ between the calls
+            rng = np.random.default_rng(random.getrandbits(64))
+            self._mutate_untainted(data, base, taint, rng)
+
+        for i, new_input in enumerate(new_inputs):
+            new_input[:data_size] = data[i]
         return new_inputs
 
+    def _mutate_untainted(self, data: np.ndarray, base: np.ndarray, taint: np.ndarray,
+                          rng: np.random.Generator) -> None:
+        """
+        Select a random subset of the untainted lanes in the inputs that have at least one taint,
+        and overwrite them (in `data`) with a mutation of a value of the same base input.
+        As in mutate_taint_smart, the source lane is a random index below the number of
+        tainted lanes of the input (get_random_idx returns a position in the taint list,
+        and it is used as an index into the input)
+        """
+        taint_counts = np.count_nonzero(taint, axis=1)
+        selected = ~taint & (rng.random(taint.shape) < self.MUTATION_PROBABILITY) \
+            & (taint_counts > 0)[:, np.newaxis]
+        rows, cols = np.nonzero(selected)
+        if len(rows) == 0:
+            return
+
+        sources = base[rows, rng.integers(0, taint_counts[rows])]
+
+        mutate = self._mutation_policies[CONF.input_gen_mutation_policy]
+        data[rows, cols] = mutate(self, sources, base[rows, cols], rng)
+
+    def _mutate_smart(self, sources: np.ndarray, _: np.ndarray,
+                      rng: np.random.Generator) -> np.ndarray:
+        """ Vectorized mutate_taint_smart: increment or decrement the value, without wrapping """
+        increment = rng.integers(0, 2, size=len(sources)).astype(bool)
+        increment[sources == UINT_MIN] = True
+        increment[sources == UINT_MAX] = False
+        return np.where(increment, sources + np.uint64(1), sources - np.uint64(1))
+
+    def _mutate_taint_untaint(self, sources: np.ndarray, originals: np.ndarray,
+                              _: np.random.Generator) -> np.ndarray:
+        """ Vectorized mutate_taint_untaint: combine the tainted and the untainted values """
+        return sources | originals
+
+    def _mutate_bit_flip(self, sources: np.ndarray, _: np.ndarray,
+                         rng: np.random.Generator) -> np.ndarray:
+        """ Vectorized mutate: set a random bit in the value """
+        bits = rng.integers(0, 64, size=len(sources), dtype=np.uint64)
+        return sources | (np.uint64(1) << bits)
+
+    MUTATION_PROBABILITY = 0.25
+    _mutation_policies: Dict[str, Callable] = {
+        "smart": _mutate_smart,
+        "taint-untaint": _mutate_taint_untaint,
+        "bit-flip": _mutate_bit_flip,
+    }
+
     def load(self, input_paths: List[str]) -> List[Input]:
         inputs = []
         for input_path in input_paths:
@@ -385,6 +433,30 @@ class NumpyRandomInputGenerator(InputGeneratorCommon):
         self._state += 1
         return input_
 
+    def _generate_batch(self, count: int) -> List[Input]:
+        """
+        Generate all inputs into a single contiguous array (see Input.create_batch).
+        Each input still gets its own seed, so the result is identical to calling
+        _generate_one `count` times, and every input can be re-generated individually
+        """
+        if count == 0:
+            return []
+        inputs = Input.create_batch(count)
+        data_size = inputs[0].data_size
+
+        data = np.empty((count, data_size), dtype=np.uint64)
+        for i, input_ in enumerate(inputs):
+            input_.seed = self._state
+            rng = np.random.default_rng(seed=self._state)
+            data[i] = rng.integers(self.max_input_value, size=data_size, dtype=np.uint64)
+            self._state += 1
+
+        # the post-processing is applied to the whole batch at once
+        data = data << CONF.memory_access_zeroed_bits  # type: ignore
+        batch: np.ndarray = inputs[0].base  # type: ignore
+        batch[:, :data_size] = (data << 32) + data
+        return inputs
+
     
     def mutate_improved(self, inputs: List[Input], taints: List[InputTaint], index_of_input: int, tainted_idx_list: List[int]) -> Input:
         """
@@ -6,8 +6,9 @@ SPDX-License-Identifier: MIT
 """
 from __future__ import annotations
 
+import re
 import shutil
-from typing import List, Dict, Tuple, Optional, NamedTuple
+from typing import List, Dict, Tuple, Optional, NamedTuple, Set
 from collections import defaultdict
 from abc import ABC, abstractmethod
 import numpy as np
@@ -482,12 +483,34 @@ class Function:
         return self._all_bb
 
 
+class InstructionInfo(NamedTuple):
+    """
+    Static properties of an instruction that are required by the dynamic analyses
+    (taint tracking, coverage). They are computed once per test case
+    (see TargetDesc.get_instruction_info), so that the analyses do not need to re-parse
+    the operands every time the instruction is executed.
+    All register names are normalized (see TargetDesc.gpr_normalized).
+    `may_fault` is a conservative estimate: it is False only if the instruction
+    certainly cannot raise an exception
+    """
+    src_regs: Tuple[str, ...]
+    dest_regs: Tuple[str, ...]
+    read_flags: Tuple[str, ...]
+    undef_flags: Tuple[str, ...]
+    write_flags: Tuple[str, ...]
+    mem_address_regs: Tuple[str, ...]
+    mem_operands: Tuple[str, ...]
+    coverage_key: str
+    may_fault: bool
+
+
 class TestCase:
     asm_path: str = ''
     bin_path: str = ''
     main: Function
     functions: List[Function]
     address_map: Dict[int, Instruction]
+    instruction_info: Dict[int, InstructionInfo]
     num_prologue_instructions: int = 0
     faulty_pte: PageTableModifier
     seed: int
@@ -496,6 +519,7 @@ class TestCase:
         self.seed = seed
         self.functions = []
         self.address_map = {}
+        self.instruction_info = {}
         self.faulty_pte = PageTableModifier()
 
     def __iter__(self):
@@ -567,6 +591,24 @@ class Input(np.ndarray):
         if obj is None:
             return
 
+    @classmethod
+    def create_batch(cls, count: int) -> List[Input]:
+        """
+        Create `count` zero-initialized inputs that share a single contiguous
+        (count, aligned_size) array. Each input is a view of one row of the array;
+        the array itself is accessible via the `base` attribute of the inputs.
+        """
+        template = cls()
+        batch = np.zeros((count, len(template)), dtype=np.uint64)
+        inputs = []
+        for i in range(count):
+            input_ = super().__new__(cls, template.shape, np.uint64, batch,  # type: ignore
+                                     i * batch.strides[0], None, None)
+            input_.data_size = template.data_size
+            input_.register_start = template.register_start
+            inputs.append(input_)
+        return inputs
+
     def get_registers(self):
         return list(self[self.register_start:self.data_size - 1])
 
@@ -611,7 +653,7 @@ class InputTaint(np.ndarray):
 
 class Measurement(NamedTuple):
     input_id: InputID
-    input_: Input
+    input_: Optional[Input]  # None if the traces were collected offline (see `analyse` mode)
     ctrace: CTrace
     htrace: HTrace
 
@@ -689,11 +731,48 @@ class TargetDesc(ABC):
     branch_conditions: Dict[str, List[str]]
     gpr_normalized: Dict[str, str]
 
+    fault_free_categories: List[str] = []
+    """ categories of instructions that cannot fault unless they access memory """
+    faulting_instructions: List[str] = []
+    """ instructions (or prefixes) that may fault even within fault-free categories """
+
     @staticmethod
     @abstractmethod
     def is_unconditional_branch(inst: Instruction) -> bool:
         pass
 
+    def get_instruction_info(self, inst: Instruction) -> InstructionInfo:
+        src_regs, dest_regs, mem_address_regs, mem_operands = [], [], [], []
+        read_flags: List[str] = []
+        undef_flags: List[str] = []
+        write_flags: List[str] = []
+        coverage_key = inst.name
+        may_fault = inst.category not in self.fault_free_categories \
+            or any(word in self.faulting_instructions for word in inst.name.split())
+        for op in inst.get_all_operands():
+            coverage_key += "-" + str(op.width) + str(op.type)
+            if isinstance(op, RegisterOperand):
+                # special registers (e.g., control registers) may require privileges
+                may_fault = may_fault or op.value not in self.gpr_normalized
+                value = self.gpr_normalized.get(op.value, op.value)
+                if op.src:
+                    src_regs.append(value)
+                if op.dest:
+                    dest_regs.append(value)
+            elif isinstance(op, FlagsOperand):
+                read_flags = op.get_read_flags()
+                undef_flags = op.get_undef_flags()
+                write_flags = op.get_write_flags()
+            elif isinstance(op, MemoryOperand):
+                mem_operands.append(op.value)
+                for sub_op in re.split(r'\+|-|\*| ', op.value):
+                    if sub_op and sub_op in self.gpr_normalized:
+                        mem_address_regs.append(self.gpr_normalized[sub_op])
+        return InstructionInfo(
+            tuple(src_regs), tuple(dest_regs), tuple(read_flags), tuple(undef_flags),
+            tuple(write_flags), tuple(mem_address_regs), tuple(mem_operands), coverage_key,
+            may_fault or bool(mem_operands))
+
     @staticmethod
     @abstractmethod
     def is_call(inst: Instruction) -> bool:
@@ -742,7 +821,11 @@ class Generator(ABC):
 
     @staticmethod
     @abstractmethod
-    def assemble(asm_file: str, bin_file: str) -> None:
+    def assemble(asm_file: str, bin_file: str) -> Optional[List[int]]:
+        """
+        Assemble the test case and return the offsets of all instructions in the binary,
+        or None if the offsets have to be found by disassembling the binary
+        """
         pass
 
     @abstractmethod
@@ -805,6 +888,10 @@ class Coverage(ABC):
     def get_brief(self) -> str:
         return ""
 
+    def get_covered_points(self) -> Set:
+        """ Get the set of covered points; used to merge coverage collected by several processes """
+        return set()
+
     @abstractmethod
     def load_test_case(self, test_case: TestCase):
         pass
@@ -833,6 +920,16 @@ class Tracer(ABC):
         return self.trace
 
 
+class SpeculationStats(NamedTuple):
+    """
+    Statistics on the speculative execution of a test case on the model:
+    the number of checkpoints taken (i.e., speculation episodes) and
+    the number of memory accesses executed during speculation
+    """
+    checkpoints: int
+    speculative_mem_accesses: int
+
+
 class Model(ABC):
     coverage: Optional[Coverage] = None
     sandbox_base: int = 0
@@ -861,6 +958,23 @@ class Model(ABC):
     def get_taints(self, inputs, nesting) -> List[InputTaint]:
         pass
 
+    def get_speculation_stats(self, inputs: List[Input], nesting: int) \
+            -> Optional[SpeculationStats]:
+        """
+        Trace the inputs and count the speculative behaviour of the model on them.
+        Returns None if the model does not collect the statistics
+        """
+        return None
+
+    def get_nesting_limited(self) -> Optional[List[bool]]:
+        """
+        Report, for each input of the latest trace_test_case call, whether the nesting limit
+        prevented the model from speculating. If it did not, tracing the input with
+        a higher nesting produces the same contract trace (and the same taints).
+        Returns None if the model does not track it
+        """
+        return None
+
     def set_coverage(self, coverage: Coverage):
         self.coverage = coverage
 
@@ -887,6 +1001,13 @@ class Executor(ABC):
     def get_last_feedback(self) -> List:
         pass
 
+    def invalidate_loaded_state(self) -> None:
+        """
+        Notify the executor that the test case and the inputs it has loaded
+        might have been replaced (e.g., by another process sharing the hardware)
+        """
+        pass
+
 
 class Analyser(ABC):
     coverage: Optional[Coverage] = None
@@ -899,6 +1020,14 @@ class Analyser(ABC):
                           stats=False) -> List[EquivalenceClass]:
         pass
 
+    @abstractmethod
+    def filter_violations_from_files(self,
+                                     ctrace_file: str,
+                                     htrace_file: str,
+                                     stats=False) -> List[EquivalenceClass]:
+        """ Same as filter_violations, but for traces stored in files (one trace per line) """
+        pass
+
     def set_coverage(self, coverage: Coverage):
         self.coverage = coverage
 
@@ -918,7 +1047,8 @@ class TaintTrackerInterface(ABC):
     def __init__(self, initial_observations, sandbox_base=0):
         pass
 
-    def start_instruction(self, instruction: Instruction) -> None:
+    def start_instruction(self, instruction: Instruction,
+                          info: Optional[InstructionInfo] = None) -> None:
         pass
 
     def track_memory_access(self, address: int, size: int, is_write: bool) -> None:
@@ -8,18 +8,26 @@ from __future__ import annotations
 from abc import ABC, abstractmethod
 from typing import List, Tuple, Type, Optional, Set, Dict
 
+import atexit
 import copy
+import hashlib
+import multiprocessing
+import pickle
 import re
+import shelve
+from collections import OrderedDict
+import numpy as np
 
 import unicorn as uc
 from unicorn import Uc, UcError, UC_MEM_WRITE, UC_MEM_READ, UC_SECOND_SCALE, UC_HOOK_MEM_READ, \
-    UC_HOOK_MEM_WRITE, UC_HOOK_CODE, UC_HOOK_MEM_UNMAPPED
+    UC_HOOK_MEM_WRITE, UC_HOOK_CODE, UC_HOOK_MEM_UNMAPPED, UC_PROT_ALL
 
 from .interfaces import CTrace, TestCase, Model, InputTaint, Instruction, ExecutionTrace, \
     TracedInstruction, TracedMemAccess, Input, Tracer, \
-    RegisterOperand, FlagsOperand, MemoryOperand, TaintTrackerInterface, TargetDesc
+    RegisterOperand, FlagsOperand, MemoryOperand, TaintTrackerInterface, TargetDesc, \
+    InstructionInfo, SpeculationStats
 from .config import CONF
-from .util import Logger, NotSupportedException
+from .util import Logger, NotSupportedException, STAT
 
 
 # ==================================================================================================
@@ -32,49 +40,78 @@ class UnicornTargetDesc(ABC):
     reg_decode: Dict[str, int]
 
 
+# The contract traces are hashed incrementally, with the same algorithm as CPython uses
+# for tuples (Objects/tupleobject.c), so that the digest of a trace is equal to
+# hash(tuple(normalized_trace))
+HASH_PRIME_1 = 11400714785074694791
+HASH_PRIME_2 = 14029467366897019727
+HASH_PRIME_5 = 2870177450012600261
+HASH_MASK = pow(2, 64) - 1
+
+
 class UnicornTracer(Tracer):
     """
     A simple tracer.
     Collect instructions as they are emulated. See :class:`TracedInstruction`
+
+    The observations are normalized as they are made and folded into a fixed-size digest.
+    The raw observations are stored in `trace` only if `keep_full_trace` is set
+    (e.g., for debugging)
     """
     trace: List[int]
     execution_trace: ExecutionTrace
     instruction_id: int
+    digest: int
+    trace_length: int
+    keep_full_trace: bool = False
 
     def __init__(self):
         super().__init__()
         self.trace = []
+        self.digest = HASH_PRIME_5
+        self.trace_length = 0
         self.LOG = Logger()
 
-    def init_trace(self, emulator, target_desc: UnicornTargetDesc) -> None:
+    def init_trace(self, emulator, target_desc: UnicornTargetDesc, model: UnicornModel) -> None:
         self.trace = []
         self.execution_trace = []
+        self.digest = HASH_PRIME_5
+        self.trace_length = 0
 
     def get_contract_trace(self, model: Model) -> CTrace:
-        # make the trace reproducible by normalizing the addresses
-        normalized_trace: List[int] = []
-        for val in self.trace:
-            if model.code_start <= val and val < (model.code_start + 0x1000):
-                normalized_trace.append(val - model.code_start)
-            elif model.lower_overflow_base < val and val < (model.upper_overflow_base + 0x1000):
-                normalized_trace.append(val - model.sandbox_base)
-            else:
-                normalized_trace.append(val)
-
-        return hash(tuple(normalized_trace))
+        digest = (self.digest + (self.trace_length ^ (HASH_PRIME_5 ^ 3527539))) & HASH_MASK
+        if digest == HASH_MASK:
+            return 1546275796
+        return digest - pow(2, 64) if digest >= pow(2, 63) else digest
 
     def get_contract_trace_full(self) -> List[int]:
+        """ Raw (not normalized) observations; available only if `keep_full_trace` is set """
         return self.trace
 
+    def add_value_to_trace(self, val: int, model) -> None:
+        if self.keep_full_trace:
+            self.trace.append(val)
+
+        # make the trace reproducible by normalizing the addresses
+        if model.code_start <= val and val < (model.code_start + 0x1000):
+            val -= model.code_start
+        elif model.lower_overflow_base < val and val < (model.upper_overflow_base + 0x1000):
+            val -= model.sandbox_base
+
+        digest = (self.digest + (hash(val) & HASH_MASK) * HASH_PRIME_2) & HASH_MASK
+        digest = ((digest << 31) | (digest >> 33)) & HASH_MASK
+        self.digest = (digest * HASH_PRIME_1) & HASH_MASK
+        self.trace_length += 1
+
     def get_execution_trace(self) -> ExecutionTrace:
         return self.execution_trace
 
     def add_mem_address_to_trace(self, address: int, model):
-        self.trace.append(address)
+        self.add_value_to_trace(address, model)
         model.taint_tracker.taint_memory_access_address()
 
     def add_pc_to_trace(self, address, model):
-        self.trace.append(address)
+        self.add_value_to_trace(address, model)
         model.taint_tracker.taint_pc()
 
     def observe_mem_access(self, access, address: int, size: int, value: int,
@@ -116,8 +153,13 @@ class UnicornModel(Model, ABC):
     MAIN_REGION_SIZE = CONF.input_main_region_size
     FAULTY_REGION_SIZE = CONF.input_faulty_region_size
     OVERFLOW_REGION_SIZE = 4096
+    SANDBOX_SIZE = OVERFLOW_REGION_SIZE * 2 + MAIN_REGION_SIZE + FAULTY_REGION_SIZE
+    PAGE_SIZE = 4096
 
     emulator: Uc
+    baseline_context: Optional[object] = None
+    ''' CPU context of the emulator right after its creation; restored on every test case '''
+    loaded_code_size: int = 0
     target_desc: UnicornTargetDesc
     tracer: UnicornTracer
     taint_tracker: TaintTrackerInterface
@@ -133,6 +175,13 @@ class UnicornModel(Model, ABC):
     speculation_window: int = 0
     checkpoints: List[Tuple[object, int, int, int]]
     ''' List of (context : UnicornContext, next_instruction, flags, spec_window)) '''
+    num_checkpoints: int = 0
+    num_speculative_mem_accesses: int = 0
+    ''' Speculation statistics; meaningful only in get_speculation_stats '''
+    nesting_limit_reached: bool = False
+    ''' Set if the nesting limit prevented speculation while executing the current input '''
+    nesting_limited: List[bool]
+    ''' nesting_limit_reached of every input in the latest trace_test_case call '''
 
     store_logs: List[List[Tuple[int, bytes]]]
     previous_store: Tuple[int, int, int, int]
@@ -145,9 +194,18 @@ class UnicornModel(Model, ABC):
     handled_faults: Set[int]
     pending_fault_id: int = 0
     previous_context = None
+    fault_context_offsets: Set[int]
+    ''' offsets of the instructions before which the CPU context is saved '''
     rw_protect: bool = False
     write_protect: bool = False
 
+    # parallel tracing
+    worker_pool: Optional[ModelWorkerPool] = None
+
+    # memoization
+    trace_cache: Optional[ModelTraceCache] = None
+    code_digest: bytes = b""
+
     # set by subclasses
     architecture: Tuple[int, int]
     flags_id: int
@@ -166,8 +224,6 @@ class UnicornModel(Model, ABC):
         self.faulty_region = self.main_region + self.MAIN_REGION_SIZE
         self.stack_base = self.main_region + self.MAIN_REGION_SIZE - 8
 
-        self.overflow_region_values = bytes(self.OVERFLOW_REGION_SIZE)
-
         # taint tracking
         if CONF.contract_observation_clause == 'ctr' or CONF.contract_observation_clause == 'arch':
             self.initial_taints = [
@@ -177,6 +233,8 @@ class UnicornModel(Model, ABC):
         else:
             self.initial_taints = []
 
+        self.nesting_limited = []
+
         # fault handling
         self.pending_fault_id = 0
         self.handled_faults = set()
@@ -206,27 +264,53 @@ class UnicornModel(Model, ABC):
 
     def load_test_case(self, test_case: TestCase) -> None:
         """
-        Instantiate emulator and load input in registers
+        Load the test case into the emulator.
+        The emulator is created only once (see _init_emulator); for all consecutive
+        test cases, we only overwrite the code page and reset the memory permissions
         """
         self.test_case = test_case
+        if CONF.model_lazy_fault_context:
+            info = test_case.instruction_info
+            self.fault_context_offsets = {
+                offset for offset in test_case.address_map
+                if offset not in info or info[offset].may_fault
+            }
+        else:
+            self.fault_context_offsets = set(test_case.address_map)
 
         # create and read a binary
         with open(test_case.bin_path, 'rb') as f:
             code = f.read()
         self.code_end = self.code_start + len(code)
+        self.code_digest = hashlib.blake2b(code, digest_size=16).digest()
+
+        if self.baseline_context is None:
+            self._init_emulator()
+
+        try:
+            # write machine code to be emulated to memory;
+            # the remainder of the previous test case is zeroed, as if the page was freshly mapped
+            padding = bytes(max(self.loaded_code_size - len(code), 0))
+            self.emulator.mem_write(self.code_start, code + padding)
+            self.loaded_code_size = len(code)
+
+            # drop the leftovers of the previous test case
+            self.emulator.mem_protect(self.lower_overflow_base, self.SANDBOX_SIZE, UC_PROT_ALL)
+        except UcError as e:
+            self.LOG.error("[UnicornModel:load_test_case] %s" % e)
 
+    def _init_emulator(self) -> None:
+        """
+        Instantiate the emulator, allocate memory, and set up callbacks.
+        Called only once per model, on the first test case
+        """
         # initialize emulator in x86-64 mode
         emulator = Uc(*self.architecture)
 
         try:
             # allocate memory
             emulator.mem_map(self.code_start, self.CODE_SIZE)
-            sandbox_size = \
-                self.OVERFLOW_REGION_SIZE * 2 + self.MAIN_REGION_SIZE + self.FAULTY_REGION_SIZE
-            emulator.mem_map(self.sandbox_base - self.OVERFLOW_REGION_SIZE, sandbox_size)
-
-            # write machine code to be emulated to memory
-            emulator.mem_write(self.code_start, code)
+            emulator.mem_map(self.lower_overflow_base, self.SANDBOX_SIZE)
 
             # set up callbacks
             emulator.hook_add(UC_HOOK_MEM_READ | UC_HOOK_MEM_WRITE, self.trace_mem_access, self)
@@ -234,9 +318,36 @@ class UnicornModel(Model, ABC):
             emulator.hook_add(UC_HOOK_CODE, self.instruction_hook, self)
 
             self.emulator = emulator
+            self.baseline_context = emulator.context_save()
+            self.loaded_code_size = 0
 
         except UcError as e:
-            self.LOG.error("[UnicornModel:load_test_case] %s" % e)
+            self.LOG.error("[UnicornModel:_init_emulator] %s" % e)
+
+    def _reset_sandbox(self, image: np.ndarray) -> None:
+        """
+        Bring the sandbox memory (including the overflow regions) into the state described
+        by `image`. Only the pages that differ from the current memory contents are rewritten
+        """
+        assert image.nbytes == self.SANDBOX_SIZE
+        current = np.frombuffer(
+            self.emulator.mem_read(self.lower_overflow_base, self.SANDBOX_SIZE), dtype=np.uint64)
+        dirty_pages = np.any((current != image).reshape(-1, self.PAGE_SIZE // 8), axis=1)
+
+        # write contiguous sequences of dirty pages with a single call
+        page_id = 0
+        num_pages = len(dirty_pages)
+        while page_id < num_pages:
+            if not dirty_pages[page_id]:
+                page_id += 1
+                continue
+            first_page = page_id
+            while page_id < num_pages and dirty_pages[page_id]:
+                page_id += 1
+            start = first_page * self.PAGE_SIZE
+            end = page_id * self.PAGE_SIZE
+            self.emulator.mem_write(self.lower_overflow_base + start,
+                                    image.view(np.uint8)[start:end].tobytes())
 
     @abstractmethod
     def _load_input(self, input_: Input):
@@ -247,17 +358,48 @@ class UnicornModel(Model, ABC):
 
     def _execute_test_case(self, inputs: List[Input], nesting: int):
         """
-        Architecture independent code - it starts the emulator
+        Architecture independent code - it starts the emulator.
+        If configured (CONF.model_workers), the inputs are traced in parallel by a pool of
+        worker processes, each with its own emulator
+        """
+        if self._is_parallel_tracing_applicable(inputs):
+            assert self.worker_pool is not None
+            contract_traces, execution_traces, taints, nesting_limited = \
+                self.worker_pool.trace(self, inputs, nesting)
+        else:
+            contract_traces, execution_traces, taints, nesting_limited = \
+                self._execute_inputs(inputs, nesting)
+
+        if self.coverage:
+            self.coverage.model_hook(execution_traces)
+
+        return contract_traces, taints, nesting_limited
+
+    def _is_parallel_tracing_applicable(self, inputs: List[Input]) -> bool:
+        # small batches are not worth the IPC overhead; also, the debug output would be
+        # interleaved, and the full traces would be collected in the workers, not in this process
+        if self.worker_pool is None or self.LOG.dbg_model or self.tracer.keep_full_trace:
+            return False
+        return len(inputs) >= 2 * ModelWorkerPool.MIN_INPUTS_PER_WORKER
+
+    def _execute_inputs(self, inputs: List[Input], nesting: int) \
+            -> Tuple[List[CTrace], List[ExecutionTrace], List[InputTaint], List[bool]]:
+        """
+        Trace the inputs one by one on the loaded test case.
+        The CPU context is restored before every input, so the results for an input
+        do not depend on the inputs executed before it
         """
         self.nesting = nesting
 
         contract_traces: List[CTrace] = []
         execution_traces: List[ExecutionTrace] = []
         taints = []
+        nesting_limited: List[bool] = []
 
         for index, input_ in enumerate(inputs):
             self.LOG.dbg_model_header(index)
 
+            self.emulator.context_restore(self.baseline_context)
             self._load_input(input_)
             self.reset_model()
             start_address = self.code_start
@@ -276,6 +418,17 @@ class UnicornModel(Model, ABC):
 
                 # handle faults
                 if self.pending_fault_id:
+                    if self.previous_context is None:
+                        # the instruction was wrongly considered fault-free, hence there is
+                        # no context to recover from the fault: save the context before every
+                        # instruction of this test case and re-run the input from the start
+                        self._disable_lazy_fault_context()
+                        self.emulator.context_restore(self.baseline_context)
+                        self._load_input(input_)
+                        self.reset_model()
+                        start_address = self.code_start
+                        continue
+
                     # workaround for a Unicorn bug: after catching an exception
                     # we need to restore some pre-exception context. otherwise,
                     # the emulator becomes corrupted
@@ -303,29 +456,122 @@ class UnicornModel(Model, ABC):
             contract_traces.append(self.tracer.get_contract_trace(self))
             execution_traces.append(self.tracer.get_execution_trace())
             taints.append(self.taint_tracker.get_taint())
-
-        if self.coverage:
-            self.coverage.model_hook(execution_traces)
-
-        return contract_traces, taints
+            nesting_limited.append(self.nesting_limit_reached)
+
+        return contract_traces, execution_traces, taints, nesting_limited
+
+    def _disable_lazy_fault_context(self) -> None:
+        all_offsets = set(self.test_case.address_map)
+        if self.fault_context_offsets == all_offsets:
+            # cannot happen: the context is saved before every instruction
+            self.LOG.error(f"Fault {self.pending_fault_id} without a saved context in"
+                           f" {self.current_instruction}")
+        self.LOG.warning(
+            "model", f"Fault {self.pending_fault_id} in an instruction that was considered"
+            f" fault-free: {self.current_instruction}. Saving the context before every"
+            " instruction of this test case")
+        self.fault_context_offsets = all_offsets
 
     def trace_test_case(self, inputs, nesting):
         """
         Enables tracing and starts the emulator
         """
+        results = self._execute_with_cache(inputs, nesting, tainting=False)
+        self.nesting_limited = [limited for _, limited in results]
+        return [ctrace for ctrace, _ in results]
+
+    def get_nesting_limited(self) -> List[bool]:
+        return self.nesting_limited
+
+    def get_speculation_stats(self, inputs: List[Input], nesting: int) -> SpeculationStats:
+        """
+        Trace the inputs and count the checkpoints and the speculative memory accesses.
+        The inputs are always traced in this process, as the counters are not collected
+        from the parallel workers
+        """
+        self.num_checkpoints = 0
+        self.num_speculative_mem_accesses = 0
+        self._execute_inputs(inputs, nesting)
+        return SpeculationStats(self.num_checkpoints, self.num_speculative_mem_accesses)
+
+    def get_taints(self, inputs, nesting):
+        return self._execute_with_cache(inputs, nesting, tainting=True)
+
+    def _execute_with_cache(self, inputs: List[Input], nesting: int, tainting: bool) -> List:
+        """
+        Collect the contract traces together with the nesting_limit_reached flags (or the taints,
+        if `tainting` is set) of the inputs.
+        If the model has a trace cache, only the inputs without cached results are executed
+        """
+        cache = self.trace_cache
+        if cache is None or not self._is_caching_applicable():
+            return self._execute_without_cache(inputs, nesting, tainting)
+
+        keys = self._get_cache_keys(inputs, nesting, tainting)
+        results = [cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        STAT.model_cache_hits += len(inputs) - len(missing)
+
+        if missing:
+            new_results = self._execute_without_cache([inputs[i] for i in missing], nesting,
+                                                      tainting)
+            for i, result in zip(missing, new_results):
+                # taints are stored as bitmaps to save memory
+                cache.put(keys[i], np.packbits(result).tobytes() if tainting else result)
+                results[i] = result
+
+        if tainting:
+            for i, result in enumerate(results):
+                if isinstance(result, bytes):
+                    taint = InputTaint()
+                    taint[:] = np.unpackbits(np.frombuffer(result, dtype=np.uint8),
+                                             count=taint.size)
+                    results[i] = taint
+        return results
+
+    def _execute_without_cache(self, inputs: List[Input], nesting: int, tainting: bool) -> List:
+        if tainting:
+            self.tainting_enabled = True
+            _, taints, _ = self._execute_test_case(inputs, nesting)
+            self.tainting_enabled = False
+            return taints
+
         self.execution_tracing_enabled = True
-        ctraces, _ = self._execute_test_case(inputs, nesting)
+        ctraces, _, nesting_limited = self._execute_test_case(inputs, nesting)
         self.execution_tracing_enabled = False
-        return ctraces
+        return list(zip(ctraces, nesting_limited))
 
-    def get_taints(self, inputs, nesting):
-        self.tainting_enabled = True
-        _, taints = self._execute_test_case(inputs, nesting)
-        self.tainting_enabled = False
-        return taints
+    def _is_caching_applicable(self) -> bool:
+        # the cache stores neither the execution traces (needed for coverage), nor the full
+        # contract traces, nor the debug output
+        return CONF.coverage_type == 'none' and not self.tracer.keep_full_trace \
+            and not self.LOG.dbg_model
+
+    def _get_cache_keys(self, inputs: List[Input], nesting: int, tainting: bool) -> List[str]:
+        """
+        The results of the model depend only on the binary of the test case, its page table
+        modifier, the contract, the model configuration, the nesting, and the input. Hence,
+        they are content-addressed by a hash of these values
+        """
+        contract = (type(self).__name__, type(self.tracer).__name__,
+                    self.taint_tracker_cls.__name__ if tainting else "",
+                    CONF.contract_observation_clause, CONF.permitted_faults,
+                    CONF.model_max_spec_window, CONF.model_lazy_fault_context,
+                    CONF.input_main_region_size, CONF.input_faulty_region_size,
+                    self.sandbox_base, self.code_start, tuple(self.test_case.faulty_pte), nesting)
+        prefix = hashlib.blake2b(self.code_digest + repr(contract).encode(), digest_size=16)
+        keys = []
+        for input_ in inputs:
+            input_hash = prefix.copy()
+            input_hash.update(input_.tobytes())
+            keys.append(input_hash.hexdigest())
+        return keys
 
     def dbg_get_trace_detailed(self, input, nesting) -> List[str]:
-        _, __ = self._execute_test_case([input], nesting)
+        keep_full_trace = self.tracer.keep_full_trace
+        self.tracer.keep_full_trace = True
+        self._execute_test_case([input], nesting)
+        self.tracer.keep_full_trace = keep_full_trace
         trace = self.tracer.get_contract_trace_full()
         normalized_trace = []
         for val in trace:
@@ -341,7 +587,8 @@ class UnicornModel(Model, ABC):
         self.checkpoints = []
         self.in_speculation = False
         self.speculation_window = 0
-        self.tracer.init_trace(self.emulator, self.target_desc)
+        self.nesting_limit_reached = False
+        self.tracer.init_trace(self.emulator, self.target_desc, self)
         if self.tainting_enabled:
             self.taint_tracker = self.taint_tracker_cls(self.initial_taints, self.sandbox_base)
         else:
@@ -405,8 +652,13 @@ class UnicornModel(Model, ABC):
         Invoked when an instruction is executed.
         it records instruction
         """
-        model.previous_context = model.emulator.context_save()
-        model.current_instruction = model.test_case.address_map[address - model.code_start]
+        offset = address - model.code_start
+        if offset in model.fault_context_offsets:
+            model.previous_context = model.emulator.context_save()
+        else:
+            # the instruction cannot fault, hence the context will not be needed
+            model.previous_context = None
+        model.current_instruction = model.test_case.address_map[offset]
         model.trace_instruction(emulator, address, size, model)
 
     def handle_fault(self, errno: int) -> int:
@@ -459,12 +711,382 @@ class UnicornModel(Model, ABC):
         return 0
 
 
+# ==================================================================================================
+# Parallel Tracing
+# ==================================================================================================
+_worker_model: Optional[UnicornModel] = None
+_worker_test_case_id: int = -1
+
+
+def _init_worker(model: UnicornModel) -> None:
+    """
+    Called once in every worker process. The worker receives a (forked) copy of the model,
+    but the emulator of the parent process cannot be shared: drop it, and let the worker create
+    its own emulator when it loads the first test case
+    """
+    global _worker_model
+    model.baseline_context = None
+    model.worker_pool = None
+    model.trace_cache = None
+    model.coverage = None
+    _worker_model = model
+
+
+def _trace_in_worker(task: Tuple[int, bytes, np.ndarray, List[int], int, bool, bool]) \
+        -> Tuple[List[CTrace], List[ExecutionTrace], np.ndarray, List[bool]]:
+    """ Trace a shard of inputs in a worker process """
+    global _worker_test_case_id
+    test_case_id, test_case_data, input_data, seeds, nesting, tainting, tracing = task
+    model = _worker_model
+    assert model is not None
+
+    # the test case is re-loaded only when it changes
+    if test_case_id != _worker_test_case_id:
+        model.load_test_case(pickle.loads(test_case_data))
+        _worker_test_case_id = test_case_id
+
+    inputs = []
+    for data, seed in zip(input_data, seeds):
+        input_ = Input()
+        input_[:] = data
+        input_.seed = seed
+        inputs.append(input_)
+
+    model.tainting_enabled = tainting
+    model.execution_tracing_enabled = tracing
+    ctraces, execution_traces, taints, nesting_limited = model._execute_inputs(inputs, nesting)
+    return ctraces, execution_traces, np.array(taints, dtype=bool), nesting_limited
+
+
+class ModelWorkerPool:
+    """
+    A pool of processes that trace inputs in parallel.
+    Each worker holds a copy of the model (with its own emulator) and traces a contiguous shard
+    of the input list; the results are merged back in the input order.
+
+    The workers are forked from the process that created the pool, and thus they inherit
+    the configuration at the moment of the pool creation. Hence, the pool has to be created
+    in the main thread (see factory.get_model), before any other threads are started
+    """
+    MIN_INPUTS_PER_WORKER = 4
+
+    def __init__(self, model: UnicornModel, num_workers: int):
+        self.num_workers = num_workers
+        context = multiprocessing.get_context("fork")
+        self.pool = context.Pool(num_workers, initializer=_init_worker, initargs=(model,))
+        atexit.register(self.close)
+
+        self.test_case: Optional[TestCase] = None
+        self.test_case_id = 0
+        self.test_case_data = b""
+
+    def trace(self, model: UnicornModel, inputs: List[Input], nesting: int) \
+            -> Tuple[List[CTrace], List[ExecutionTrace], List[InputTaint], List[bool]]:
+        if model.test_case is not self.test_case:
+            self._set_test_case(model.test_case)
+
+        # split the inputs into contiguous shards of (almost) equal size
+        num_shards = min(self.num_workers, len(inputs) // self.MIN_INPUTS_PER_WORKER)
+        num_shards = max(num_shards, 1)
+        bounds = np.linspace(0, len(inputs), num_shards + 1, dtype=int)
+        input_data = np.stack(inputs)
+        tasks = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            seeds = [input_.seed for input_ in inputs[start:end]]
+            tasks.append((self.test_case_id, self.test_case_data, input_data[start:end], seeds,
+                          nesting, model.tainting_enabled, model.execution_tracing_enabled))
+
+        # merge the results
+        contract_traces: List[CTrace] = []
+        execution_traces: List[ExecutionTrace] = []
+        taints: List[InputTaint] = []
+        nesting_limited: List[bool] = []
+        for shard_ctraces, shard_execution_traces, shard_taints, shard_nesting_limited in \
+                self.pool.map(_trace_in_worker, tasks):
+            contract_traces.extend(shard_ctraces)
+            execution_traces.extend(shard_execution_traces)
+            nesting_limited.extend(shard_nesting_limited)
+            for taint_data in shard_taints:
+                taint = InputTaint()
+                taint[:] = taint_data
+                taints.append(taint)
+        return contract_traces, execution_traces, taints, nesting_limited
+
+    def _set_test_case(self, test_case: TestCase) -> None:
+        """
+        Prepare a compact copy of the test case for the workers:
+        the model needs only the binary and the address map, so we skip the CFG
+        and unlink the instructions (otherwise, pickle would recurse over the whole program)
+        """
+        compact = TestCase(test_case.seed)
+        compact.asm_path = test_case.asm_path
+        compact.bin_path = test_case.bin_path
+        compact.num_prologue_instructions = test_case.num_prologue_instructions
+        compact.faulty_pte = test_case.faulty_pte
+        for address, inst in test_case.address_map.items():
+            inst_copy = copy.copy(inst)
+            inst_copy.next = None
+            inst_copy.previous = None
+            compact.address_map[address] = inst_copy
+        compact.instruction_info = test_case.instruction_info
+
+        self.test_case = test_case
+        self.test_case_id += 1
+        self.test_case_data = pickle.dumps(compact)
+
+    def close(self) -> None:
+        self.pool.terminate()
+        self.pool.join()
+
+
+# ==================================================================================================
+# Memoization
+# ==================================================================================================
+class ModelTraceCache:
+    """
+    A cache of the model results (contract traces and taints) with LRU replacement.
+    The entries are content-addressed (see UnicornModel._get_cache_keys), and thus they stay
+    valid across test cases.
+    If `path` is set, the entries are also stored in a file, and reused by the consecutive
+    fuzzing campaigns
+    """
+
+    def __init__(self, size: int, path: str = ""):
+        self.size = size
+        self.entries: OrderedDict[str, object] = OrderedDict()
+        self.storage: Optional[shelve.Shelf] = None
+        if path:
+            self.storage = shelve.open(path)
+            atexit.register(self.storage.close)
+
+    def get(self, key: str) -> Optional[object]:
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.storage is not None and key in self.storage:
+            value = self.storage[key]
+            self._add(key, value)
+            return value
+        return None
+
+    def put(self, key: str, value: object) -> None:
+        self._add(key, value)
+        if self.storage is not None:
+            self.storage[key] = value
+
+    def _add(self, key: str, value: object) -> None:
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class BitsetTaintTracker(TaintTrackerInterface):
+    """
+    A faster version of BaseTaintTracker with identical semantics.
+
+    Each label (register, flag, or 8-byte memory slot) is identified by an integer index,
+    and sets of labels are represented as bitsets (Python ints). Registers and flags occupy
+    the lowest indexes, followed by memory slots.
+    The dependency tables are copied lazily (copy-on-write), so that checkpoints are O(1)
+    """
+    strict_undefined: bool = True
+    _instruction: Optional[Instruction] = None
+    sandbox_base: int = 0
+
+    src_regs: List[int]
+    dest_regs: List[int]
+    src_flags: List[int]
+    dest_flags: List[int]
+    src_mems: List[int]
+    dest_mems: List[int]
+    mem_address_regs: List[int]
+    pending_taint: List[int]
+
+    # label -> bitset of labels it depends on; registers and memory slots share the table
+    dependencies: Dict[int, int]
+    flag_dependencies: Dict[int, int]
+    tainted_labels: int
+
+    # ISA-specific fields
+    unicorn_target_desc: UnicornTargetDesc
+    target_desc: TargetDesc
+    _registers: List[int]
+
+    # per-class tables of register/flag labels; initialized by _init_label_tables
+    _label_ids: Dict[str, int]
+    _label_names: List[str]
+    _label_register_ids: List[int]
+    _num_reg_labels: int
+
+    def __init__(self, initial_observations, sandbox_base=0):
+        if "_label_ids" not in self.__class__.__dict__:
+            self._init_label_tables()
+        self.initial_observations = initial_observations
+        self.sandbox_base = sandbox_base
+        self.dependencies = {}
+        self.flag_dependencies = {}
+        self.tainted_labels = 0
+        for label in initial_observations:
+            self.tainted_labels |= 1 << self._label_ids[label]
+        self.checkpoints: List[Tuple[Dict[int, int], Dict[int, int]]] = []
+        self._dependencies_shared = False
+
+    @classmethod
+    def _init_label_tables(cls):
+        """ Assign an index to each register/flag label and map it to a register in inputs """
+        cls._label_names = sorted(set(cls.target_desc.gpr_normalized.values()))
+        cls._label_ids = {name: i for i, name in enumerate(cls._label_names)}
+        cls._num_reg_labels = len(cls._label_names)
+
+        cls._label_register_ids = []
+        for name in cls._label_names:
+            reg = cls.unicorn_target_desc.reg_decode.get(name, -1)
+            cls._label_register_ids.append(
+                cls._registers.index(reg) if reg in cls._registers else -1)
+
+    def _mem_label(self, slot: int) -> int:
+        """ Index of an 8-byte memory slot; negative slots (below the sandbox) are interleaved """
+        return self._num_reg_labels + (2 * slot if slot >= 0 else -2 * slot - 1)
+
+    def _mem_slot(self, label: int) -> int:
+        zigzag = label - self._num_reg_labels
+        return zigzag // 2 if zigzag % 2 == 0 else -(zigzag + 1) // 2
+
+    def get_label_names(self, labels: int) -> Set[str]:
+        """ Convert a bitset into a set of labels in the format of BaseTaintTracker """
+        names = set()
+        while labels:
+            lowest = labels & -labels
+            label = lowest.bit_length() - 1
+            labels ^= lowest
+            if label < self._num_reg_labels:
+                names.add(self._label_names[label])
+            else:
+                names.add(hex(self._mem_slot(label) * 8))
+        return names
+
+    def start_instruction(self, instruction, info: Optional[InstructionInfo] = None):
+        """
+        Collect source and target registers/flags.
+        The operands are taken from the precomputed `info` if it is available
+        (see TestCase.instruction_info); otherwise, they are extracted from the instruction
+        """
+        if self._instruction:
+            self._finalize_instruction()  # finalize the previous instruction
+
+        if info is None:
+            info = self.target_desc.get_instruction_info(instruction)
+
+        label_ids = self._label_ids
+        self._instruction = instruction
+        self.src_regs = [label_ids[r] for r in info.src_regs]
+        self.dest_regs = [label_ids[r] for r in info.dest_regs]
+        self.src_flags = [label_ids[f] for f in info.read_flags]
+        if self.strict_undefined:
+            self.src_flags.extend(label_ids[f] for f in info.undef_flags)
+        self.dest_flags = [label_ids[f] for f in info.write_flags]
+        self.mem_address_regs = [label_ids[r] for r in info.mem_address_regs]
+        self.src_mems = []
+        self.dest_mems = []
+        self.pending_taint = []
+
+    def _finalize_instruction(self):
+        """Propagate dependencies from source operands to destinations """
+        dependencies = self.dependencies
+        flag_dependencies = self.flag_dependencies
+
+        # Compute source labels
+        src_labels = 0
+        for label in self.src_regs:
+            src_labels |= dependencies.get(label, 1 << label)
+        for label in self.src_flags:
+            src_labels |= flag_dependencies.get(label, 1 << label)
+        for label in self.src_mems:
+            src_labels |= dependencies.get(label, 1 << label)
+
+        # Propagate labels to all targets
+        if self.dest_regs or self.dest_flags or self.dest_mems:
+            if self._dependencies_shared:
+                dependencies = self.dependencies = dict(dependencies)
+                flag_dependencies = self.flag_dependencies = dict(flag_dependencies)
+                self._dependencies_shared = False
+            for label in self.dest_regs:
+                dependencies[label] = dependencies.get(label, 1 << label) | src_labels
+            for label in self.dest_mems:
+                dependencies[label] = dependencies.get(label, 1 << label) | src_labels
+            for label in self.dest_flags:
+                flag_dependencies[label] = flag_dependencies.get(label, 1 << label) | src_labels
+
+        # Update taints
+        for label in self.pending_taint:
+            self.tainted_labels |= dependencies.get(label, 1 << label)
+
+        self._instruction = None
+
+    def track_memory_access(self, address: int, size: int, is_write: bool):
+        """ Tracking concrete memory accesses """
+        # we taint at the granularity of 8 bytes
+        address -= self.sandbox_base
+        track_list = self.dest_mems if is_write else self.src_mems
+        for slot in range(address >> 3, ((address + size - 1) >> 3) + 1):
+            track_list.append(self._mem_label(slot))
+
+    def taint_pc(self):
+        if self._instruction and self._instruction.control_flow:
+            self.pending_taint.append(self._label_ids["RIP"])
+
+    def taint_memory_access_address(self):
+        self.pending_taint.extend(self.mem_address_regs)
+
+    def taint_memory_load(self):
+        self.pending_taint.extend(self.src_mems)
+
+    def taint_memory_store(self):
+        self.pending_taint.extend(self.dest_mems)
+
+    def checkpoint(self):
+        if self._instruction:
+            self._finalize_instruction()
+        self.checkpoints.append((self.dependencies, self.flag_dependencies))
+        self._dependencies_shared = True
+
+    def rollback(self):
+        assert self.checkpoints, "There are no more checkpoints"
+        if self._instruction:
+            self._finalize_instruction()
+        self.dependencies, self.flag_dependencies = self.checkpoints.pop()
+        # the restored tables may still be referenced by the older checkpoints
+        self._dependencies_shared = True
+
+    def get_taint(self) -> InputTaint:
+        if self._instruction:
+            self._finalize_instruction()
+
+        taint = InputTaint()
+        taint.fill(False)
+        labels = self.tainted_labels
+        while labels:
+            lowest = labels & -labels
+            label = lowest.bit_length() - 1
+            labels ^= lowest
+            if label < self._num_reg_labels:
+                register_id = self._label_register_ids[label]
+                if register_id < 0:
+                    continue
+                input_offset = taint.register_start + register_id
+            else:
+                input_offset = self._mem_slot(label)
+            if 0 <= input_offset < taint.size:
+                taint[input_offset] = True
+        return taint
+
+
 # ==================================================================================================
 # Implementation of Observation Clauses
 # ==================================================================================================
 class L1DTracer(UnicornTracer):
 
-    def init_trace(self, _, __):
+    def init_trace(self, _, __, ___):
         self.trace = [0, 0]
         self.execution_trace = []
 
@@ -533,9 +1155,10 @@ class CTRTracer(CTTracer):
     When execution starts we also observe registers state.
     """
 
-    def init_trace(self, emulator: Uc, target_desc: UnicornTargetDesc):
-        self.trace = [emulator.reg_read(reg) for reg in target_desc.registers]
-        self.execution_trace = []
+    def init_trace(self, emulator: Uc, target_desc: UnicornTargetDesc, model: UnicornModel):
+        super().init_trace(emulator, target_desc, model)
+        for reg in target_desc.registers:
+            self.add_value_to_trace(emulator.reg_read(reg), model)
 
 
 class ArchTracer(CTRTracer):
@@ -546,7 +1169,7 @@ class ArchTracer(CTRTracer):
     def observe_mem_access(self, access, address, size, value, model: UnicornModel):
         if access == UC_MEM_READ:
             val = int.from_bytes(model.emulator.mem_read(address, size), byteorder='little')
-            self.trace.append(val)
+            self.add_value_to_trace(val, model)
             model.taint_tracker.taint_memory_load()
         super(ArchTracer, self).observe_mem_access(access, address, size, value, model)
 
@@ -557,10 +1180,11 @@ class GPRTracer(UnicornTracer):
     It returns the values of all GPRs after the test case finished its execution.
     """
 
-    def init_trace(self, emulator: Uc, target_desc: UnicornTargetDesc) -> None:
+    def init_trace(self, emulator: Uc, target_desc: UnicornTargetDesc,
+                   model: UnicornModel) -> None:
         self.emulator = emulator
         self.target_desc = target_desc
-        return super().init_trace(emulator, target_desc)
+        return super().init_trace(emulator, target_desc, model)
 
     def get_contract_trace(self, _) -> CTrace:
         self.trace = [self.emulator.reg_read(reg) for reg in self.target_desc.registers]
@@ -580,7 +1204,10 @@ class UnicornSeq(UnicornModel):
 
     @staticmethod
     def trace_instruction(_, address, size, model) -> None:
-        model.taint_tracker.start_instruction(model.current_instruction)
+        if model.tainting_enabled:
+            model.taint_tracker.start_instruction(
+                model.current_instruction,
+                model.test_case.instruction_info.get(address - model.code_start))
         model.tracer.observe_instruction(address, size, model)
 
     @staticmethod
@@ -613,6 +1240,8 @@ class UnicornSpec(UnicornModel):
         # when in speculation, log all changes to memory
         if access == UC_MEM_WRITE and model.store_logs:
             model.store_logs[-1].append((address, emulator.mem_read(address, 8)))
+        if model.in_speculation:
+            model.num_speculative_mem_accesses += 1
 
         UnicornSeq.trace_mem_access(emulator, access, address, size, value, model)
         model.speculate_mem_access(emulator, access, address, size, value, model)
@@ -646,6 +1275,7 @@ class UnicornSpec(UnicornModel):
         self.checkpoints.append((context, next_instruction, flags, spec_window))
         self.store_logs.append([])
         self.in_speculation = True
+        self.num_checkpoints += 1
         self.taint_tracker.checkpoint()
 
     def rollback(self) -> int:
@@ -719,6 +1349,8 @@ class UnicornBpas(UnicornSpec):
     def speculate_instruction(emulator: Uc, address, _, model) -> None:
         # reached max spec. window? skip
         if len(model.checkpoints) >= model.nesting:
+            if model.previous_store[0]:
+                model.nesting_limit_reached = True
             model.previous_store = (0, 0, 0, 0)  # clear pending speculation requests
             return
 
@@ -784,8 +1416,11 @@ class BaseTaintTracker(TaintTrackerInterface):
         self.tainted_labels = set(self.initial_observations)
         self.checkpoints = []
 
-    def start_instruction(self, instruction):
-        """ Collect source and target registers/flags """
+    def start_instruction(self, instruction, info=None):
+        """
+        Collect source and target registers/flags.
+        This (reference) implementation always parses the operands and ignores `info`
+        """
         if self._instruction:
             self._finalize_instruction()  # finalize the previous instruction
 
@@ -2,9 +2,12 @@
 Copyright (C) Microsoft Corporation
 SPDX-License-Identifier: MIT
 """
+import os
+import tempfile
 import unittest
 from src.analyser import EquivalenceAnalyser
 from src.interfaces import Input
+from src.config import CONF
 
 
 class AnalyserTest(unittest.TestCase):
@@ -43,3 +46,45 @@ class AnalyserTest(unittest.TestCase):
         clss = analyser._build_equivalence_classes([dummy_input] * 4, [1, 2, 2, 2], [1, 2, 3, 4])
         self.assertEqual(len(clss), 1)
         self.assertEqual(clss[0].ctrace, 2)
+
+    def test_build_candidate_classes(self):
+        analyser = EquivalenceAnalyser()
+        dummy_input = Input()
+
+        # only the classes with several distinct htraces are built
+        clss = analyser._build_candidate_classes([dummy_input] * 6, [3, 1, 1, 3, 2, 2],
+                                                 [1, 2, 3, 4, 5, 5])
+        self.assertEqual(len(clss), 2)
+        self.assertEqual(clss[0].ctrace, 1)
+        self.assertEqual([m.input_id for m in clss[0].measurements], [1, 2])
+        self.assertEqual(list(clss[0].htrace_map.keys()), [2, 3])
+        self.assertEqual(clss[1].ctrace, 3)
+        self.assertEqual([m.input_id for m in clss[1].measurements], [0, 3])
+
+        # traces that do not fit into 64 bits
+        big = pow(2, 100)
+        clss = analyser._build_candidate_classes([dummy_input] * 3, [-1, big, big], [1, 1, 2])
+        self.assertEqual(len(clss), 1)
+        self.assertEqual(clss[0].ctrace, big)
+
+    def test_filter_violations_from_files(self):
+        analyser = EquivalenceAnalyser()
+        ctraces = [3, 1, 1, 3, 2, 2, 1]
+        htraces = [1, 2, 3, 1, 5, 5, 2]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ctrace_file, htrace_file = os.path.join(tmp_dir, "c"), os.path.join(tmp_dir, "h")
+            with open(ctrace_file, "w") as f:
+                f.write("".join(f"{c}\n" for c in ctraces))
+            with open(htrace_file, "w") as f:
+                f.write("".join(f"{h}\n" for h in htraces))
+
+            prev_permit_subsets = CONF.analyser_permit_subsets
+            CONF.analyser_permit_subsets = False
+            violations = analyser.filter_violations_from_files(ctrace_file, htrace_file)
+            CONF.analyser_permit_subsets = prev_permit_subsets
+
+        self.assertEqual(len(violations), 1)
+        self.assertEqual(violations[0].ctrace, 1)
+        htrace_map = violations[0].htrace_map
+        self.assertEqual({h: [m.input_id for m in ms] for h, ms in htrace_map.items()},
+                         {2: [1, 6], 3: [2]})
@@ -0,0 +1,126 @@
+"""
+Copyright (C) Microsoft Corporation
+SPDX-License-Identifier: MIT
+"""
+import os
+import unittest
+import threading
+from copy import deepcopy
+from typing import List
+
+from src.campaign import FuzzingCampaign, SharedExecutor
+from src.interfaces import Executor, TestCase
+from src.config import CONF
+
+
+class LoggingExecutor(Executor):
+    """ Records the test cases loaded into it """
+
+    def __init__(self):
+        super().__init__()
+        self.loaded: List[TestCase] = []
+
+    def load_test_case(self, test_case):
+        self.loaded.append(test_case)
+
+    def trace_test_case(self, inputs, repetitions=0):
+        return [0 for _ in inputs]
+
+    def read_base_addresses(self):
+        return 0, 0
+
+    def get_last_feedback(self):
+        return []
+
+
+class CachingExecutor(LoggingExecutor):
+    """
+    Skips the load if the test case is already loaded, as known to this executor.
+    The loaded test case is shared between the executors (i.e., between worker processes)
+    """
+
+    def __init__(self, device: List[TestCase]):
+        super().__init__()
+        self.device = device
+        self.last_loaded = None
+
+    def load_test_case(self, test_case):
+        if test_case is self.last_loaded:
+            return
+        super().load_test_case(test_case)
+        self.device[:] = [test_case]
+        self.last_loaded = test_case
+
+    def invalidate_loaded_state(self):
+        self.last_loaded = None
+
+
+class Owner:
+    value: int = -1
+
+
+class CampaignTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.prev_conf = deepcopy(CONF)
+
+    @classmethod
+    def tearDownClass(cls):
+        global CONF
+        CONF = cls.prev_conf
+
+    def test_worker_configs(self):
+        CONF.program_generator_seed = 100
+        CONF.input_gen_seed = 1000
+        CONF.executor_taskset = 0
+        campaign = FuzzingCampaign("base.json", "", "", 3)
+        configs = campaign.get_worker_configs(10, 50)
+
+        self.assertEqual([c.num_test_cases for c in configs], [4, 3, 3])
+        self.assertEqual([c.program_generator_seed for c in configs], [100, 104, 107])
+        self.assertEqual([c.input_gen_seed for c in configs], [1000, 1200, 1350])
+        num_cpus = os.cpu_count() or 1
+        self.assertEqual([c.executor_taskset for c in configs], [i % num_cpus for i in range(3)])
+
+    def test_shared_executor_reload(self):
+        executor = LoggingExecutor()
+        lock = threading.Lock()
+        owner = Owner()
+        worker0 = SharedExecutor(executor, lock, owner, 0)
+        worker1 = SharedExecutor(executor, lock, owner, 1)
+        tc0, tc1 = TestCase(0), TestCase(1)
+
+        worker0.load_test_case(tc0)
+        worker0.trace_test_case([])
+        self.assertEqual(executor.loaded, [tc0])
+
+        # another worker replaced the test case -> the first one must re-load it before tracing
+        worker1.load_test_case(tc1)
+        worker0.trace_test_case([])
+        self.assertEqual(executor.loaded, [tc0, tc1, tc0])
+        worker1.trace_test_case([])
+        self.assertEqual(executor.loaded, [tc0, tc1, tc0, tc1])
+
+    def test_shared_executor_invalidation(self):
+        # each worker has its own copy of the executor, but the device is shared
+        device: List[TestCase] = []
+        lock = threading.Lock()
+        owner = Owner()
+        worker0 = SharedExecutor(CachingExecutor(device), lock, owner, 0)
+        worker1 = SharedExecutor(CachingExecutor(device), lock, owner, 1)
+        tc0, tc1 = TestCase(0), TestCase(1)
+
+        worker0.load_test_case(tc0)
+        worker1.load_test_case(tc1)
+        self.assertEqual(device, [tc1])
+
+        # the executor of the first worker has seen tc0 loaded, but it was replaced since then
+        worker0.load_test_case(tc0)
+        self.assertEqual(device, [tc0])
+        worker0.trace_test_case([])
+        self.assertEqual(device, [tc0])
+
+        # the same owner -> the load is skipped
+        worker0.load_test_case(tc0)
+        self.assertEqual(worker0.executor.loaded, [tc0, tc0])
@@ -0,0 +1,320 @@
+"""
+Copyright (C) Microsoft Corporation
+SPDX-License-Identifier: MIT
+"""
+import unittest
+from copy import deepcopy
+from typing import List
+
+import src.fuzzer
+from src.fuzzer import Fuzzer, TestCasePipeline
+from src.interfaces import Executor, Input, EquivalenceClass, Measurement, CombinedHTrace, \
+    TestCase, SpeculationStats, InputTaint
+from src.config import CONF
+from src.util import STAT
+
+
+class PrimingExecutor(Executor):
+    """
+    A fake executor: the htrace of an input is its first value,
+    unless it is primed by an input with a non-zero second value
+    """
+
+    def __init__(self):
+        self.calls: List[List[Input]] = []
+
+    def load_test_case(self, test_case):
+        pass
+
+    def trace_test_case(self, inputs: List[Input], repetitions: int = 0) \
+            -> List[CombinedHTrace]:
+        self.calls.append(inputs)
+        htraces = []
+        for i, input_ in enumerate(inputs):
+            if i > 0 and inputs[i - 1][1] != 0:
+                htraces.append(int(inputs[i - 1][1]))
+            else:
+                htraces.append(int(input_[0]))
+        return htraces
+
+    def read_base_addresses(self):
+        return 0, 0
+
+    def get_last_feedback(self) -> List:
+        return []
+
+
+def get_inputs(values) -> List[Input]:
+    inputs = []
+    for htrace, priming_htrace in values:
+        input_ = Input()
+        input_.fill(0)
+        input_[0] = htrace
+        input_[1] = priming_htrace
+        inputs.append(input_)
+    return inputs
+
+
+def get_violation(inputs: List[Input], violating_ids: List[int]) -> EquivalenceClass:
+    violation = EquivalenceClass()
+    violation.ctrace = 0
+    violation.measurements = [
+        Measurement(i, inputs[i], 0, int(inputs[i][0])) for i in violating_ids
+    ]
+    violation.build_htrace_map()
+    return violation
+
+
+class StubModel:
+    test_case: TestCase
+
+    def __init__(self):
+        self.loaded: List[TestCase] = []
+
+    def load_test_case(self, test_case):
+        self.test_case = test_case
+        self.loaded.append(test_case)
+
+    def trace_test_case(self, inputs, nesting):
+        return [self.test_case.seed] * len(inputs)
+
+    def get_speculation_stats(self, inputs, nesting):
+        # test cases with odd seeds do not access memory during speculation
+        self.traced_inputs = len(inputs)
+        return SpeculationStats(1, (self.test_case.seed + 1) % 2)
+
+    def get_nesting_limited(self):
+        return None
+
+
+class NestingModel:
+    """ A fake model: the ctrace of an input is its first value multiplied by the nesting """
+
+    def __init__(self):
+        self.traced: List[Input] = []
+
+    def get_taints(self, inputs, nesting):
+        return [InputTaint() for _ in inputs]
+
+    def trace_test_case(self, inputs, nesting):
+        self.traced.extend(inputs)
+        return [int(input_[0]) * nesting for input_ in inputs]
+
+
+class StubInputGenerator:
+    state = 0
+
+    def get_seed(self):
+        return self.state
+
+    def set_seed(self, seed):
+        self.state = seed
+
+    def extend_equivalence_classes(self, inputs, taints):
+        return get_inputs([(int(input_[0]) + 100, 0) for input_ in inputs])
+
+
+class StubFuzzer:
+    """ Generates empty test cases with consecutive seeds """
+
+    def __init__(self, fail_at: int = -1):
+        self.model = StubModel()
+        self.input_gen = StubInputGenerator()
+        self.generated = 0
+        self.fail_at = fail_at
+
+    def generate_test_case(self, asm_path, num_inputs):
+        if self.generated == self.fail_at:
+            raise ValueError("generation failed")
+        test_case = TestCase(self.generated)
+        test_case.asm_path = asm_path
+        self.generated += 1
+        self.input_gen.state += num_inputs
+        return test_case, [Input() for _ in range(num_inputs)]
+
+    def boost_inputs(self, inputs, nesting):
+        return inputs * 2
+
+
+class FuzzerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.prev_conf = deepcopy(CONF)
+
+    @classmethod
+    def tearDownClass(cls):
+        global CONF
+        CONF = cls.prev_conf
+
+    def setUp(self):
+        self.fuzzer = Fuzzer.__new__(Fuzzer)
+        self.fuzzer.executor = PrimingExecutor()
+
+    def test_priming_survived(self):
+        inputs = get_inputs([(0, 0), (1, 0), (0, 0), (2, 0)])
+        violation = get_violation(inputs, [1, 3])
+        self.assertTrue(self.fuzzer.priming(violation, inputs))
+        self.assertEqual(len(self.fuzzer.executor.calls), 1)
+
+    def test_priming_cleared(self):
+        # the htraces of both inputs are caused by the preceding inputs
+        inputs = get_inputs([(0, 1), (1, 0), (0, 2), (2, 0)])
+        violation = get_violation(inputs, [1, 3])
+        self.assertFalse(self.fuzzer.priming(violation, inputs))
+
+        # every primer is the full input sequence with the tested input in place of
+        # the primed one, and it is traced separately
+        calls = self.fuzzer.executor.calls
+        self.assertEqual(calls, [
+            [inputs[0], inputs[3], inputs[2], inputs[3]],
+            [inputs[0], inputs[1], inputs[2], inputs[1]],
+        ])
+
+    def test_priming_batches(self):
+        CONF.priming_batch_size = 1024
+        try:
+            # all primers are traced in a single call;
+            # each primer ends with the tested input in place of the primed one
+            inputs = get_inputs([(0, 1), (1, 0), (0, 2), (2, 0)])
+            violation = get_violation(inputs, [1, 3])
+            self.assertFalse(self.fuzzer.priming(violation, inputs))
+            calls = self.fuzzer.executor.calls
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len(calls[0]), 2 + 4)
+            self.assertIs(calls[0][1], inputs[3])
+            self.assertIs(calls[0][5], inputs[1])
+
+            self.fuzzer.executor.calls = []
+            CONF.priming_batch_size = 4
+            self.assertFalse(self.fuzzer.priming(violation, inputs))
+            self.assertEqual([len(c) for c in self.fuzzer.executor.calls], [2, 4])
+
+            # tracing stops after the first batch that confirms the violation
+            self.fuzzer.executor.calls = []
+            inputs = get_inputs([(0, 0), (1, 0), (0, 0), (2, 0)])
+            violation = get_violation(inputs, [1, 3])
+            self.assertTrue(self.fuzzer.priming(violation, inputs))
+            self.assertEqual(len(self.fuzzer.executor.calls), 1)
+        finally:
+            CONF.priming_batch_size = 0
+
+    def test_targeted_reproduction(self):
+        CONF.reproduction_window = 1
+        inputs = get_inputs([(0, 0), (0, 7), (1, 0), (0, 0), (0, 0), (2, 0)])
+        violation = get_violation(inputs, [2, 5])
+        htraces = self.fuzzer.executor.trace_test_case(inputs)
+        self.fuzzer.executor.calls = []
+
+        # only the violating inputs and their predecessors are re-measured
+        self.assertFalse(self.fuzzer.check_if_reproducible([violation], inputs, htraces))
+        self.assertEqual(self.fuzzer.executor.calls, [[inputs[i] for i in [1, 2, 4, 5]]])
+
+        # if the targeted measurement does not match, all inputs are re-measured
+        self.fuzzer.executor.calls = []
+        htraces[5] = 3
+        self.assertTrue(self.fuzzer.check_if_reproducible([violation], inputs, htraces))
+        self.assertEqual([len(c) for c in self.fuzzer.executor.calls], [4, 6])
+
+        # no window - all inputs are re-measured right away
+        CONF.reproduction_window = 0
+        self.fuzzer.executor.calls = []
+        htraces[5] = 2
+        self.assertFalse(self.fuzzer.check_if_reproducible([violation], inputs, htraces))
+        self.assertEqual([len(c) for c in self.fuzzer.executor.calls], [6])
+
+    def test_model_filter(self):
+        self.fuzzer.model = StubModel()
+        inputs = [Input() for _ in range(100)]
+        passed = STAT.model_filter
+
+        self.assertFalse(self.fuzzer.model_filter(TestCase(0), inputs))
+        self.assertTrue(self.fuzzer.model_filter(TestCase(1), inputs))
+        self.assertEqual(STAT.model_filter, passed + 1)
+        self.assertEqual(self.fuzzer.model.traced_inputs, src.fuzzer.MODEL_FILTER_SAMPLE_SIZE)
+
+        # the test case that passed the filter is not loaded again by the fuzzing round
+        test_case = TestCase(2)
+        self.assertFalse(self.fuzzer.model_filter(test_case, inputs))
+        self.fuzzer.model.loaded = []
+        self.fuzzer.test_for_violations = lambda *args: None
+        self.fuzzer.boost_inputs = lambda inputs, nesting: inputs
+        self.fuzzer.fuzzing_round(test_case, inputs)
+        self.assertEqual(self.fuzzer.model.loaded, [])
+        self.fuzzer.fuzzing_round(test_case, inputs)
+        self.assertEqual(self.fuzzer.model.loaded, [test_case])
+
+    def test_increase_nesting(self):
+        CONF.inputs_per_class = 2
+        CONF.model_max_nesting = 5
+        self.fuzzer.model = NestingModel()
+        self.fuzzer.input_gen = StubInputGenerator()
+        inputs = get_inputs([(1, 0), (2, 0), (3, 0)])
+        boosted_inputs = inputs + get_inputs([(101, 0), (102, 0), (103, 0)])
+        ctraces = [1, 2, 3, 101, 102, 103]
+
+        # the class of the first input is re-boosted, and only the limited inputs are re-traced
+        nesting_limited = [True, False, False, False, False, True]
+        new_inputs, new_ctraces = self.fuzzer.increase_nesting(inputs, boosted_inputs, ctraces,
+                                                               nesting_limited)
+        self.assertEqual(new_ctraces, [5, 2, 3, 505, 102, 515])
+        self.assertEqual(new_inputs[1:3], boosted_inputs[1:3])
+        self.assertIsNot(new_inputs[3], boosted_inputs[3])
+        self.assertEqual(self.fuzzer.model.traced, [inputs[0], new_inputs[3], boosted_inputs[5]])
+
+        # without the information from the model, all inputs are re-boosted and re-traced
+        self.fuzzer.model.traced = []
+        new_inputs, new_ctraces = self.fuzzer.increase_nesting(inputs, boosted_inputs, ctraces,
+                                                               None)
+        self.assertEqual(new_ctraces, [5, 10, 15, 505, 510, 515])
+        self.assertEqual(len(self.fuzzer.model.traced), 6)
+
+    def test_pipeline(self):
+        CONF.fuzzer_pipeline_depth = 2
+        fuzzer = StubFuzzer()
+        pipeline = TestCasePipeline(fuzzer, 6, 3)
+        prepared = [pipeline.get() for _ in range(6)]
+        pipeline.stop()
+
+        # the test cases are prepared in order, and their files do not overlap
+        # while they are in the pipeline
+        self.assertEqual([p.test_case.seed for p in prepared], list(range(6)))
+        self.assertEqual([p.test_case.asm_path for p in prepared][:4],
+                         ["generated0.asm", "generated1.asm", "generated2.asm", "generated3.asm"])
+        self.assertEqual([p.ctraces for p in prepared][1], [1] * 6)
+        self.assertEqual([p.input_gen_state for p in prepared], [3, 6, 9, 12, 15, 18])
+
+    def test_pipeline_stop_and_errors(self):
+        CONF.fuzzer_pipeline_depth = 1
+
+        # stopping the pipeline before all test cases are consumed
+        fuzzer = StubFuzzer()
+        pipeline = TestCasePipeline(fuzzer, 100, 1)
+        pipeline.get()
+        pipeline.stop()
+        self.assertFalse(pipeline.thread.is_alive())
+        self.assertLess(fuzzer.generated, 100)
+
+        # errors in the background thread are re-raised by the consumer
+        pipeline = TestCasePipeline(StubFuzzer(fail_at=1), 3, 1)
+        pipeline.get()
+        with self.assertRaises(ValueError):
+            pipeline.get()
+        pipeline.stop()
+
+    def test_model_access(self):
+        CONF.fuzzer_pipeline_depth = 1
+        fuzzer = Fuzzer.__new__(Fuzzer)
+        fuzzer.model = StubModel()
+        fuzzer.input_gen = StubInputGenerator()
+        fuzzer.pipeline = TestCasePipeline(StubFuzzer(), 1, 1)
+        prepared = fuzzer.pipeline.get()
+
+        # the lock is taken even if no prepared test case has to be restored
+        with fuzzer.model_access(None):
+            self.assertTrue(fuzzer.pipeline.lock.locked())
+        with fuzzer.model_access(prepared):
+            self.assertTrue(fuzzer.pipeline.lock.locked())
+            self.assertIs(fuzzer.model.test_case, prepared.test_case)
+        self.assertFalse(fuzzer.pipeline.lock.locked())
+        fuzzer.pipeline.stop()
@@ -0,0 +1,86 @@
+"""
+Copyright (C) Microsoft Corporation
+SPDX-License-Identifier: MIT
+"""
+import unittest
+from copy import deepcopy
+
+import numpy as np
+
+from src.input_generator import NumpyRandomInputGenerator
+from src.interfaces import InputTaint
+from src.config import CONF
+
+
+class InputGeneratorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.prev_conf = deepcopy(CONF)
+
+    @classmethod
+    def tearDownClass(cls):
+        global CONF
+        CONF = cls.prev_conf
+
+    def test_batch_generation(self):
+        batch_generator = NumpyRandomInputGenerator(123)
+        single_generator = NumpyRandomInputGenerator(123)
+        inputs = batch_generator.generate(20)
+        reference = [single_generator._generate_one() for _ in range(20)]
+
+        # the batch must be identical to the inputs generated one by one
+        for input_, ref in zip(inputs, reference):
+            self.assertTrue(np.array_equal(input_, ref))
+            self.assertEqual(input_.seed, ref.seed)
+            self.assertEqual(input_.data_size, ref.data_size)
+            self.assertEqual(input_.register_start, ref.register_start)
+        self.assertEqual(batch_generator._state, single_generator._state)
+
+        # all inputs are rows of a single contiguous array
+        batch = inputs[0].base
+        self.assertEqual(batch.shape, (20, len(inputs[0])))
+        for i, input_ in enumerate(inputs):
+            self.assertIs(input_.base, batch)
+            self.assertTrue(np.shares_memory(input_, batch[i]))
+
+    def test_extend_equivalence_classes(self):
+        CONF.input_gen_mutation_policy = "smart"
+        generator = NumpyRandomInputGenerator(123)
+        inputs = generator.generate(10)
+        taints = []
+        for i in range(10):
+            taint = InputTaint()
+            taint[i * 10:i * 10 + 5] = True
+            taints.append(taint)
+        taints[9][:] = False  # no taints -> no mutations
+        state = generator._state
+
+        new_inputs = generator.extend_equivalence_classes(inputs, taints)
+        self.assertEqual(generator._state, state)
+
+        reference = NumpyRandomInputGenerator(123)
+        reference._state = state
+        fresh_inputs = [reference._generate_one() for _ in range(10)]
+        data_size = inputs[0].data_size
+        for input_, taint, new_input, fresh in zip(inputs, taints, new_inputs, fresh_inputs):
+            taint = taint[:data_size]
+            # the mutation source is picked among the first `num_taints` values of the input
+            sources = [int(v) for v in input_[:np.count_nonzero(taint)]]
+            # tainted values are copied; untainted are either random or mutated source values
+            self.assertTrue(np.array_equal(new_input[:data_size][taint],
+                                           input_[:data_size][taint]))
+            for j in np.nonzero(~taint)[0]:
+                if new_input[j] != fresh[j]:
+                    value = int(new_input[j])
+                    self.assertTrue(value - 1 in sources or value + 1 in sources)
+        self.assertTrue(np.array_equal(new_inputs[9], fresh_inputs[9]))
+
+        # no mutations at all
+        CONF.input_gen_mutation_policy = "none"
+        new_inputs = generator.extend_equivalence_classes(inputs, taints)
+        for taint, new_input, fresh in zip(taints, new_inputs, fresh_inputs):
+            untainted = ~taint[:data_size]
+            self.assertTrue(np.array_equal(new_input[:data_size][untainted],
+                                           fresh[:data_size][untainted]))
+        CONF.input_gen_mutation_policy = "smart"
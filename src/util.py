@@ -31,6 +31,13 @@ class StatisticsCls:
     analysed_test_cases: int = 0
     spec_filter: int = 0
     observ_filter: int = 0
+    model_filter: int = 0
+    model_cache_hits: int = 0
+    ambiguous_reproductions: int = 0
+    skipped_test_case_uploads: int = 0
+    skipped_input_uploads: int = 0
+    measurements: int = 0
+    measurement_repetitions: int = 0
 
     # Implementation of Borg pattern
     def __init__(self) -> None:
@@ -49,6 +56,7 @@ class StatisticsCls:
         s += f"Test Cases: {self.test_cases}\n"
         s += f"Inputs per test case: {iptc:.1f}\n"
         s += f"Flaky violations: {self.flaky_violations}\n"
+        s += f"Ambiguous reproductions: {self.ambiguous_reproductions}\n"
         s += f"Required priming: {self.required_priming}\n"
         s += f"Violations: {self.violations}\n"
         s += "Effectiveness: \n"
@@ -58,6 +66,15 @@ class StatisticsCls:
         s += "Filters:\n"
         s += f"  Speculation Filter: {self.spec_filter}\n"
         s += f"  Observation Filter: {self.observ_filter}\n"
+        s += f"  Model Filter: {self.model_filter}\n"
+        s += "Model:\n"
+        s += f"  Cache hits: {self.model_cache_hits}\n"
+        avg_repetitions = self.measurement_repetitions / self.measurements \
+            if self.measurements else 0
+        s += "Executor:\n"
+        s += f"  Avg. repetitions: {avg_repetitions:.1f}\n"
+        s += f"  Skipped test case uploads: {self.skipped_test_case_uploads}\n"
+        s += f"  Skipped input uploads: {self.skipped_input_uploads}\n"
         return s
 
     def get_brief(self):
@@ -75,11 +92,20 @@ class StatisticsCls:
             s += f"Cv:{self.coverage},"
             s += f"SpF:{self.spec_filter},"
             s += f"ObF:{self.observ_filter},"
+            s += f"MdF:{self.model_filter},"
             s += f"Prm:{self.required_priming}," \
                  f"Flk:{self.flaky_violations}," \
                  f"Vio:{self.violations}"
             return s
 
+    def get_counters(self) -> Dict[str, int]:
+        """ Get the current values of all counters (e.g., to send them to another process) """
+        return {
+            name: getattr(self, name)
+            for name, default in vars(StatisticsCls).items()
+            if isinstance(default, int)
+        }
+
 
 STAT = StatisticsCls()
 
@@ -230,6 +256,19 @@ class Logger:
                 end=self.line_ending,
                 flush=True)
 
+    def campaign_progress(self, num_active_workers: int):
+        if self.info:
+            progress_percent = int(STAT.test_cases / self.one_percent_progress) \
+                if self.one_percent_progress else 0
+            msg = f"\r{STAT.test_cases:<6}({progress_percent:>2}%)| Workers: {num_active_workers}"
+            msg += f" | Stats: {STAT.get_brief()}"
+            print(msg + "         ", end=self.line_ending, flush=True)
+
+    def campaign_report_violation(self, worker_id: int, report: str):
+        print(f"\n\n================================ Violation detected by worker {worker_id} "
+              "=====")
+        print(report)
+
     def fuzzer_timeout(self):
         self.inform("fuzzer", "\nTimeout expired")
 
@@ -4,12 +4,18 @@ SPDX-License-Identifier: MIT
 """
 import unittest
 import os
+import fcntl
 import tempfile
 import subprocess
+import shutil
+from unittest.mock import patch
+import numpy as np
 
-from src.x86.x86_executor import X86IntelExecutor
+from src.x86.x86_executor import X86IntelExecutor, merge_htraces
 from src.x86.x86_generator import X86Generator
 from src.interfaces import TestCase, Input
+from src.config import CONF
+from src.util import STAT
 
 
 class ExecutorTest(unittest.TestCase):
@@ -77,3 +83,161 @@ class ExecutorTest(unittest.TestCase):
 
         self.assertEqual(traces[0], 9259400833873739776)
         self.assertEqual(traces[299], 9259400833873739776)
+
+
+class DirectorySysfsExecutorTest(unittest.TestCase):
+    """ Executor protocol on a directory that simulates the kernel module interface """
+
+    def setUp(self):
+        self.sysfs_dir = tempfile.mkdtemp()
+        self.prev_sysfs_path = CONF.x86_executor_sysfs_path
+        CONF.x86_executor_sysfs_path = self.sysfs_dir
+        for name in ["trace", "warmups", "enable_ssbp_patch", "enable_prefetcher",
+                     "enable_pre_run_flush", "measurement_mode", "faulty_pte_mask", "test_case",
+                     "n_inputs", "inputs"]:
+            open(os.path.join(self.sysfs_dir, name), "w").close()
+        with open(os.path.join(self.sysfs_dir, "print_sandbox_base"), "w") as f:
+            f.write("ffffc90000101000\n")
+        with open(os.path.join(self.sysfs_dir, "print_code_base"), "w") as f:
+            f.write("ffffffffc0a0b000\n")
+
+    def tearDown(self):
+        CONF.x86_executor_sysfs_path = self.prev_sysfs_path
+        shutil.rmtree(self.sysfs_dir)
+
+    def read_file(self, name: str) -> bytes:
+        with open(os.path.join(self.sysfs_dir, name), "rb") as f:
+            return f.read()
+
+    def test_protocol(self):
+        executor = X86IntelExecutor()
+        self.assertEqual(self.read_file("warmups"), str(CONF.executor_warmups).encode())
+        self.assertEqual(self.read_file("measurement_mode"), CONF.executor_mode.encode())
+        self.assertEqual(executor.read_base_addresses(),
+                         (0xffffc90000101000, 0xffffffffc0a0b000))
+
+        # read-only and write-only attributes are opened accordingly
+        read_fd = executor.sysfs.read_fds["print_sandbox_base"]
+        write_fd = executor.sysfs.write_fds["warmups"]
+        self.assertEqual(fcntl.fcntl(read_fd, fcntl.F_GETFL) & os.O_ACCMODE, os.O_RDONLY)
+        self.assertEqual(fcntl.fcntl(write_fd, fcntl.F_GETFL) & os.O_ACCMODE, os.O_WRONLY)
+        self.assertNotIn("warmups", executor.sysfs.read_fds)
+
+        bin_file = tempfile.NamedTemporaryFile(delete=False)
+        bin_file.write(b"\x90\x90\x90")
+        bin_file.close()
+        tc = TestCase(0)
+        tc.bin_path = bin_file.name
+        executor.load_test_case(tc)
+        os.unlink(bin_file.name)
+        self.assertEqual(self.read_file("test_case"), b"\x90\x90\x90")
+
+        # the executor prints the results in reverse order
+        with open(os.path.join(self.sysfs_dir, "trace"), "w") as f:
+            f.write("4,0,0,0,0,0\n2,1,0,0,0,0\n1,5,6,7,0,0\ndone\n")
+        inputs = Input.create_batch(3)
+        for i, input_ in enumerate(inputs):
+            input_.fill(i)
+        traces = executor.trace_test_case(inputs, 2)
+        self.assertEqual(traces, [1, 2, 4])
+        self.assertEqual(executor.get_last_feedback(), [[5, 6, 7], [1, 0, 0], [0, 0, 0]])
+        self.assertEqual(self.read_file("n_inputs"), b"3")
+        self.assertEqual(self.read_file("inputs"), np.concatenate(inputs).tobytes())
+
+    def test_skip_uploads(self):
+        executor = X86IntelExecutor()
+        with open(os.path.join(self.sysfs_dir, "trace"), "w") as f:
+            f.write("2,0,0,0,0,0\n1,0,0,0,0,0\ndone\n")
+
+        bin_file = tempfile.NamedTemporaryFile(delete=False)
+        bin_file.write(b"\x90")
+        bin_file.close()
+        tc = TestCase(0)
+        tc.bin_path = bin_file.name
+        inputs = Input.create_batch(2)
+        inputs[0].fill(1)
+        inputs[1].fill(2)
+
+        skipped_test_cases = STAT.skipped_test_case_uploads
+        skipped_inputs = STAT.skipped_input_uploads
+        executor.load_test_case(tc)
+        executor.trace_test_case(inputs, 1)
+        self.assertEqual(STAT.skipped_test_case_uploads, skipped_test_cases)
+        self.assertEqual(STAT.skipped_input_uploads, skipped_inputs)
+
+        # identical content is not uploaded again
+        open(os.path.join(self.sysfs_dir, "inputs"), "w").close()
+        executor.load_test_case(tc)
+        executor.trace_test_case(inputs, 1)
+        self.assertEqual(STAT.skipped_test_case_uploads, skipped_test_cases + 1)
+        self.assertEqual(STAT.skipped_input_uploads, skipped_inputs + 1)
+        self.assertEqual(self.read_file("inputs"), b"")
+
+        # a modified input is uploaded
+        inputs[1].fill(3)
+        executor.trace_test_case(inputs, 1)
+        self.assertEqual(STAT.skipped_input_uploads, skipped_inputs + 1)
+        self.assertEqual(self.read_file("inputs"), np.concatenate(inputs).tobytes())
+
+        # after invalidation, everything is uploaded again
+        executor.invalidate_loaded_state()
+        open(os.path.join(self.sysfs_dir, "test_case"), "w").close()
+        executor.load_test_case(tc)
+        os.unlink(bin_file.name)
+        self.assertEqual(self.read_file("test_case"), b"\x90")
+        self.assertEqual(STAT.skipped_test_case_uploads, skipped_test_cases + 1)
+
+    def test_adaptive_repetitions(self):
+        executor = X86IntelExecutor()
+        with open(os.path.join(self.sysfs_dir, "trace"), "w") as f:
+            f.write("2,0,0,0,0,0\n1,0,0,0,0,0\ndone\n")
+        inputs = Input.create_batch(2)
+
+        prev_adaptive = CONF.executor_adaptive_repetitions
+        prev_confidence = CONF.executor_adaptive_confidence
+        CONF.executor_adaptive_repetitions = True
+        CONF.executor_adaptive_confidence = 5
+        repetitions = STAT.measurement_repetitions
+        try:
+            # the outlier threshold (50 // 10) is scaled to the executed repetitions,
+            # hence the second chunk confirms the traces of the first one
+            self.assertEqual(executor.trace_test_case(inputs, 50), [1, 2])
+            self.assertEqual(STAT.measurement_repetitions, repetitions + 10)
+
+            # the same with a threshold that is higher than the chunk size
+            self.assertEqual(executor.trace_test_case(inputs, 100), [1, 2])
+            self.assertEqual(STAT.measurement_repetitions, repetitions + 20)
+
+            # the number of repetitions is the upper bound
+            self.assertEqual(executor.trace_test_case(inputs, 7), [1, 2])
+            self.assertEqual(STAT.measurement_repetitions, repetitions + 27)
+
+            # a trace observed only once is filtered out even if the run stops early
+            prev_repetitions = CONF.executor_repetitions
+            prev_outliers = CONF.executor_max_outliers
+            CONF.executor_repetitions = 50
+            CONF.executor_max_outliers = 1
+            noisy = np.array([[5, 0, 0, 0, 0, 0]], dtype=np.uint64)
+            clean = np.array([[1, 0, 0, 0, 0, 0]], dtype=np.uint64)
+            measurements = [noisy] + [clean] * 49
+            try:
+                with patch.object(executor, "_read_measurements", side_effect=measurements):
+                    self.assertEqual(executor.trace_test_case(inputs[:1]), [1])
+                self.assertEqual(STAT.measurement_repetitions, repetitions + 37)
+            finally:
+                CONF.executor_repetitions = prev_repetitions
+                CONF.executor_max_outliers = prev_outliers
+        finally:
+            CONF.executor_adaptive_repetitions = prev_adaptive
+            CONF.executor_adaptive_confidence = prev_confidence
+
+
+class HTraceMergeTest(unittest.TestCase):
+
+    def test_merge_htraces(self):
+        htraces = np.array([[1, 1, 2, 4, 1],
+                            [8, 2, 8, 2, 16],
+                            [3, 5, 7, 9, 11]], dtype=np.uint64)
+        self.assertEqual(merge_htraces(htraces, 0).tolist(), [7, 26, 15])
+        self.assertEqual(merge_htraces(htraces, 1).tolist(), [1, 10, 0])
+        self.assertEqual(merge_htraces(htraces, 2).tolist(), [1, 0, 0])
@@ -10,6 +10,7 @@ from pathlib import Path
 
 from src.x86.x86_generator import X86RandomGenerator, X86Printer, X86PatchUndefinedFlagsPass, \
     X86Generator
+from src.x86.x86_fuzzer import X86Fuzzer
 from src.factory import get_program_generator
 from src.isa_loader import InstructionSet
 from src.interfaces import TestCase, Function
@@ -19,6 +20,17 @@ CONF.instruction_set = "x86-64"
 test_path = Path(__file__).resolve()
 test_dir = test_path.parent
 
+ASM_ASSEMBLER = """
+.intel_syntax noprefix
+MFENCE
+.test_case_enter:
+ADD RAX, RBX
+MOV RAX, qword ptr [R14 + 0x100]
+.byte 0x90, 0x90
+NOP
+.test_case_exit:
+"""
+
 ASM_OPCODE = """
 .intel_syntax noprefix
 .test_case_enter:
@@ -124,6 +136,31 @@ class X86RandomGeneratorTest(unittest.TestCase):
         asm_file.close()
         os.unlink(asm_file.name)
 
+    @staticmethod
+    def assemble_str(asm_str: str):
+        asm_file = tempfile.NamedTemporaryFile("w", delete=False)
+        asm_file.write(asm_str)
+        asm_file.close()
+        bin_file = asm_file.name + ".o"
+
+        offsets = X86Generator.assemble(asm_file.name, bin_file)
+        with open(bin_file, "rb") as f:
+            code = f.read()
+        os.unlink(asm_file.name)
+        os.unlink(bin_file)
+        return offsets, code
+
+    def test_x86_assemble(self):
+        offsets, code = self.assemble_str(ASM_ASSEMBLER.replace(".byte 0x90, 0x90", "NOP\nNOP"))
+        self.assertEqual(offsets, [0, 3, 6, 13, 14, 15])
+        self.assertEqual(code.hex(), "0faef0" "4801d8" "498b8600010000" "9090" "90")
+
+        # a data directive may encode several instructions, so the offsets are left to
+        # the disassembler
+        offsets, code = self.assemble_str(ASM_ASSEMBLER)
+        self.assertIsNone(offsets)
+        self.assertEqual(code.hex(), "0faef0" "4801d8" "498b8600010000" "9090" "90")
+
     def test_x86_asm_parsing_basic(self):
         CONF.register_blocklist = []
         CONF.setattr_internal("_default_instruction_blocklist", [])
@@ -147,6 +184,101 @@ class X86RandomGeneratorTest(unittest.TestCase):
         self.assertEqual(bb0.successors[0], bb1)
         self.assertEqual(bb1.successors[0], exit_)
 
+    def test_x86_instruction_info(self):
+        CONF.register_blocklist = []
+        CONF.setattr_internal("_default_instruction_blocklist", [])
+
+        instruction_set = InstructionSet((test_dir / "min_x86.json").absolute().as_posix())
+        generator = X86RandomGenerator(instruction_set, CONF.program_generator_seed)
+        tc: TestCase = generator.load((test_dir / "asm_basic.asm").absolute().as_posix())
+        self.assertEqual(tc.instruction_info.keys(), tc.address_map.keys())
+
+        loads = [
+            address for address, inst in tc.address_map.items()
+            if inst.name == "MOV" and inst.has_mem_operand() and len(inst.get_mem_operands()) == 1
+            and "8" in inst.get_mem_operands()[0].value
+        ]
+        info = tc.instruction_info[loads[0]]
+        self.assertEqual(info.dest_regs, ("A",))
+        self.assertEqual(info.src_regs, ())
+        self.assertEqual(info.mem_address_regs, ("14", "B"))
+        self.assertEqual(info.coverage_key, "MOV-64REG-64MEM")
+
+        adc = [address for address, inst in tc.address_map.items() if inst.name == "LOCK ADC"]
+        info = tc.instruction_info[adc[0]]
+        self.assertIn("CF", info.read_flags)
+        self.assertIn("CF", info.write_flags)
+
+        # only the instructions that cannot raise exceptions are marked as fault-free
+        may_fault = {inst.name: tc.instruction_info[address].may_fault
+                     for address, inst in tc.address_map.items()
+                     if inst.name in ["AND", "DIV", "LOCK ADC", "UNMAPPED"]}
+        self.assertEqual(may_fault,
+                         {"AND": False, "DIV": True, "LOCK ADC": True, "UNMAPPED": True})
+        self.assertTrue(tc.instruction_info[loads[0]].may_fault)
+
+    def test_x86_lfence_pass(self):
+        instruction_set = InstructionSet((test_dir / "min_x86.json").absolute().as_posix(),
+                                         CONF.instruction_categories)
+        generator = X86RandomGenerator(instruction_set, CONF.program_generator_seed)
+        fuzzer = X86Fuzzer.__new__(X86Fuzzer)
+        fuzzer.generator = generator
+
+        asm_file = tempfile.NamedTemporaryFile(delete=False)
+        tc: TestCase = generator.create_test_case(asm_file.name)
+        size = len([i for func in tc for bb in func for i in bb])
+        fenced = fuzzer.get_fenced_test_case(tc)
+        asm_file.close()
+        os.unlink(asm_file.name)
+
+        # the original test case is not modified
+        self.assertEqual(len([i for func in tc for bb in func for i in bb]), size)
+
+        # every basic block starts with a fence, and every instruction is followed by a fence
+        with open(fenced.asm_path) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        body = lines[lines.index(".test_case_enter:") + 1:lines.index(".test_case_exit:")]
+        for prev, line in zip(body, body[1:]):
+            if not prev.startswith("LFENCE") and not prev.startswith(".function"):
+                self.assertTrue(line.startswith("LFENCE"))
+        fenced_size = len([i for func in fenced for bb in func for i in bb if i.name != "LFENCE"])
+        self.assertEqual(fenced_size, size)
+        self.assertGreater(os.path.getsize(fenced.bin_path), 0)
+
+        # the control flow graph is copied as well
+        for func, fenced_func in zip(tc, fenced):
+            for bb, fenced_bb in zip(func, fenced_func):
+                self.assertEqual([s.name for s in fenced_bb.successors],
+                                 [s.name for s in bb.successors])
+                for successor in fenced_bb.successors:
+                    self.assertIn(successor, fenced_func)
+
+        # the fenced variant is reused while the test case is the same
+        self.assertIs(fuzzer.get_fenced_test_case(tc), fenced)
+        fuzzer.fenced_dir.cleanup()
+
+    def test_x86_lfence_opcode(self):
+        # raw opcodes are not represented in the IR, hence the assembly text is fenced instead
+        CONF.register_blocklist = []
+        CONF.setattr_internal("_default_instruction_blocklist", [])
+        instruction_set = InstructionSet((test_dir / "min_x86.json").absolute().as_posix())
+        generator = X86RandomGenerator(instruction_set, CONF.program_generator_seed)
+        fuzzer = X86Fuzzer.__new__(X86Fuzzer)
+        fuzzer.generator = generator
+
+        asm_file = tempfile.NamedTemporaryFile("w", delete=False)
+        asm_file.write(ASM_OPCODE)
+        asm_file.close()
+        tc: TestCase = generator.load(asm_file.name)
+        fenced = fuzzer.get_fenced_test_case(tc)
+        os.unlink(asm_file.name)
+
+        with open(fenced.bin_path, "rb") as f:
+            code = f.read()
+        lfence = "0faee8"
+        self.assertTrue(code.hex().endswith(lfence + "9090" + lfence + lfence))
+        fuzzer.fenced_dir.cleanup()
+
     def test_x86_asm_parsing_opcode(self):
         CONF.register_blocklist = []
         CONF.setattr_internal("_default_instruction_blocklist", [])
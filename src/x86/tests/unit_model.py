@@ -5,10 +5,12 @@ SPDX-License-Identifier: MIT
 import unittest
 import tempfile
 import os
-from typing import List
+from typing import List, Set
 from pathlib import Path
 from copy import deepcopy
 
+import numpy as np
+
 import src.x86.x86_model as x86_model
 import src.model as core_model
 
@@ -17,6 +19,7 @@ from src.interfaces import Instruction, RegisterOperand, MemoryOperand, InputTai
 from src.isa_loader import InstructionSet
 from src.x86.x86_generator import X86RandomGenerator
 from src.config import CONF
+from src.util import STAT
 
 test_path = Path(__file__).resolve()
 test_dir = test_path.parent
@@ -227,6 +230,30 @@ class X86ModelTest(unittest.TestCase):
         expected_trace = hash(tuple([0x0, 0x3, 0x5, 0, 0x8]))
         self.assertEqual(ctraces, [expected_trace])
 
+    def test_trace_digest(self):
+        model = x86_model.X86UnicornSeq(0x1000000, 0x8000)
+        tracer = core_model.CTTracer()
+        for values in [[], [0x8003, 0x1000200, 5], [pow(2, 63), pow(2, 64) - 1, pow(2, 61) - 1]]:
+            tracer.init_trace(None, None, model)
+            for val in values:
+                tracer.add_value_to_trace(val, model)
+            normalized = [v - 0x8000 if v == 0x8003 else v - 0x1000000 if v == 0x1000200 else v
+                          for v in values]
+            self.assertEqual(tracer.get_contract_trace(model), hash(tuple(normalized)))
+            self.assertEqual(tracer.get_contract_trace_full(), [])
+
+    def test_full_trace(self):
+        model = x86_model.X86UnicornSeq(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        ctraces = self.get_traces(model, ASM_BRANCH_AND_LOAD, [Input()])
+        self.assertEqual(model.tracer.get_contract_trace_full(), [])
+
+        # the raw observations are collected only on request
+        model.tracer.keep_full_trace = True
+        self.assertEqual(self.get_traces(model, ASM_BRANCH_AND_LOAD, [Input()]), ctraces)
+        self.assertEqual(model.tracer.get_contract_trace_full(),
+                         [0x8000, 0x8003, 0x8005, 0x1000000, 0x8008])
+
     def test_ctr_seq(self):
         model = x86_model.X86UnicornSeq(0x1000000, 0x8000)
         model.tracer = core_model.CTRTracer()
@@ -276,6 +303,58 @@ class X86ModelTest(unittest.TestCase):
             ]))
         self.assertEqual(ctraces, [expected_trace])
 
+    def test_nesting_limited(self):
+        model = x86_model.X86UnicornCond(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+
+        # the second branch is reached only during speculation
+        ctraces = self.get_traces(model, ASM_DOUBLE_BRANCH, [Input()], nesting=1)
+        self.assertEqual(model.get_nesting_limited(), [True])
+        self.assertNotEqual(ctraces, self.get_traces(model, ASM_DOUBLE_BRANCH, [Input()], 2))
+        self.assertEqual(model.get_nesting_limited(), [False])
+
+        # a single branch - the nesting has no effect
+        ctraces = self.get_traces(model, ASM_BRANCH_AND_LOAD, [Input()], nesting=1)
+        self.assertEqual(model.get_nesting_limited(), [False])
+        self.assertEqual(ctraces, self.get_traces(model, ASM_BRANCH_AND_LOAD, [Input()], 2))
+
+        # the same for store bypass
+        model = x86_model.X86UnicornBpas(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        self.get_traces(model, ASM_STORE_AND_LOAD, [Input()], nesting=1)
+        self.assertEqual(model.get_nesting_limited(), [False])
+
+    def test_branch_table(self):
+        model = x86_model.X86UnicornCond(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.load_test_case(self.load_tc(ASM_DOUBLE_BRANCH))
+
+        # only the conditional branches are in the table; JMP .l3 is not
+        self.assertEqual(sorted(model.branch_table), [0x8003, 0x800d])
+        branch = model.branch_table[0x8003]
+        self.assertEqual((branch.target, branch.fallthrough, branch.is_loop),
+                         (0x800a, 0x8005, False))
+        self.assertEqual(model.branch_table[0x800d].target, 0x8012)
+
+    def test_speculation_stats(self):
+        model = x86_model.X86UnicornCond(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.load_test_case(self.load_tc(ASM_DOUBLE_BRANCH))
+        stats = model.get_speculation_stats([Input(), Input()], 2)
+        self.assertEqual(stats.checkpoints, 4)
+        self.assertEqual(stats.speculative_mem_accesses, 2)
+
+        # the fence stops the speculation after the first load
+        model.load_test_case(self.load_tc(ASM_FENCE))
+        stats = model.get_speculation_stats([Input()], 1)
+        self.assertEqual(stats.checkpoints, 1)
+        self.assertEqual(stats.speculative_mem_accesses, 1)
+
+        # no branches - no speculation
+        model.load_test_case(self.load_tc(ASM_THREE_LOADS))
+        stats = model.get_speculation_stats([Input()], 1)
+        self.assertEqual(stats, (0, 0))
+
     def test_ct_bpas(self):
         model = x86_model.X86UnicornBpas(0x1000000, 0x8000)
         model.tracer = core_model.CTTracer()
@@ -424,6 +503,30 @@ class X86ModelTest(unittest.TestCase):
         ]))   # yapf: disable
         self.assertEqual(ctraces[0], expected_trace)
 
+    def test_fault_context_fallback(self):
+        # a fault in an instruction that was wrongly considered fault-free is recovered from
+        input_ = Input()
+        for i in range(0, 7):
+            input_[input_.register_start + i] = 2
+        input_[input_.register_start + 2] = 4096
+        input_[4096 // 8] = 3
+
+        model = x86_model.X86Meltdown(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.handled_faults.update([12, 13])
+        expected = self.get_traces(model, ASM_FAULTY_ACCESS, [input_], pte_mask=PF_MASK)
+
+        tc = self.load_tc(ASM_FAULTY_ACCESS)
+        tc.faulty_pte = PageTableModifier(0, PF_MASK)
+        tc.instruction_info = {
+            address: info._replace(may_fault=False)
+            for address, info in tc.instruction_info.items()
+        }
+        model.load_test_case(tc)
+        self.assertTrue(model.fault_context_offsets.isdisjoint(tc.instruction_info))
+        self.assertEqual(model.trace_test_case([input_], 1), expected)
+        self.assertEqual(model.fault_context_offsets, set(tc.address_map))
+
     def test_ct_meltdown_fence(self):
         model = x86_model.X86Meltdown(0x1000000, 0x8000)
         model.tracer = core_model.CTTracer()
@@ -538,6 +641,124 @@ class X86ModelTest(unittest.TestCase):
         ]))   # yapf: disable
         self.assertEqual(ctraces[0], expected_trace)
 
+    def test_emulator_reuse(self):
+        # a model that processed other test cases must produce the same traces as a fresh one
+        input_ = Input()
+        for i in range(0, 7):
+            input_[input_.register_start + i] = 2
+        input_[input_.register_start + 2] = 4096
+        input_[4096 // 8] = 3
+
+        fresh_model = x86_model.X86Meltdown(0x1000000, 0x8000)
+        fresh_model.tracer = core_model.CTTracer()
+        fresh_model.handled_faults.update([12, 13])
+        expected = self.get_traces(fresh_model, ASM_FAULTY_ACCESS, [input_], pte_mask=PF_MASK)
+
+        model = x86_model.X86Meltdown(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.handled_faults.update([12, 13])
+        self.get_traces(model, ASM_STORE_AND_LOAD, [input_, Input()])
+        self.get_traces(model, ASM_DOUBLE_BRANCH, [Input()], nesting=2)
+        ctraces = self.get_traces(model, ASM_FAULTY_ACCESS, [input_], pte_mask=PF_MASK)
+        self.assertEqual(ctraces, expected)
+
+    def test_multi_instruction_opcode(self):
+        # the second NOP encoded by the .byte directive must be mapped as well
+        asm_opcode = """
+.intel_syntax noprefix
+.test_case_enter:
+.byte 0x90, 0x90
+MOV RAX, qword ptr [R14 + 512]
+.test_case_exit:
+"""
+        asm_nops = asm_opcode.replace(".byte 0x90, 0x90", "NOP\nNOP")
+
+        model = x86_model.X86UnicornSeq(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        expected = self.get_traces(model, asm_nops, [Input()])
+        ctraces = self.get_traces(model, asm_opcode, [Input()])
+        self.assertEqual(ctraces, expected)
+
+    def test_parallel_tracing(self):
+        # traces and taints collected by the worker pool must match the serial ones
+        inputs = []
+        for i in range(0, 20):
+            input_ = Input()
+            input_[:] = np.random.default_rng(i).integers(0, 4088, len(input_), dtype=np.uint64)
+            input_.seed = i
+            inputs.append(input_)
+
+        model = x86_model.X86UnicornCond(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.taint_tracker_cls = x86_model.X86TaintTracker
+        expected_ctraces = self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=2)
+        expected_taints = model.get_taints(inputs, 2)
+
+        model = x86_model.X86UnicornCond(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.taint_tracker_cls = x86_model.X86TaintTracker
+        model.worker_pool = core_model.ModelWorkerPool(model, 3)
+        try:
+            ctraces = self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=2)
+            taints = model.get_taints(inputs, 2)
+
+            # the full traces are kept only in this process, so the pool must not be used
+            model.tracer.keep_full_trace = True
+            self.assertFalse(model._is_parallel_tracing_applicable(inputs))
+        finally:
+            model.worker_pool.close()
+
+        self.assertEqual(ctraces, expected_ctraces)
+        self.assertEqual(len(taints), len(expected_taints))
+        for taint, expected_taint in zip(taints, expected_taints):
+            self.assertTrue(np.array_equal(taint, expected_taint))
+            self.assertEqual(taint.register_start, expected_taint.register_start)
+
+    def test_trace_cache(self):
+        inputs = []
+        for i in range(0, 4):
+            input_ = Input()
+            input_[:] = np.random.default_rng(i).integers(0, 4088, len(input_), dtype=np.uint64)
+            inputs.append(input_)
+
+        model = x86_model.X86UnicornCond(0x1000000, 0x8000)
+        model.tracer = core_model.CTTracer()
+        model.taint_tracker_cls = x86_model.X86TaintTracker
+        expected_ctraces = self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=2)
+        expected_taints = model.get_taints(inputs, 2)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            model.trace_cache = core_model.ModelTraceCache(100, os.path.join(tmp_dir, "cache"))
+            hits = STAT.model_cache_hits
+            self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs[:2], nesting=2)
+            model.get_taints(inputs[:2], 2)
+            self.assertEqual(STAT.model_cache_hits, hits)
+
+            # only the new inputs are traced; the results of the others are reused
+            ctraces = self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=2)
+            taints = model.get_taints(inputs, 2)
+            self.assertEqual(STAT.model_cache_hits, hits + 4)
+            self.assertEqual(ctraces, expected_ctraces)
+            for taint, expected_taint in zip(taints, expected_taints):
+                self.assertTrue(np.array_equal(taint, expected_taint))
+
+            # a different nesting, test case, or model configuration is a miss
+            self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=1)
+            self.get_traces(model, ASM_BRANCH_AND_LOAD, inputs, nesting=2)
+            CONF.model_lazy_fault_context = not CONF.model_lazy_fault_context
+            try:
+                self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=2)
+            finally:
+                CONF.model_lazy_fault_context = not CONF.model_lazy_fault_context
+            self.assertEqual(STAT.model_cache_hits, hits + 4)
+
+            # the entries evicted from memory are still available on disk
+            model.trace_cache.entries.clear()
+            ctraces = self.get_traces(model, ASM_BRANCH_AND_FAULT, inputs, nesting=2)
+            self.assertEqual(STAT.model_cache_hits, hits + 8)
+            self.assertEqual(ctraces, expected_ctraces)
+            model.trace_cache.storage.close()
+
 
 class X86TaintTrackerTest(unittest.TestCase):
 
@@ -665,5 +886,110 @@ class X86TaintTrackerTest(unittest.TestCase):
         self.assertListEqual(list(taint), expected)
 
 
+class X86BitsetTaintTrackerTest(unittest.TestCase):
+
+    @staticmethod
+    def get_dependencies(tracker, name) -> Set[str]:
+        if name.startswith("0x"):
+            label = tracker._mem_label(int(name, 16) // 8)
+        else:
+            label = tracker._label_ids[name]
+        return tracker.get_label_names(tracker.dependencies[label])
+
+    def test_dependency_tracking(self):
+        tracker = x86_model.X86BitsetTaintTracker([])
+
+        # reg -> reg
+        tracker.start_instruction(Instruction("ADD")
+                                  .add_op(RegisterOperand("RAX", 64, True, True))
+                                  .add_op(RegisterOperand("RBX", 64, True, False)))  # yapf: disable
+        tracker._finalize_instruction()
+        self.assertCountEqual(self.get_dependencies(tracker, 'A'), ['A', 'B'])
+
+        # chain of dependencies
+        tracker.start_instruction(Instruction("MOV")
+                                  .add_op(RegisterOperand("RCX", 64, False, True))
+                                  .add_op(RegisterOperand("RAX", 64, True, False)))  # yapf: disable
+        tracker._finalize_instruction()
+        self.assertCountEqual(self.get_dependencies(tracker, 'C'), ['A', 'B', 'C'])
+
+        # memory -> reg
+        tracker.start_instruction(Instruction("MOV")
+                                  .add_op(RegisterOperand("RDX", 64, False, True))
+                                  .add_op(MemoryOperand("RCX", 64, True, False)))  # yapf: disable
+        tracker.track_memory_access(0x87, 8, False)
+        tracker._finalize_instruction()
+        self.assertCountEqual(self.get_dependencies(tracker, 'D'), ['0x80', '0x88', 'D'])
+
+        # reg -> mem
+        tracker.start_instruction(Instruction("MOV")
+                                  .add_op(MemoryOperand("RAX", 64, False, True))
+                                  .add_op(RegisterOperand("RSI", 64, True, False)))  # yapf: disable
+        tracker.track_memory_access(0x80, 8, True)
+        tracker._finalize_instruction()
+        self.assertCountEqual(self.get_dependencies(tracker, '0x80'), ['0x80', 'SI'])
+
+        # store -> load
+        tracker.start_instruction(Instruction("MOV")
+                                  .add_op(RegisterOperand("RDI", 64, False, True))
+                                  .add_op(MemoryOperand("RAX", 64, True, False)))  # yapf: disable
+        tracker.track_memory_access(0x80, 8, False)
+        tracker._finalize_instruction()
+        self.assertCountEqual(self.get_dependencies(tracker, 'DI'), ['SI', 'DI', '0x80'])
+
+    def test_checkpoint_rollback(self):
+        tracker = x86_model.X86BitsetTaintTracker([])
+        add = Instruction("ADD") \
+            .add_op(RegisterOperand("RAX", 64, True, True)) \
+            .add_op(RegisterOperand("RBX", 64, True, False))
+        mov = Instruction("MOV") \
+            .add_op(RegisterOperand("RAX", 64, False, True)) \
+            .add_op(RegisterOperand("RCX", 64, True, False))
+        load = Instruction("MOV") \
+            .add_op(RegisterOperand("RBX", 64, False, True)) \
+            .add_op(MemoryOperand("RDX", 64, True, False))
+
+        tracker.start_instruction(add)
+        tracker.checkpoint()
+        tracker.start_instruction(mov)
+        tracker.checkpoint()
+        tracker.start_instruction(mov)
+        tracker._finalize_instruction()
+        self.assertCountEqual(self.get_dependencies(tracker, 'A'), ['A', 'B', 'C'])
+
+        # the tables of the first checkpoint must stay intact after both rollbacks
+        tracker.rollback()
+        self.assertCountEqual(self.get_dependencies(tracker, 'A'), ['A', 'B', 'C'])
+        tracker.rollback()
+        self.assertCountEqual(self.get_dependencies(tracker, 'A'), ['A', 'B'])
+
+        # taints are not rolled back
+        tracker.checkpoint()
+        tracker.start_instruction(load)
+        tracker.track_memory_access(0x40, 8, False)
+        tracker.taint_memory_access_address()
+        tracker.rollback()
+        self.assertCountEqual(tracker.get_label_names(tracker.tainted_labels), {'D'})
+
+    def test_label_to_taint(self):
+        labels = ['D', 'SI', '8', '14', 'DF', 'RIP']
+        tracker = x86_model.X86BitsetTaintTracker(labels)
+        for address in [0x0, 0x40, 0x640]:
+            tracker.tainted_labels |= 1 << tracker._mem_label(address // 8)
+        taint: InputTaint = tracker.get_taint()
+        register_start = taint.register_start
+
+        expected = [False for i in range(taint.size)]
+        expected[0] = True  # 0x0
+        expected[8] = True  # 0x40
+        expected[200] = True  # 640
+        expected[register_start + 3] = True  # D
+        expected[register_start + 4] = True  # SI
+        expected[register_start + 6] = True  # DF - flags
+        # 8, 14, RIP - not a part of the input
+
+        self.assertListEqual(list(taint), expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,137 @@
+"""
+Copyright (C) Microsoft Corporation
+SPDX-License-Identifier: MIT
+"""
+import unittest
+import tempfile
+import os
+from pathlib import Path
+from copy import deepcopy
+
+from src.interfaces import Input, TestCase, PageTableModifier
+from src.isa_loader import InstructionSet
+from src.x86.x86_generator import X86RandomGenerator
+from src.x86.x86_simulated_executor import X86SimulatedExecutor, L1DCacheSimulator
+from src.config import CONF
+
+test_path = Path(__file__).resolve()
+test_dir = test_path.parent
+
+ASM_LOADS = """
+.intel_syntax noprefix
+.test_case_enter:
+MOV RAX, qword ptr [R14 + 128]
+MOV RAX, qword ptr [R14 + 1024]
+.test_case_exit:
+"""
+
+ASM_SPECULATIVE_LOAD = """
+.intel_syntax noprefix
+.test_case_enter:
+XOR rax, rax
+JZ .l1
+.l0:
+MOV RAX, qword ptr [R14 + 256]
+.l1:
+NOP
+.test_case_exit:
+"""
+
+
+def bit(i: int) -> int:
+    return 1 << (63 - i)
+
+
+class SimulatedExecutorTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.prev_conf = deepcopy(CONF)
+        CONF.instruction_set = "x86-64"
+        CONF.executor = "simulated"
+        CONF.setattr_internal("_no_generation", True)
+
+    @classmethod
+    def tearDownClass(cls):
+        global CONF
+        CONF = cls.prev_conf
+
+    def setUp(self):
+        CONF.executor_mode = "P+P"
+        CONF.x86_simulator_speculation = "cond-bpas"
+        CONF.x86_simulator_noise = 0
+
+    @staticmethod
+    def load_tc(asm_str: str) -> TestCase:
+        min_x86_path = test_dir / "min_x86.json"
+        instruction_set = InstructionSet(min_x86_path.absolute().as_posix())
+        generator = X86RandomGenerator(instruction_set, CONF.program_generator_seed)
+
+        asm_file = tempfile.NamedTemporaryFile(delete=False)
+        with open(asm_file.name, "w") as f:
+            f.write(asm_str)
+        tc: TestCase = generator.load(asm_file.name)
+        asm_file.close()
+        os.unlink(asm_file.name)
+        tc.faulty_pte = PageTableModifier(0, 0xffffffffffffffff)
+        return tc
+
+    def get_htraces(self, asm_str: str, repetitions: int = 1):
+        executor = X86SimulatedExecutor()
+        executor.load_test_case(self.load_tc(asm_str))
+        input_ = Input()
+        input_.fill(0)
+        return executor, executor.trace_test_case([input_], repetitions)
+
+    def test_cache_simulator(self):
+        cache = L1DCacheSimulator(64, 2)
+
+        # prime+probe: a set is reported only if an attacker line was evicted
+        self.assertEqual(cache.measure([(0, 8)], 0, "P+P"), bit(0))
+        self.assertEqual(cache.measure([(60, 8)], 0, "P+P"), bit(0) | bit(1))
+        self.assertEqual(cache.measure([(64 * 65, 8)], 0, "P+P"), bit(1))
+
+        # flush+reload: only the lines of the main region are reported
+        self.assertEqual(cache.measure([(4096 + 128, 8)], 4096, "F+R"), bit(2))
+        self.assertEqual(cache.measure([(0, 8)], 4096, "F+R"), 0)
+
+        # a line evicted from a full set is not reported
+        accesses = [(4096, 8), (4096 + 64 * 64, 8), (4096 + 128 * 64, 8)]
+        self.assertEqual(cache.measure(accesses, 4096, "F+R"), 0)
+
+    def test_prime_and_probe(self):
+        executor, htraces = self.get_htraces(ASM_LOADS)
+        self.assertEqual(htraces, [bit(2) | bit(16)])
+        self.assertEqual(executor.read_base_addresses(), (0x1000000, 0x8000))
+
+    def test_flush_and_reload(self):
+        CONF.executor_mode = "F+R"
+        _, htraces = self.get_htraces(ASM_LOADS)
+        self.assertEqual(htraces, [bit(2) | bit(16)])
+
+    def test_speculation(self):
+        CONF.x86_simulator_speculation = "seq"
+        _, htraces = self.get_htraces(ASM_SPECULATIVE_LOAD)
+        self.assertEqual(htraces, [0])
+
+        CONF.x86_simulator_speculation = "cond"
+        executor, htraces = self.get_htraces(ASM_SPECULATIVE_LOAD)
+        self.assertEqual(htraces, [bit(4)])
+
+        # the load and the NOP are executed speculatively and never retire
+        executed, retired, _ = executor.get_last_feedback()[0]
+        self.assertEqual(executed - retired, 2)
+
+    def test_noise(self):
+        _, htraces = self.get_htraces(ASM_LOADS, repetitions=10)
+        self.assertEqual(htraces, [bit(2) | bit(16)])
+
+        # with noise in every measurement, each trace gets (at most) one extra bit
+        CONF.x86_simulator_noise = 100
+        _, htraces = self.get_htraces(ASM_LOADS, repetitions=1)
+        self.assertEqual(htraces[0] & (bit(2) | bit(16)), bit(2) | bit(16))
+        self.assertIn(bin(htraces[0]).count("1"), [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,12 +13,25 @@ x86_option_values = {
         'DE-zero', 'DE-overflow', 'UD', 'UD-vtx', 'UD-svm', 'PF-present', 'PF-writable', 'PF-smap',
         'GP-noncanonical', 'BP', 'DB-instruction', 'assist-accessed', 'assist-dirty'
     ],
+    'x86_simulator_speculation': ['seq', 'cond', 'bpas', 'cond-bpas'],
 }
 
 x86_executor_enable_prefetcher: bool = False
 """ x86_executor_enable_prefetcher: enable all prefetchers"""
 x86_executor_enable_ssbp_patch: bool = True
 """ x86_executor_enable_ssbp_patch: enable a patch against Speculative Store Bypass"""
+x86_executor_sysfs_path: str = "/sys/x86_executor"
+""" x86_executor_sysfs_path: path to the sysfs interface of the executor kernel module;
+if it is not a sysfs path, the executor uses the directory as a simulated interface """
+x86_simulator_speculation: str = "cond-bpas"
+""" x86_simulator_speculation: speculation types simulated by the `simulated` executor """
+x86_simulator_l1d_sets: int = 64
+""" x86_simulator_l1d_sets: number of sets in the L1D cache of the `simulated` executor """
+x86_simulator_l1d_ways: int = 8
+""" x86_simulator_l1d_ways: associativity of the L1D cache of the `simulated` executor """
+x86_simulator_noise: int = 0
+""" x86_simulator_noise: probability (in percent) that a measurement of the `simulated`
+executor gets an additional random bit in its hardware trace """
 x86_disable_div64: bool = True
 
 x86_instruction_categories: List[str] = [
@@ -1,31 +1,204 @@
 import subprocess
-import os.path
-import csv
+import os
+import hashlib
 import numpy as np
-from collections import Counter
-from typing import List
+from contextlib import contextmanager
+from typing import List, Union, Dict, Iterator, Optional
 
 from ..interfaces import CombinedHTrace, Input, TestCase, Executor
 from ..config import CONF
-from ..util import Logger
+from ..util import Logger, STAT
 
+SysfsValue = Union[str, int, bytes, np.ndarray]
 
-def write_to_sysfs_file(value, path: str) -> None:
-    subprocess.run(f"sudo bash -c 'echo -n {value} > {path}'", shell=True, check=True)
 
+class SysfsIO:
+    """
+    Direct access to the sysfs interface of the kernel module.
+    The files are opened once and the file descriptors are reused across calls,
+    so that no process has to be spawned for reading or writing an attribute.
+    Some attributes are read-only or write-only, hence the attributes are opened
+    separately for reading and for writing
+    """
+    READ_CHUNK_SIZE = 64 * 1024
 
-def write_to_sysfs_file_bytes(value: bytes, path: str) -> None:
-    with open(path, "wb") as f:
-        f.write(value)
+    def __init__(self, root: str):
+        self.root = root
+        self.read_fds: Dict[str, int] = {}
+        self.write_fds: Dict[str, int] = {}
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        for fd in list(self.read_fds.values()) + list(self.write_fds.values()):
+            os.close(fd)
+        self.read_fds = {}
+        self.write_fds = {}
+
+    def _get_fd(self, name: str, fds: Dict[str, int], flags: int) -> int:
+        fd = fds.get(name)
+        if fd is None:
+            fd = os.open(os.path.join(self.root, name), flags)
+            fds[name] = fd
+        return fd
+
+    def exists(self, name: str) -> bool:
+        return os.path.isfile(os.path.join(self.root, name))
+
+    def write(self, name: str, value: SysfsValue) -> None:
+        """ Write the value to the attribute; strings and ints are written as text """
+        if isinstance(value, (str, int)):
+            value = str(value).encode()
+        fd = self._get_fd(name, self.write_fds, os.O_WRONLY)
+        self._prepare_write(fd)
+
+        # sysfs may consume only a part of the data in one call (e.g., a single page)
+        data = memoryview(value).cast("B")  # type: ignore  # ndarray supports the buffer protocol
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+
+    def read(self, name: str) -> str:
+        """ Read the attribute from the beginning; each read invokes the attribute's `show` """
+        fd = self._get_fd(name, self.read_fds, os.O_RDONLY)
+        os.lseek(fd, 0, os.SEEK_SET)
+        chunks = []
+        while True:
+            chunk = os.read(fd, self.READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b"".join(chunks).decode()
+
+    def _prepare_write(self, fd: int) -> None:
+        os.lseek(fd, 0, os.SEEK_SET)
+
+    @staticmethod
+    @contextmanager
+    def pinned(cpu: int) -> Iterator[None]:
+        """
+        Pin the calling thread to the CPU while in the context.
+        The kernel module runs the measurements on the CPU of the thread that reads the traces
+        """
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, {cpu})
+        try:
+            yield
+        finally:
+            os.sched_setaffinity(0, previous)
+
+
+class DirectorySysfsIO(SysfsIO):
+    """
+    A directory that mimics the sysfs interface of the kernel module (e.g., for testing or
+    benchmarking the executor on machines without the module).
+    Every write replaces the content of the file, and every read returns the content of the file.
+    The only exception is the `inputs` attribute: similar to the kernel module, reading it
+    returns the status of the input loading. The hardware traces are read from the `trace` file
+    """
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        self.inputs_ready = False
+
+    def write(self, name: str, value: SysfsValue) -> None:
+        super().write(name, value)
+        if name == "n_inputs":
+            self.inputs_ready = False
+        elif name == "inputs":
+            self.inputs_ready = True
+
+    def read(self, name: str) -> str:
+        if name == "inputs":
+            return "1\n" if self.inputs_ready else "0\n"
+        return super().read(name)
+
+    def _prepare_write(self, fd: int) -> None:
+        super()._prepare_write(fd)
+        os.ftruncate(fd, 0)
+
+
+def get_sysfs_io(root: str) -> SysfsIO:
+    if os.path.realpath(root).startswith("/sys/"):
+        return SysfsIO(root)
+    return DirectorySysfsIO(root)
+
+
+def merge_inputs(inputs: List[Input]) -> np.ndarray:
+    """
+    Get a contiguous buffer with all inputs.
+    If the inputs are consecutive rows of the same batch (see Input.create_batch),
+    the buffer is a view of the batch and no copy is made
+    """
+    batch = inputs[0].base
+    if isinstance(batch, np.ndarray) and batch.ndim == 2 and batch.flags.c_contiguous \
+       and batch.dtype == np.uint64 and batch.shape[1] == len(inputs[0]):
+        row_size = batch.strides[0]
+        batch_start = batch.__array_interface__['data'][0]
+        first_address = inputs[0].__array_interface__['data'][0]
+        first_row = (first_address - batch_start) // row_size
+        if first_row + len(inputs) <= batch.shape[0] and all(
+                input_.base is batch
+                and input_.__array_interface__['data'][0] == first_address + i * row_size
+                for i, input_ in enumerate(inputs)):
+            return batch[first_row:first_row + len(inputs)]
+    return np.concatenate(inputs)
 
 
 TRACE_NUM_ELEMENTS = 6
 
 
+def merge_htraces(htraces: np.ndarray, threshold_outliers: int) -> np.ndarray:
+    """
+    Merge repeated measurements of hardware traces.
+    :param htraces: array of shape (n_inputs, repetitions)
+    :return: for each input, bitwise OR of the traces that were observed more than
+        threshold_outliers times (i.e., traces that we can conclude are not noise)
+    """
+    n_inputs, repetitions = htraces.shape
+    merged = np.zeros(n_inputs, dtype=np.uint64)
+    if repetitions == 0:
+        return merged
+
+    # sort each row and find runs of equal traces
+    sorted_traces = np.sort(htraces, axis=1).ravel()
+    run_starts = np.ones(sorted_traces.shape, dtype=bool)
+    run_starts[1:] = sorted_traces[1:] != sorted_traces[:-1]
+    run_starts[::repetitions] = True  # runs do not cross rows
+    start_ids = np.flatnonzero(run_starts)
+    run_lengths = np.diff(np.append(start_ids, sorted_traces.size))
+
+    frequent = run_lengths > threshold_outliers
+    np.bitwise_or.at(merged, start_ids[frequent] // repetitions,
+                     sorted_traces[start_ids[frequent]])
+    return merged
+
+
+def scale_threshold(threshold_outliers: int, executed: int, repetitions: int) -> int:
+    """
+    Scale the outlier threshold, defined for all repetitions, to the executed ones.
+    The result is rounded up, so that a positive threshold never drops to zero
+    (otherwise, a trace observed only once would pass the filter)
+    """
+    if threshold_outliers <= 0:
+        return 0
+    return max(1, -(-executed * threshold_outliers // repetitions))
+
+
+def get_content_hash(data: Union[bytes, np.ndarray]) -> bytes:
+    return hashlib.blake2b(memoryview(data).cast("B")).digest()  # type: ignore
+
+
 class X86IntelExecutor(Executor):
     previous_num_inputs: int = 0
     feedback: List[int]
 
+    # hashes of the test case and of the inputs currently loaded into the kernel module;
+    # used to avoid re-uploading the same content
+    loaded_test_case_hash: Optional[bytes] = None
+    loaded_inputs_hash: Optional[bytes] = None
+
     def __init__(self):
         super().__init__()
         self.LOG = Logger()
@@ -49,26 +222,38 @@ class X86IntelExecutor(Executor):
             self.LOG.warning("executor", "SMT is on! You may experience false positives.")
 
         # is kernel module ready?
-        if not os.path.isfile("/sys/x86_executor/trace"):
+        self.sysfs = get_sysfs_io(CONF.x86_executor_sysfs_path)
+        if not self.sysfs.exists("trace"):
             self.LOG.error("x86 executor: kernel module not installed\n\n"
                            "Go to https://microsoft.github.io/sca-fuzzer/quick-start/ for "
                            "installation instructions.")
 
         # initialize the kernel module
-        write_to_sysfs_file(CONF.executor_warmups, '/sys/x86_executor/warmups')
-        write_to_sysfs_file("1" if CONF.x86_executor_enable_ssbp_patch else "0",
-                            "/sys/x86_executor/enable_ssbp_patch")
-        write_to_sysfs_file("1" if CONF.x86_executor_enable_prefetcher else "0",
-                            "/sys/x86_executor/enable_prefetcher")
-        write_to_sysfs_file("1" if CONF.enable_pre_run_flush else "0",
-                            "/sys/x86_executor/enable_pre_run_flush")
-        write_to_sysfs_file(CONF.executor_mode, "/sys/x86_executor/measurement_mode")
+        self.sysfs.write("warmups", CONF.executor_warmups)
+        self.sysfs.write("enable_ssbp_patch", "1" if CONF.x86_executor_enable_ssbp_patch else "0")
+        self.sysfs.write("enable_prefetcher", "1" if CONF.x86_executor_enable_prefetcher else "0")
+        self.sysfs.write("enable_pre_run_flush", "1" if CONF.enable_pre_run_flush else "0")
+        self.sysfs.write("measurement_mode", CONF.executor_mode)
 
     def load_test_case(self, test_case: TestCase):
         masks = f"{test_case.faulty_pte.mask_set} {test_case.faulty_pte.mask_clear}"
-        write_to_sysfs_file(masks, "/sys/x86_executor/faulty_pte_mask")
         with open(test_case.bin_path, "rb") as f:
-            write_to_sysfs_file_bytes(f.read(), "/sys/x86_executor/test_case")
+            binary = f.read()
+
+        test_case_hash = get_content_hash(masks.encode() + b"\0" + binary)
+        if test_case_hash == self.loaded_test_case_hash:
+            STAT.skipped_test_case_uploads += 1
+            return
+
+        self.sysfs.write("faulty_pte_mask", masks)
+        self.sysfs.write("test_case", binary)
+        self.loaded_test_case_hash = test_case_hash
+        # the kernel module discards the inputs when a new test case is loaded
+        self.loaded_inputs_hash = None
+
+    def invalidate_loaded_state(self) -> None:
+        self.loaded_test_case_hash = None
+        self.loaded_inputs_hash = None
 
     def trace_test_case(self, inputs: List[Input], repetitions: int = 0) \
             -> List[CombinedHTrace]:
@@ -82,77 +267,93 @@ class X86IntelExecutor(Executor):
         else:
             threshold_outliers = repetitions // 10
 
-        # convert the inputs into a byte sequence
-        byte_inputs = [i.tobytes() for i in inputs]
-        byte_inputs_merged = bytes().join(byte_inputs)
-
-        # protocol of loading inputs (must be in this order):
-        # 1) Announce the number of inputs
-        write_to_sysfs_file(str(len(inputs)), "/sys/x86_executor/n_inputs")
-        # 2) Load the inputs
-        write_to_sysfs_file_bytes(byte_inputs_merged, "/sys/x86_executor/inputs")
-        # 3) Check that the load was successful
-        with open('/sys/x86_executor/inputs', 'r') as f:
-            if f.readline() != '1\n':
+        # merge the inputs into a single byte sequence
+        byte_inputs_merged = merge_inputs(inputs)
+
+        # skip the upload if the kernel module already has the same inputs
+        inputs_hash = get_content_hash(byte_inputs_merged)
+        if inputs_hash == self.loaded_inputs_hash:
+            STAT.skipped_input_uploads += 1
+        else:
+            # protocol of loading inputs (must be in this order):
+            # 1) Announce the number of inputs
+            self.sysfs.write("n_inputs", len(inputs))
+            # 2) Load the inputs
+            self.sysfs.write("inputs", byte_inputs_merged)
+            # 3) Check that the load was successful
+            if self.sysfs.read("inputs") != '1\n':
                 self.LOG.error("Failure loading inputs!", print_tb=True)
+            self.loaded_inputs_hash = inputs_hash
+
+        # in the adaptive mode, the measurements are collected in chunks, until a chunk
+        # does not change the merged traces; otherwise, all repetitions form a single chunk.
+        # The outlier threshold is defined for all repetitions, hence it is scaled down
+        # to the number of repetitions executed so far (see scale_threshold)
+        adaptive = CONF.executor_adaptive_repetitions and repetitions > 1
+        chunk_size = max(CONF.executor_adaptive_confidence, 1) if adaptive else repetitions
 
         # run experiments and load the results
         all_results: np.ndarray = np.ndarray(
             shape=(len(inputs), repetitions, TRACE_NUM_ELEMENTS), dtype=np.uint64)
-        for rep in range(repetitions):
-            # executor prints results in reverse, so we begin from the end
-            input_id = len(inputs) - 1
-            reading_finished = False
-
-            # executor prints results in batches, hence we have to call it several times,
-            # until we find the `done` keyword in the output
-            while not reading_finished:
-                output = subprocess.check_output(
-                    f"taskset -c {CONF.executor_taskset} cat /sys/x86_executor/trace", shell=True)
-                reader = csv.reader(output.decode().split("\n"))
-                for row in reader:
-                    if not row:
-                        continue
-                    if 'done' in row:
-                        reading_finished = True
+        executed_repetitions = 0
+        previous_traces = None
+        with self.sysfs.pinned(CONF.executor_taskset):
+            while executed_repetitions < repetitions:
+                chunk_end = min(executed_repetitions + chunk_size, repetitions)
+                for rep in range(executed_repetitions, chunk_end):
+                    # executor prints results in reverse, so we flip them
+                    all_results[:, rep, :] = self._read_measurements(len(inputs))[::-1]
+                executed_repetitions = chunk_end
+
+                if adaptive:
+                    traces = merge_htraces(
+                        all_results[:, :executed_repetitions, 0],
+                        scale_threshold(threshold_outliers, executed_repetitions, repetitions))
+                    if previous_traces is not None and np.array_equal(traces, previous_traces):
                         break
+                    previous_traces = traces
 
-                    for i in range(TRACE_NUM_ELEMENTS):
-                        all_results[input_id][rep][i] = int(row[i])
-                    input_id -= 1
+        all_results = all_results[:, :executed_repetitions, :]
+        threshold_outliers = scale_threshold(threshold_outliers, executed_repetitions, repetitions)
+        STAT.measurements += 1
+        STAT.measurement_repetitions += executed_repetitions
 
         # simple case - no merging required
         if repetitions == 1:
-            self.feedback = [r[0][1:] for r in all_results]
-            return [int(r[0][0]) for r in all_results]
-
-        traces = [0 for _ in inputs]
-        pfc_readings: np.ndarray = np.zeros(shape=(len(inputs), 3), dtype=int)
-
-        # merge the results of repeated measurements
-        for input_id, input_results in enumerate(all_results):
-            # find the max value of each perf counter for each input
-            for pfc_id in range(0, 3):
-                pfc_readings[input_id][pfc_id] = max([res[pfc_id + 1] for res in input_results])
-
-            # remove outliers and merge hardware traces
-            counter: Counter = Counter()
-            for result in input_results:
-                trace = int(result[0])
-                counter[trace] += 1
-                if counter[trace] == threshold_outliers + 1:
-                    # merge the trace if we observed it sufficiently many time
-                    # (i.e., if we can conclude it's not noise)
-                    traces[input_id] |= trace
-        self.feedback = pfc_readings.tolist()
-
-        return traces
+            self.feedback = list(all_results[:, 0, 1:])
+            return all_results[:, 0, 0].tolist()
+
+        # find the max value of each perf counter for each input
+        self.feedback = all_results[:, :, 1:4].max(axis=1).astype(int).tolist()
+
+        # remove outliers and merge hardware traces
+        return merge_htraces(all_results[:, :, 0], threshold_outliers).tolist()
+
+    def _read_measurements(self, n_inputs: int) -> np.ndarray:
+        """
+        Read the results of one measurement from the kernel module.
+        :return: array of shape (n_inputs, TRACE_NUM_ELEMENTS), in the order of printing
+        """
+        # executor prints results in batches, hence we have to call it several times,
+        # until we find the `done` keyword in the output
+        batches = []
+        while True:
+            output = self.sysfs.read("trace")
+            done_position = output.find("done")
+            if done_position >= 0:
+                batches.append(output[:done_position])
+                break
+            batches.append(output)
+
+        lines = "".join(batches).split()
+        if len(lines) != n_inputs:
+            self.LOG.error(f"x86 executor: expected {n_inputs} measurements,"
+                           f" but received {len(lines)}")
+        return np.loadtxt(lines, delimiter=",", dtype=np.uint64, ndmin=2)
 
     def read_base_addresses(self):
-        with open('/sys/x86_executor/print_sandbox_base', 'r') as f:
-            sandbox_base = f.readline()
-        with open('/sys/x86_executor/print_code_base', 'r') as f:
-            code_base = f.readline()
+        sandbox_base = self.sysfs.read("print_sandbox_base")
+        code_base = self.sysfs.read("print_code_base")
         return int(sandbox_base, 16), int(code_base, 16)
 
     def get_last_feedback(self) -> List:
@@ -4,14 +4,18 @@ File: x86 implementation of the test case generator
 Copyright (C) Microsoft Corporation
 SPDX-License-Identifier: MIT
 """
+import os
+import copy
+import tempfile
 from subprocess import run
-from typing import List
+from typing import List, Optional, Tuple, Dict
 
 from ..fuzzer import Fuzzer, ArchitecturalFuzzer
-from ..interfaces import TestCase, Input, InstructionSetAbstract
+from ..interfaces import TestCase, Input, InstructionSetAbstract, Function, BasicBlock
 from ..util import STAT
 from ..config import CONF
 from .x86_executor import X86IntelExecutor
+from .x86_generator import X86Generator, X86LFENCEPass
 
 
 def update_instruction_list():
@@ -64,8 +68,52 @@ def check_instruction_list(instruction_set: InstructionSetAbstract):
         assert "INT3" in all_instruction_names
 
 
+def copy_test_case_code(test_case: TestCase) -> TestCase:
+    """
+    Create a copy of the functions and basic blocks of a test case, so that it can
+    be modified by a pass without affecting the original.
+    The instructions are copied shallowly, and the copy does not have a binary
+    """
+    copied = TestCase(test_case.seed)
+    copied.faulty_pte = test_case.faulty_pte
+    bb_map: Dict[BasicBlock, BasicBlock] = {}
+    for func in test_case.functions:
+        new_func = Function(func.name)
+        new_bbs = []
+        for bb in func:
+            if bb == func.entry:
+                new_bb = new_func.entry
+            elif bb == func.exit:
+                new_bb = new_func.exit
+            else:
+                new_bb = BasicBlock(bb.name)
+                new_bbs.append(new_bb)
+            bb_map[bb] = new_bb
+            for instr in bb:
+                new_instr = copy.copy(instr)
+                new_instr.next = None
+                new_instr.previous = None
+                new_bb.insert_after(new_bb.end, new_instr)
+            new_bb.terminators = list(bb.terminators)
+        new_func.insert_multiple(new_bbs)
+
+        copied.functions.append(new_func)
+        if func == test_case.main:
+            copied.main = new_func
+
+    # connect the copied basic blocks (successors may be in other functions, e.g., calls)
+    for bb, new_bb in bb_map.items():
+        new_bb.successors = [bb_map.get(successor, successor) for successor in bb.successors]
+    return copied
+
+
 class X86Fuzzer(Fuzzer):
     executor: X86IntelExecutor
+    generator: X86Generator
+
+    # the last fenced test case, stored together with its original
+    fenced_test_case: Optional[Tuple[TestCase, TestCase]] = None
+    fenced_dir: Optional[tempfile.TemporaryDirectory] = None
 
     def _adjust_config(self, existing_test_case):
         super()._adjust_config(existing_test_case)
@@ -77,7 +125,13 @@ class X86Fuzzer(Fuzzer):
               timeout: int,
               nonstop: bool = False) -> bool:
         check_instruction_list(self.instruction_set)
-        return super().start(num_test_cases, num_inputs, timeout, nonstop)
+        try:
+            return super().start(num_test_cases, num_inputs, timeout, nonstop)
+        finally:
+            if self.fenced_dir:
+                self.fenced_dir.cleanup()
+                self.fenced_dir = None
+                self.fenced_test_case = None
 
     def filter(self, test_case: TestCase, inputs: List[Input]) -> bool:
         """ This function implements a multi-stage algorithm that gradually filters out
@@ -103,11 +157,9 @@ class X86Fuzzer(Fuzzer):
         # Check if any of the htraces contain a speculative cache eviction
         # for this create a fenced version of the test case and collect traces for it
         if CONF.enable_observation_filter:
-            run('awk \'//{print $0, "\\nlfence"}\' ' + test_case.asm_path + '> fenced.asm',
-                shell=True)
-            self.generator.assemble('fenced.asm', 'fenced.o')
-            fenced_test_case = TestCase(0)
-            fenced_test_case.bin_path = 'fenced.o'
+            # the generator is shared with the pipeline thread, if any
+            with self.model_access(None):
+                fenced_test_case = self.get_fenced_test_case(test_case)
             self.executor.load_test_case(fenced_test_case)
             fenced_htraces = self.executor.trace_test_case(inputs, repetitions=1)
 
@@ -118,6 +170,44 @@ class X86Fuzzer(Fuzzer):
 
         return False
 
+    def get_fenced_test_case(self, test_case: TestCase) -> TestCase:
+        """
+        Create a variant of the test case with an LFENCE after every instruction.
+        The fenced variant is built on the IR of the test case and assembled into
+        a private temporary directory, so that parallel fuzzers do not overwrite
+        each other's files. The result is reused while the test case is the same
+        """
+        if self.fenced_test_case and self.fenced_test_case[0] is test_case:
+            return self.fenced_test_case[1]
+
+        if not self.fenced_dir:
+            self.fenced_dir = tempfile.TemporaryDirectory(prefix="revizor_fenced_")
+        asm_path = os.path.join(self.fenced_dir.name, "fenced.asm")
+
+        fenced_test_case = copy_test_case_code(test_case)
+        opcodes = any(instr.name == "OPCODE" for func in test_case for bb in func for instr in bb)
+        if opcodes:
+            # raw opcodes are not represented in the IR; fence the assembly text instead
+            with open(test_case.asm_path, "r") as f:
+                lines = f.readlines()
+            with open(asm_path, "w") as f:
+                for line in lines:
+                    f.write(line.rstrip("\n") + "\nlfence\n")
+        else:
+            X86LFENCEPass().run_on_test_case(fenced_test_case)
+            self.generator.printer.print(fenced_test_case, asm_path)
+
+        fenced_test_case.asm_path = asm_path
+        fenced_test_case.bin_path = os.path.join(self.fenced_dir.name, "fenced.o")
+        address_list = self.generator.assemble(asm_path, fenced_test_case.bin_path)
+        if not opcodes:
+            # map the instructions, as software executors run the test case on a model
+            self.generator.map_addresses(fenced_test_case, address_list)
+            self.generator.analyse_instructions(fenced_test_case)
+
+        self.fenced_test_case = (test_case, fenced_test_case)
+        return fenced_test_case
+
 
 class X86ArchitecturalFuzzer(ArchitecturalFuzzer):
 
@@ -9,8 +9,8 @@ import math
 import re
 import random
 import copy
-from typing import List, Dict, Set, Optional, Tuple
 from subprocess import run
+from typing import List, Dict, Set, Optional, Tuple
 
 from ..isa_loader import InstructionSet
 from ..interfaces import TestCase, Operand, RegisterOperand, FlagsOperand, MemoryOperand, \
@@ -108,15 +108,18 @@ class X86Generator(ConfigurableGenerator, abc.ABC):
         if 'PF-smap' in CONF.permitted_faults:
             self.pte_bit_choices.append(self.target_desc.pte_bits["USER"])
 
-    def map_addresses(self, test_case: TestCase, bin_file: str) -> None:
-        # get a list of relative instruction addresses
-        dump = run(
-            f"objdump --no-show-raw-insn -D -M intel -b binary -m i386:x86-64 {bin_file} "
-            "| awk '/ [0-9a-f]+:/{print $1}'",
-            shell=True,
-            check=True,
-            capture_output=True)
-        address_list = [int(addr[:-1], 16) for addr in dump.stdout.decode().split("\n") if addr]
+    def map_addresses(self, test_case: TestCase, address_list: Optional[List[int]]) -> None:
+        if address_list is None:
+            # get a list of relative instruction addresses
+            dump = run(
+                f"objdump --no-show-raw-insn -D -M intel -b binary -m i386:x86-64 "
+                f"{test_case.bin_path} | awk '/ [0-9a-f]+:/{{print $1}}'",
+                shell=True,
+                check=True,
+                capture_output=True)
+            address_list = [
+                int(addr[:-1], 16) for addr in dump.stdout.decode().split("\n") if addr
+            ]
 
         # connect them with instructions in the test case
         address_map: Dict[int, Instruction] = {}
@@ -280,6 +283,10 @@ class X86Generator(ConfigurableGenerator, abc.ABC):
 
 
 class X86LFENCEPass(Pass):
+    """
+    Place an LFENCE at the beginning of every basic block and after every instruction,
+    including the terminators, thus preventing any speculation within the test case
+    """
 
     def run_on_test_case(self, test_case: TestCase) -> None:
         for func in test_case.functions:
@@ -291,6 +298,12 @@ class X86LFENCEPass(Pass):
 
                 for instr in insertion_points:
                     bb.insert_after(instr, Instruction("LFENCE", True))
+                bb.insert_before(bb.start, Instruction("LFENCE", True))
+
+                terminators = []
+                for instr in bb.terminators:
+                    terminators.extend([instr, Instruction("LFENCE", True)])
+                bb.terminators = terminators
 
 
 class X86NonCanonicalAddressPass(Pass):
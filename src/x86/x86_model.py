@@ -6,14 +6,15 @@ SPDX-License-Identifier: MIT
 """
 import re
 import numpy as np
-from typing import Tuple, Dict, List, Set
+from typing import Tuple, Dict, List, Set, NamedTuple, Callable
 import copy
 
 import unicorn.x86_const as ucc  # type: ignore
 from unicorn import Uc, UC_MEM_WRITE, UC_ARCH_X86, UC_MODE_64, UC_PROT_READ, UC_PROT_NONE
 
 from ..interfaces import Input, FlagsOperand, RegisterOperand, MemoryOperand, TestCase
-from ..model import UnicornModel, UnicornSpec, UnicornSeq, UnicornBpas, BaseTaintTracker
+from ..model import UnicornModel, UnicornSpec, UnicornSeq, UnicornBpas, BaseTaintTracker, \
+    BitsetTaintTracker
 from ..util import UnreachableCode
 from .x86_target_desc import X86UnicornTargetDesc, X86TargetDesc
 
@@ -25,6 +26,18 @@ FLAGS_SF = 0b000010000000
 FLAGS_OF = 0b100000000000
 
 
+class CondBranch(NamedTuple):
+    """ A conditional branch of the loaded test case (see X86UnicornCond.get_branch_table) """
+    code: bytes
+    calculate: Callable
+    """ the entry of X86UnicornCond.jumps that evaluates the branch condition """
+    target: int
+    """ address of the branch target """
+    fallthrough: int
+    """ address of the next instruction """
+    is_loop: bool
+
+
 class X86UnicornModel(UnicornModel):
     """
     Base class that serves as main interface.
@@ -58,28 +71,26 @@ class X86UnicornModel(UnicornModel):
         Set registers and stack before starting the emulation
         """
         # Set memory:
-        # - initialize overflows with zeroes
-        self.emulator.mem_write(self.lower_overflow_base, self.overflow_region_values)
-        self.emulator.mem_write(self.upper_overflow_base, self.overflow_region_values)
-
-        # - sandbox pages
-        self.emulator.mem_write(self.sandbox_base, input_.get_memory().tobytes())
+        # - overflows are initialized with zeroes
+        # - sandbox pages are initialized with the input
+        # - executor uses the lower bytes of the upper_overflow_region to initialize registers
+        #   we need to match it in the model
+        image = np.zeros(self.SANDBOX_SIZE // 8, dtype=np.uint64)
+        memory = input_.get_memory()
+        sandbox_start = self.OVERFLOW_REGION_SIZE // 8
+        image[sandbox_start:sandbox_start + len(memory)] = memory
+        reg_init_start = (self.upper_overflow_base - self.lower_overflow_base) // 8
 
         # Set values in registers
         regs = self.target_desc.registers
         flags = self.target_desc.flags_register
-        reg_init_address = self.sandbox_base + self.MAIN_REGION_SIZE + self.FAULTY_REGION_SIZE
         for i, value in enumerate(input_.get_registers()):
             if regs[i] == flags:
                 value = (value & np.uint64(2263)) | np.uint64(2)  # type: ignore
             self.emulator.reg_write(regs[i], value)
-
-            # executor uses the lower bytes of the upper_overflow_region to initialize registers
-            # we need to match it in the model
-            self.emulator.mem_write(reg_init_address, value.tobytes())
-            reg_init_address += 8
-        self.emulator.mem_write(reg_init_address,
-                                self.stack_base.to_bytes(8, byteorder='little', signed=False))
+            image[reg_init_start + i] = value
+        image[reg_init_start + len(regs)] = self.stack_base
+        self._reset_sandbox(image)
 
         if self.rw_protect:
             self.emulator.mem_protect(self.sandbox_base + self.MAIN_REGION_SIZE,
@@ -144,6 +155,7 @@ class X86UnicornCond(X86UnicornSpec):
     Contract for conditional branch mispredicitons.
     Forces all cond. branches to speculatively go into a wrong target
     """
+    branch_table: Dict[int, CondBranch]
 
     jumps = {
         # c - the byte code of the instruction
@@ -195,43 +207,68 @@ class X86UnicornCond(X86UnicornSpec):
         (c[2:], f & FLAGS_ZF == 0 and (f & FLAGS_SF == 0) == (f & FLAGS_OF == 0), False),
     }  # yapf: disable
 
+    def load_test_case(self, test_case: TestCase) -> None:
+        super().load_test_case(test_case)
+        self.branch_table = X86UnicornCond.get_branch_table(self)
+
     @staticmethod
-    def speculate_instruction(emulator: Uc, address, size, model: UnicornModel) -> None:
-        # reached max spec. window? skip
-        if len(model.checkpoints) >= model.nesting:
+    def get_branch_table(model: UnicornModel) -> Dict[int, CondBranch]:
+        """
+        Decode all conditional branches of the loaded test case, so that the instructions
+        do not have to be decoded during the execution.
+        Returns a map from the address of a branch to its description
+        """
+        code = bytes(model.emulator.mem_read(model.code_start, model.code_end - model.code_start))
+        offsets = sorted(model.test_case.address_map)
+        branch_table: Dict[int, CondBranch] = {}
+        for offset, next_offset in zip(offsets, offsets[1:] + [len(code)]):
+            instruction_code = code[offset:next_offset]
+            if not instruction_code or instruction_code[0] not in X86UnicornCond.jumps:
+                continue
+
+            # the target does not depend on the flags and on RCX
+            target, _, is_loop = X86UnicornCond.decode(instruction_code, 0, 0)
+            if not target:
+                continue
+
+            address = model.code_start + offset
+            fallthrough = address + len(instruction_code)
+            branch_table[address] = CondBranch(instruction_code,
+                                               X86UnicornCond.jumps[instruction_code[0]],
+                                               fallthrough + target, fallthrough, is_loop)
+        return branch_table
+
+    @staticmethod
+    def speculate_instruction(emulator: Uc, address, size, model) -> None:
+        # not a a cond. jump? ignore
+        branch = model.branch_table.get(address)
+        if branch is None:
             return
 
-        # if the instruction is undefined, Unicorn will return a huge value as size
-        # skip those
-        if size > 15:  # 15 bytes is max instr size on Intel
+        # reached max spec. window? skip
+        if len(model.checkpoints) >= model.nesting:
+            model.nesting_limit_reached = True
             return
 
-        # decode the instruction
-        code = emulator.mem_read(address, size)
         flags = emulator.reg_read(ucc.UC_X86_REG_EFLAGS)
         rcx = emulator.reg_read(ucc.UC_X86_REG_RCX)
-        target, will_jump, is_loop = X86UnicornCond.decode(code, flags, rcx)
-
-        # not a a cond. jump? ignore
-        if not target:
-            return
+        _, will_jump, _ = branch.calculate(branch.code, flags, rcx)
 
         # LOOP instructions must also decrement RCX
-        if is_loop:
+        if branch.is_loop:
             emulator.reg_write(ucc.UC_X86_REG_RCX, rcx - 1)
 
         # Take a checkpoint
-        next_instr = address + size + target if will_jump else address + size
-        model.checkpoint(emulator, next_instr)
+        model.checkpoint(emulator, branch.target if will_jump else branch.fallthrough)
 
         # Simulate misprediction
         if will_jump:
-            emulator.reg_write(ucc.UC_X86_REG_RIP, address + size)
+            emulator.reg_write(ucc.UC_X86_REG_RIP, branch.fallthrough)
         else:
-            emulator.reg_write(ucc.UC_X86_REG_RIP, address + size + target)
+            emulator.reg_write(ucc.UC_X86_REG_RIP, branch.target)
 
     @staticmethod
-    def decode(code: bytearray, flags: int, rcx: int) -> Tuple[int, bool, bool]:
+    def decode(code: bytes, flags: int, rcx: int) -> Tuple[int, bool, bool]:
         """
         Decodes the instruction encoded in `code` and, if it's a conditional jump,
         returns its expected target, whether it will jump to the target (based
@@ -254,6 +291,11 @@ class X86UnicornBpas(UnicornBpas, X86UnicornModel):
 
 
 class X86UnicornCondBpas(X86UnicornSpec):
+    branch_table: Dict[int, CondBranch]
+
+    def load_test_case(self, test_case: TestCase) -> None:
+        super().load_test_case(test_case)
+        self.branch_table = X86UnicornCond.get_branch_table(self)
 
     @staticmethod
     def speculate_mem_access(emulator, access, address, size, value, model):
@@ -281,6 +323,7 @@ class X86FaultModelAbstract(X86UnicornSpec):
 
         # reached max spec. window? skip
         if len(self.checkpoints) >= self.nesting:
+            self.nesting_limit_reached = True
             return False
         return True
 
@@ -800,3 +843,10 @@ class X86TaintTracker(BaseTaintTracker):
         # ISA-specific field setup
         self.target_desc = X86TargetDesc()
         self.unicorn_target_desc = X86UnicornTargetDesc()
+
+
+class X86BitsetTaintTracker(BitsetTaintTracker):
+    # ISA-specific fields
+    _registers = X86TaintTracker._registers
+    target_desc = X86TargetDesc()
+    unicorn_target_desc = X86UnicornTargetDesc()
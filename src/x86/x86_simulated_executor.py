@@ -0,0 +1,197 @@
+"""
+File: x86 executor that measures hardware traces on a software model of the CPU
+      (useful for testing and benchmarking the fuzzer on machines without the kernel module)
+
+Copyright (C) Microsoft Corporation
+SPDX-License-Identifier: MIT
+"""
+import random
+from typing import List, Tuple, Dict, Type
+
+import numpy as np
+
+from ..interfaces import CombinedHTrace, CTrace, Input, TestCase, Executor
+from ..model import UnicornTracer
+from ..config import CONF
+from ..util import Logger, STAT
+from .x86_model import X86UnicornModel, X86UnicornSeq, X86UnicornCond, X86UnicornBpas, \
+    X86UnicornCondBpas
+from .x86_executor import merge_htraces
+
+SIMULATED_SPECULATION: Dict[str, Type[X86UnicornModel]] = {
+    "seq": X86UnicornSeq,
+    "cond": X86UnicornCond,
+    "bpas": X86UnicornBpas,
+    "cond-bpas": X86UnicornCondBpas,
+}
+
+PRIME_AND_PROBE_MODES = ["P+P", "PP+P"]
+RELOAD_MODES = ["F+R", "E+R"]
+
+MASK_32 = pow(2, 32) - 1
+MASK_64 = pow(2, 64) - 1
+
+
+class L1DCacheSimulator:
+    """
+    A set-associative L1D cache with LRU replacement.
+    Produces hardware traces in the same format as the x86 executor:
+    bit (63 - i) of a trace corresponds to the cache set i (Prime+Probe)
+    or to the cache line i of the main sandbox region (Flush+Reload)
+    """
+    LINE_SIZE = 64
+
+    def __init__(self, num_sets: int, num_ways: int):
+        self.num_sets = num_sets
+        self.num_ways = num_ways
+
+    def measure(self, accesses: List[Tuple[int, int]], sandbox_base: int, mode: str) -> int:
+        """
+        Replay the memory accesses (address, size) on the cache and probe it
+        """
+        sets: List[List[int]] = [[] for _ in range(self.num_sets)]
+        prime_and_probe = mode in PRIME_AND_PROBE_MODES
+        if prime_and_probe:
+            # fill every set with attacker lines; they are marked with negative numbers
+            for set_id, ways in enumerate(sets):
+                ways.extend(-(set_id + 1 + way * self.num_sets) for way in range(self.num_ways))
+
+        for address, size in accesses:
+            first_line = address // self.LINE_SIZE
+            last_line = (address + max(size, 1) - 1) // self.LINE_SIZE
+            for line in range(first_line, last_line + 1):
+                self._access(sets[line % self.num_sets], line)
+
+        htrace = 0
+        if prime_and_probe:
+            # a set is reported if at least one of the attacker lines was evicted
+            for set_id, ways in enumerate(sets):
+                if sum(1 for line in ways if line < 0) < self.num_ways:
+                    htrace |= 1 << (63 - set_id % 64)
+        else:
+            # the lines of the main region are reported if they are cached
+            first_line = sandbox_base // self.LINE_SIZE
+            for i in range(64):
+                line = first_line + i
+                if line in sets[line % self.num_sets]:
+                    htrace |= 1 << (63 - i)
+        return htrace
+
+    def _access(self, ways: List[int], line: int) -> None:
+        if line in ways:
+            ways.remove(line)
+        elif len(ways) >= self.num_ways:
+            ways.pop(0)
+        ways.append(line)
+
+
+class SimulatedMeasurementTracer(UnicornTracer):
+    """
+    Collects all memory accesses, including the speculative ones, and measures them
+    on the cache simulator at the end of the execution.
+    Instead of a contract trace, the tracer returns a packed measurement:
+    the hardware trace (bits 0-63), the number of executed instructions (bits 64-95),
+    and the number of retired instructions (bits 96-127)
+    """
+    accesses: List[Tuple[int, int]]
+    executed: int
+    retired: int
+
+    def __init__(self, cache: L1DCacheSimulator, mode: str):
+        super().__init__()
+        self.cache = cache
+        self.mode = mode
+
+    def init_trace(self, emulator, target_desc, model) -> None:
+        super().init_trace(emulator, target_desc, model)
+        self.accesses = []
+        self.executed = 0
+        self.retired = 0
+
+    def observe_mem_access(self, access, address: int, size: int, value: int, model) -> None:
+        self.accesses.append((address, size))
+        super().observe_mem_access(access, address, size, value, model)
+
+    def observe_instruction(self, address: int, size: int, model) -> None:
+        self.executed += 1
+        if not model.in_speculation:
+            self.retired += 1
+        super().observe_instruction(address, size, model)
+
+    def get_contract_trace(self, model) -> CTrace:
+        htrace = self.cache.measure(self.accesses, model.sandbox_base, self.mode)
+        return htrace | (min(self.executed, MASK_32) << 64) | (min(self.retired, MASK_32) << 96)
+
+
+class X86SimulatedExecutor(Executor):
+    """
+    Executor that runs test cases on a speculative model of the CPU (Unicorn-based,
+    see CONF.x86_simulator_speculation) and measures the cache footprint of the execution
+    on an L1D simulator. Optionally, the measurements are perturbed by random noise.
+    The perf. counter feedback contains the number of executed and retired instructions
+    """
+    SANDBOX_BASE = 0x1000000
+    CODE_BASE = 0x8000
+
+    feedback: List[List[int]]
+
+    def __init__(self):
+        super().__init__()
+        self.LOG = Logger()
+        self.feedback = []
+
+        mode = CONF.executor_mode
+        if mode not in PRIME_AND_PROBE_MODES + RELOAD_MODES:
+            self.LOG.error(f"simulated executor: mode {mode} is not supported")
+
+        model_cls = SIMULATED_SPECULATION.get(CONF.x86_simulator_speculation, None)
+        if not model_cls:
+            self.LOG.error(f"simulated executor: unknown value {CONF.x86_simulator_speculation}"
+                           " of `x86_simulator_speculation` configuration option")
+        self.model = model_cls(self.SANDBOX_BASE, self.CODE_BASE)
+        cache = L1DCacheSimulator(CONF.x86_simulator_l1d_sets, CONF.x86_simulator_l1d_ways)
+        self.model.tracer = SimulatedMeasurementTracer(cache, mode)
+
+        self.noise = CONF.x86_simulator_noise / 100
+        # derived from the global seed to keep the fuzzing campaigns reproducible
+        self.rng = np.random.default_rng(random.getrandbits(64))
+
+    def load_test_case(self, test_case: TestCase):
+        self.model.load_test_case(test_case)
+
+    def trace_test_case(self, inputs: List[Input], repetitions: int = 0) \
+            -> List[CombinedHTrace]:
+        if not inputs:
+            return []
+
+        if repetitions == 0:
+            repetitions = CONF.executor_repetitions
+            threshold_outliers = CONF.executor_max_outliers
+        else:
+            threshold_outliers = repetitions // 10
+
+        # the simulation is deterministic, hence it is sufficient to run it once per input;
+        # the repetitions differ only in noise
+        measurements = self.model.trace_test_case(inputs, CONF.model_max_nesting)
+        htraces = np.array([m & MASK_64 for m in measurements], dtype=np.uint64)
+        self.feedback = [[(m >> 64) & MASK_32, (m >> 96) & MASK_32, 0] for m in measurements]
+
+        all_htraces = np.repeat(htraces[:, np.newaxis], repetitions, axis=1)
+        if self.noise > 0:
+            noisy = self.rng.random(all_htraces.shape) < self.noise
+            noise_bits = np.left_shift(np.uint64(1),
+                                       self.rng.integers(0, 64, all_htraces.shape, dtype=np.uint64))
+            all_htraces |= np.where(noisy, noise_bits, np.uint64(0))
+
+        STAT.measurements += 1
+        STAT.measurement_repetitions += repetitions
+
+        if repetitions == 1:
+            return all_htraces[:, 0].tolist()
+        return merge_htraces(all_htraces, threshold_outliers).tolist()
+
+    def read_base_addresses(self) -> Tuple[int, int]:
+        return self.SANDBOX_BASE, self.CODE_BASE
+
+    def get_last_feedback(self) -> List:
+        return self.feedback
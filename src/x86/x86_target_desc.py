@@ -86,6 +86,13 @@ class X86TargetDesc(TargetDesc):
         "NX": (63, False),  # No execute: only valid after cpuid check
     }
 
+    fault_free_categories = [
+        "BASE-BINARY", "BASE-LOGICAL", "BASE-ROTATE", "BASE-SHIFT", "BASE-BITBYTE",
+        "BASE-DATAXFER", "BASE-CMOV", "BASE-SETCC", "BASE-COND_BR", "BASE-FLAGOP",
+        "BASE-CONVERT", "BASE-NOP", "BASE-WIDENOP", "BASE-SEMAPHORE"
+    ]
+    faulting_instructions = ["DIV", "IDIV", "CLI", "STI", "LOCK"]
+
     def __init__(self):
         super().__init__()
         # remove blocked registers